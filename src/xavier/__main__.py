@@ -41,14 +41,11 @@ import sys, os, subprocess, re, json, textwrap
 
 # 3rd party imports from pypi
 import argparse  # potential python3 3rd party package, added in python/3.5
-from ccbr_tools.pipeline.util import err, exists, fatal, permissions, require
-from ccbr_tools.pipeline.cache import check_cache
 
 # Local imports
-from .run import init, setup, bind, dryrun, runner, run
-from .shells import bash
-from .options import genome_options
-from .gui import launch_gui
+# ccbr_tools, snakemake, and PySimpleGUI are imported
+# by each sub-command's handler when it is called, so
+# --help, --version, and unlock do not pay their cost
 from .util import xavier_base, get_version
 
 __version__ = get_version()
@@ -56,6 +53,51 @@ __email__ = "ccbr@mail.nih.gov"
 __home__ = os.path.dirname(os.path.abspath(__file__))
 
 
+def permissions(parser, path, *args, **kwargs):
+    """Lazily imports ccbr_tools to check the permissions of a path,
+    see ccbr_tools.pipeline.util.permissions().
+    """
+    from ccbr_tools.pipeline.util import permissions
+
+    return permissions(parser, path, *args, **kwargs)
+
+
+def check_cache(parser, cache, *args, **kwargs):
+    """Lazily imports ccbr_tools to check the singularity cache,
+    see ccbr_tools.pipeline.cache.check_cache().
+    """
+    from ccbr_tools.pipeline.cache import check_cache
+
+    return check_cache(parser, cache, *args, **kwargs)
+
+
+def genome_options(parser, user_option, prebuilt):
+    """Lazily imports and checks the --genome option, see options.genome_options()."""
+    from .options import genome_options
+
+    return genome_options(parser, user_option, prebuilt)
+
+
+def run(sub_args):
+    """Initialize, setup, and run the XAVIER pipeline, see run.run().
+    @param sub_args <parser.parse_args() object>:
+        Parsed arguments for run sub-command
+    """
+    from .run import run
+
+    run(sub_args)
+
+
+def gui(sub_args):
+    """Launches the XAVIER Graphical User Interface, see gui.launch_gui().
+    @param sub_args <parser.parse_args() object>:
+        Parsed arguments for gui sub-command
+    """
+    from .gui import launch_gui
+
+    launch_gui(sub_args)
+
+
 def unlock(sub_args):
     """Unlocks a previous runs output directory. If snakemake fails ungracefully,
     it maybe required to unlock the working directory before proceeding again.
@@ -81,6 +123,21 @@ def unlock(sub_args):
     print("Successfully unlocked the pipeline's working directory!")
 
 
+def stats(sub_args):
+    """Collects the cluster stats of the jobs of a previous run, see stats.stats().
+    @param sub_args <parser.parse_args() object>:
+        Parsed arguments for stats sub-command
+    """
+    from .stats import stats
+
+    stats(
+        sub_args.output,
+        logfile=sub_args.log,
+        path=sub_args.stats,
+        batch_size=sub_args.batch_size,
+    )
+
+
 def cache(sub_args):
     """Caches remote resources or reference files stored on DockerHub and S3.
     Local SIFs will be created from images defined in 'config/containers/images.json'.
@@ -88,6 +145,9 @@ def cache(sub_args):
     @param sub_args <parser.parse_args() object>:
         Parsed arguments for unlock sub-command
     """
+    from ccbr_tools.pipeline.util import exists
+    from .cache import verify_cache, pull_images
+
     print(sub_args)
 
     sif_cache = sub_args.sif_cache
@@ -113,44 +173,58 @@ def cache(sub_args):
     with open(images, "r") as fh:
         data = json.load(fh)
 
-    pull = []
-    for image, uri in data["images"].items():
-        sif = os.path.join(
-            sif_cache, "{}.sif".format(os.path.basename(uri).replace(":", "_"))
-        )
-        if not exists(sif):
-            # If local sif does not exist on in cache, print warning
-            # and default to pulling from URI in config/containers/images.json
-            print('Image will be pulled from "{}".'.format(uri), file=sys.stderr)
-            pull.append(uri)
+    # One read of the cache's manifest plus one
+    # listing of the cache directory, see verify_cache()
+    _, pull = verify_cache(sif_cache, data["images"].values(), listing=True)
+    for uri in pull:
+        # If local sif does not exist on in cache, print warning
+        # and default to pulling from URI in config/containers/images.json
+        print('Image will be pulled from "{}".'.format(uri), file=sys.stderr)
 
     if not pull:
         # Nothing to do!
         print("Singularity image cache is already up to update!")
-    else:
-        # There are image(s) that need to be pulled
-        if not sub_args.dry_run:
-            # submission_script for XAVIER cache is /path/to/output/resources/cacher
-            # Quote user provided values to avoid shell injections
-            masterjob = subprocess.Popen(
-                "sbatch --parsable -J pl:cache --gres=lscratch:200  --time=10:00:00 --mail-type=BEGIN,END,FAIL "
-                + xavier_base("resources", "cacher")
-                + " slurm "
-                + " -s '{}' ".format(sif_cache)
-                + " -i '{}' ".format(",".join(pull))
-                + " -t '/lscratch/${SLURM_JOB_ID}/.singularity/' ",
-                cwd=sif_cache,
-                shell=True,
-                stderr=subprocess.STDOUT,
-                stdout=subprocess.PIPE,
+    elif not sub_args.dry_run and sub_args.mode == "local":
+        # Pull images concurrently on this node, each SIF
+        # is written to a temporary name and renamed into place
+        pulled, failed = pull_images(
+            pull, sif_cache, threads=sub_args.threads, tmp_dir=sub_args.tmp_dir
+        )
+        for uri, record in pulled.items():
+            print("Pulled {} (sha256: {})".format(uri, record["sha256"]))
+        for uri, error in failed.items():
+            print("Failed to pull {}: {}".format(uri, error), file=sys.stderr)
+        if failed:
+            sys.exit(1)
+    elif not sub_args.dry_run:
+        # There are image(s) that need to be pulled, the master
+        # job runs xavier cache --mode local on a compute node,
+        # with the entry point of this checkout or installation
+        # Quote user provided values to avoid shell injections
+        pull_command = (
+            "command -V singularity > /dev/null 2>&1 || module load singularity; "
+            + "'{}' '{}' cache --mode local ".format(
+                sys.executable, xavier_base("main.py")
             )
+            + "--sif-cache '{}' --threads {} ".format(sif_cache, sub_args.threads)
+            + "--tmp-dir /lscratch/\\${SLURM_JOB_ID}/.singularity/"
+        )
+        masterjob = subprocess.Popen(
+            "sbatch --parsable -J pl:cache --gres=lscratch:200  --time=10:00:00 --mail-type=BEGIN,END,FAIL "
+            + "--cpus-per-task={} ".format(sub_args.threads)
+            + '--wrap "{}"'.format(pull_command),
+            cwd=sif_cache,
+            shell=True,
+            stderr=subprocess.STDOUT,
+            stdout=subprocess.PIPE,
+        )
 
-            masterjob.communicate()
-            print(
-                "XAVIER reference cacher submitted master job with exit-code: {}".format(
-                    masterjob.returncode
-                )
+        masterjob.communicate()
+        print(
+            "XAVIER reference cacher submitted master job with exit-code: {}".format(
+                masterjob.returncode
             )
+        )
 
 
 def parsed_arguments():
@@ -199,6 +273,19 @@ def parsed_arguments():
                               [--threads THREADS] \\
                               [--wait] \\
                               [--create-nidap-folder] \\
+                              [--profile-setup] \\
+                              [--snakemake-api] \\
+                              [--force-dryrun] \\
+                              [--dryrun-summary] \\
+                              [--artifact-cache ARTIFACT_CACHE] \\
+                              [--scatter-shards SCATTER_SHARDS] \\
+                              [--split-bams] \\
+                              [--lean-preprocess] \\
+                              [--germline-engine {combinegvcfs,genomicsdb}] \\
+                              [--gvcf-store GVCF_STORE] \\
+                              [--stage-dir STAGE_DIR] \\
+                              [--kraken-batch KRAKEN_BATCH] \\
+                              [--resource-model RESOURCE_MODEL] \\
                               --runmode RUNMODE [init, dryrun, run]
                               --input INPUT [INPUT ...] \\
                               --output OUTPUT \\
@@ -512,6 +599,162 @@ def parsed_arguments():
         default:  '/lscratch/$SLURM_JOBID/'",
     )
 
+    # Report time spent staging inputs and building the config
+    subparser_run.add_argument(
+        "--profile-setup",
+        action="store_true",
+        required=False,
+        default=False,
+        help="Report the time spent in each step of setting up the output \
+        directory, i.e. resolving and symlinking input files, checking the \
+        checksum cache, building the config file, and resolving bind paths.",
+    )
+
+    # Parse the workflow in-process with the snakemake API
+    subparser_run.add_argument(
+        "--snakemake-api",
+        action="store_true",
+        required=False,
+        default=False,
+        help="Call snakemake in-process instead of running the snakemake \
+        command. The workflow is parsed once, and with --mode local it is \
+        re-used to run the pipeline; the DAG is still built for the dry-run \
+        and again for the run, re-using the file inventory of the dry-run. Log \
+        messages are written to logfiles/snakemake.log as jobs start and finish.",
+    )
+
+    # Bypass the cached dry-run
+    subparser_run.add_argument(
+        "--force-dryrun",
+        action="store_true",
+        required=False,
+        default=False,
+        help="Always dry-run the pipeline before running it. By default, \
+        --runmode run re-uses the last dry-run if config.json, the workflow, \
+        and the input files (names, sizes, and mtimes) have not changed.",
+    )
+
+    # Only print the number of jobs per rule
+    subparser_run.add_argument(
+        "--dryrun-summary",
+        action="store_true",
+        required=False,
+        default=False,
+        help="Print a compact summary of the number of jobs per rule \
+        instead of the full listing of jobs during the dry-run. The full \
+        listing is still written to dryrun.<timestamp>.log.",
+    )
+
+    # Shared cache of derived reference files
+    subparser_run.add_argument(
+        "--artifact-cache",
+        type=lambda option: os.path.abspath(os.path.expanduser(option)),
+        required=False,
+        default=None,
+        help="Cache of reference files derived from the inputs, i.e. the \
+        normalized targets BED file and intervals.list, shared across output \
+        directories. Defaults to $XAVIER_ARTIFACT_CACHE or \
+        ~/.cache/xavier/artifacts. Example: --artifact-cache /data/$USER/artifacts",
+    )
+
+    # Scatter callers over shards of the targets
+    subparser_run.add_argument(
+        "--scatter-shards",
+        type=int,
+        required=False,
+        default=0,
+        help="Scatter the somatic callers and HaplotypeCaller over this many \
+        shards of the exome targets BED file with a similar number of targeted \
+        base-pairs, instead of one job per chromosome. The shards are planned \
+        once per output directory. Default: 0, scatter per chromosome. \
+        Example: --scatter-shards 48",
+    )
+
+    # Write a BAM file per scatter unit
+    subparser_run.add_argument(
+        "--split-bams",
+        action="store_true",
+        required=False,
+        default=False,
+        help="Split each final BAM file into a BAM file per chromosome or shard \
+        before variant calling. By default, the callers read the indexed final \
+        BAM file by region, without writing a copy of it. Example: --split-bams",
+    )
+
+    # Scattered BQSR streamed into the final BAM
+    subparser_run.add_argument(
+        "--lean-preprocess",
+        action="store_true",
+        required=False,
+        default=False,
+        help="Stream ApplyBQSR over groups of contigs into the final BAM file, \
+        without writing the intermediate input.bam file and its re-headered \
+        copy. Only applies to FastQ inputs. Example: --lean-preprocess",
+    )
+
+    # Joint genotyping of large cohorts
+    subparser_run.add_argument(
+        "--germline-engine",
+        type=str,
+        required=False,
+        default="combinegvcfs",
+        choices=["combinegvcfs", "genomicsdb"],
+        help="Engine that combines the gVCFs of all samples for joint \
+        genotyping [Default: combinegvcfs]. genomicsdb imports them into a \
+        GenomicsDB workspace per chromosome or shard in batches of samples, \
+        which scales to larger cohorts. Example: --germline-engine genomicsdb",
+    )
+
+    # Incremental joint genotyping
+    subparser_run.add_argument(
+        "--gvcf-store",
+        type=lambda option: os.path.abspath(os.path.expanduser(option)),
+        required=False,
+        default=None,
+        help="Keep the gVCFs of each sample, and with --germline-engine \
+        genomicsdb the GenomicsDB workspaces, in this directory across runs. \
+        Samples already in the store are genotyped with the samples of the \
+        run, without calling them again, and only new samples are imported. \
+        Example: --gvcf-store /data/$USER/cohort_gvcfs",
+    )
+
+    # Node-local copies of large references
+    subparser_run.add_argument(
+        "--stage-dir",
+        type=lambda option: os.path.abspath(os.path.expanduser(option)),
+        required=False,
+        default=None,
+        help="Directory on the local disk of each compute node where the VEP \
+        cache, the kraken2 database, and the fastq_screen indices are copied \
+        once per node and re-used by later jobs on the same node. It must be \
+        writable on every node, i.e. under /tmp, and is capped at \
+        STAGE_MAX_SIZE in config.json. Example: --stage-dir /tmp/$USER/xavier_refs",
+    )
+
+    # Kraken jobs of several samples
+    subparser_run.add_argument(
+        "--kraken-batch",
+        type=int,
+        required=False,
+        default=0,
+        help="Classify the reads of batches of this many samples with Kraken \
+        in one job, against one memory-mapped copy of the database, instead \
+        of one job per sample that loads the database into memory. \
+        Default: 0, one job per sample. Example: --kraken-batch 8",
+    )
+
+    # Memory and time of each rule learned from past runs
+    subparser_run.add_argument(
+        "--resource-model",
+        type=lambda file: os.path.abspath(permissions(parser, file, os.R_OK)),
+        required=False,
+        default=None,
+        help="Model of the memory and time of each rule fit on the cluster \
+        stats of past runs with workflow/scripts/resource_model.py fit. The \
+        cluster config of the run is tuned with it for the size of its input \
+        files. Example: --resource-model /data/$USER/xavier_resources.json",
+    )
+
     # Number of threads for the xavier pipeline's main proceess
     subparser_run.add_argument(
         "--threads",
@@ -588,7 +831,9 @@ def parsed_arguments():
     # description below should be updated (i.e. update usage and add new option)
     required_cache_options = textwrap.dedent(
         """\
-        usage: xavier cache [-h] [-n] --sif-cache SIF_CACHE
+        usage: xavier cache [-h] [-n] [--mode {slurm,local}] \\
+                            [--threads THREADS] [--tmp-dir TMP_DIR] \\
+                            --sif-cache SIF_CACHE
 
         Creates a local cache resources hosted on DockerHub or AWS S3.
         These resources are normally pulled onto the filesystem when the
@@ -658,6 +903,129 @@ def parsed_arguments():
         help="Only display what remote resources would be pulled.",
     )
 
+    # Where images are pulled, local or a SLURM job
+    subparser_cache.add_argument(
+        "--mode",
+        type=str,
+        required=False,
+        default="slurm",
+        choices=["slurm", "local"],
+        help="Execution method. Defines where images are pulled. \
+        slurm: submits a job that pulls the images on a compute node. \
+        local: pulls the images on the current node. Example: --mode local",
+    )
+
+    # Number of concurrent pulls
+    subparser_cache.add_argument(
+        "--threads",
+        type=int,
+        required=False,
+        default=4,
+        help="Maximum number of images to pull at the same time. Example: --threads 4",
+    )
+
+    # Temporary singularity cache
+    subparser_cache.add_argument(
+        "--tmp-dir",
+        type=lambda option: os.path.abspath(os.path.expanduser(option)),
+        required=False,
+        default=None,
+        help="Temporary singularity cache directory for image layers, each image \
+        uses its own sub-directory. Defaults to $SINGULARITY_CACHEDIR. \
+        Example: --tmp-dir /lscratch/$SLURM_JOB_ID/.singularity",
+    )
+
+    # Sub-parser for the "stats" sub-command
+    # Grouped sub-parser arguments are currently not supported.
+    # https://bugs.python.org/issue9341
+    # Here is a work around to create more useful help message for named
+    # options that are required! Please note: if a required arg is added the
+    # description below should be updated (i.e. update usage and add new option)
+    required_stats_options = textwrap.dedent(
+        """\
+        usage: xavier stats [-h] [--log LOG] [--stats STATS] \\
+                            [--batch-size BATCH_SIZE] \\
+                            --output OUTPUT
+
+        Collects the cluster stats of the jobs of a previous run. The jobs
+        submitted to SLURM are read from its snakemake log, and their
+        accounting records are queried with sacct in batches of job IDs.
+        The stats of each job, and their aggregates per rule, are written
+        to TSV files, or Parquet files if the file name ends with .parquet.
+
+        required arguments:
+          --output OUTPUT
+                                Path to a previous run's output directory.
+                                Example: --output /data/$USER/xavier_hg38
+
+        """
+    )
+
+    # Display example usage in epilog
+    stats_epilog = textwrap.dedent(
+        """\
+        example:
+          # Collect the cluster stats of a run
+          xavier stats --output /data/$USER/xavier_hg38
+
+        version:
+          {}
+        """.format(
+            __version__
+        )
+    )
+
+    # Suppressing help message of required args to overcome no sub-parser named groups
+    subparser_stats = subparsers.add_parser(
+        "stats",
+        help="Collects the cluster stats of the jobs of a previous run.",
+        usage=argparse.SUPPRESS,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=required_stats_options,
+        epilog=stats_epilog,
+    )
+
+    # Required Arguments
+    # Output Directory (analysis working directory)
+    subparser_stats.add_argument(
+        "--output",
+        type=lambda option: os.path.abspath(os.path.expanduser(option)),
+        required=True,
+        help=argparse.SUPPRESS,
+    )
+
+    # Optional Arguments
+    # Snakemake log of the run
+    subparser_stats.add_argument(
+        "--log",
+        type=lambda option: os.path.abspath(os.path.expanduser(option)),
+        required=False,
+        default=None,
+        help="Snakemake log of the run. Defaults to logfiles/snakemake.log \
+        in the output directory. Example: --log logfiles/snakemake.log",
+    )
+
+    # Stats of each job
+    subparser_stats.add_argument(
+        "--stats",
+        type=lambda option: os.path.abspath(os.path.expanduser(option)),
+        required=False,
+        default=None,
+        help="Output file of the stats of each job, .tsv or .parquet. The \
+        aggregates of each rule are written next to it, i.e. \
+        cluster_stats.rules.tsv. Defaults to logfiles/cluster_stats.tsv in \
+        the output directory. Example: --stats cluster_stats.parquet",
+    )
+
+    # Number of job IDs per sacct call
+    subparser_stats.add_argument(
+        "--batch-size",
+        type=int,
+        required=False,
+        default=1000,
+        help="Maximum number of job IDs per sacct call. Example: --batch-size 1000",
+    )
+
     subparser_debug = subparsers.add_parser(
         "debug",
         help="Debug the pipeline base directory.",
@@ -669,7 +1037,8 @@ def parsed_arguments():
     subparser_debug.set_defaults(func=debug)
     subparser_unlock.set_defaults(func=unlock)
     subparser_cache.set_defaults(func=cache)
-    subparser_gui.set_defaults(func=launch_gui)
+    subparser_stats.set_defaults(func=stats)
+    subparser_gui.set_defaults(func=gui)
 
     # Parse command-line args
     args = parser.parse_args()
@@ -685,10 +1054,13 @@ def main():
     # show helpful error message when no arguments given
     if len(sys.argv) == 1:
         # Nothing was provided
+        from ccbr_tools.pipeline.util import fatal
+
         fatal("Invalid usage: xavier [-h] [--version] ...")
 
     # Collect args for sub-command
     args = parsed_arguments()
+    from ccbr_tools.pipeline.util import err
 
     # Display version information
     err("xavier ({})".format(__version__))
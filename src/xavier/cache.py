@@ -1,6 +1,19 @@
+import hashlib
 import json
 import os
+import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# Index of the SIFs in a --sif-cache directory, see pull_images()
+MANIFEST = "manifest.json"
 
 
 def get_singularity_cachedir(output_dir, cache_dir=None):
@@ -38,14 +51,15 @@ def image_cache(sub_args, config):
     # Read in config for docker image uris
     with open(images, "r") as fh:
         data = json.load(fh)
-    # Check if local sif exists
+    # Check if local sif exists, one read of the
+    # cache's manifest instead of a stat per image
+    cached = {}
+    if sub_args.sif_cache:
+        cached, _ = verify_cache(sub_args.sif_cache, data["images"].values())
     for image, uri in data["images"].items():
         if sub_args.sif_cache:
-            sif = os.path.join(
-                sub_args.sif_cache,
-                "{}.sif".format(os.path.basename(uri).replace(":", "_")),
-            )
-            if not os.path.exists(sif):
+            sif = os.path.join(sub_args.sif_cache, sif_name(uri))
+            if uri not in cached:
                 # If local sif does not exist on in cache, print warning
                 # and default to pulling from URI in config/containers/images.json
                 print(
@@ -61,3 +75,188 @@ def image_cache(sub_args, config):
     config.update(data)
 
     return config
+
+
+def sif_name(uri):
+    """Returns the name of the local SIF of an image,
+    i.e. docker://nciccbr/ccbr_picard:v0.0.1 -> ccbr_picard_v0.0.1.sif
+    """
+    return "{}.sif".format(os.path.basename(uri).replace(":", "_"))
+
+
+def read_manifest(sif_cache):
+    """Reads the manifest of a SIF cache directory.
+    @param sif_cache <str>:
+        Path to the local SIF cache
+    @return images dict[<str>, <dict>]:
+        Records of each SIF in the cache (uri, sha256, size), keyed by SIF name
+    """
+    try:
+        with open(os.path.join(sif_cache, MANIFEST), "r") as fh:
+            return json.load(fh).get("images", {})
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def write_manifest(sif_cache, images):
+    """Atomically replaces the manifest of a SIF cache directory."""
+    manifest = os.path.join(sif_cache, MANIFEST)
+    tmp = os.path.join(sif_cache, ".{}.{}.tmp".format(MANIFEST, os.getpid()))
+    with open(tmp, "w") as fh:
+        json.dump({"images": images}, fh, indent=4, sort_keys=True)
+    os.replace(tmp, manifest)
+
+
+def update_manifest(sif_cache, records):
+    """Adds records to the manifest of a SIF cache directory. The manifest is
+    read, updated, and replaced under a lock file, so concurrent pulls of other
+    processes, i.e. xavier cache jobs, never drop each other's records.
+    @param records dict[<str>, <dict>]:
+        Records of SIFs, keyed by SIF name
+    """
+    with open(os.path.join(sif_cache, ".{}.lock".format(MANIFEST)), "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            images = read_manifest(sif_cache)
+            images.update(records)
+            write_manifest(sif_cache, images)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def verify_cache(sif_cache, uris, listing=False):
+    """Splits images into those with a SIF in the cache and those that need to
+    be pulled. SIFs in the manifest are trusted without touching the filesystem;
+    SIFs pulled before the manifest existed are stat'ed once.
+    @param sif_cache <str>:
+        Path to the local SIF cache
+    @param uris list[<str>]:
+        Image URIs, i.e. docker://nciccbr/ccbr_picard:v0.0.1
+    @param listing <bool>:
+        Cross-check the manifest against one listing of the cache directory,
+        so SIFs deleted since they were pulled are reported as missing
+    @return cached dict[<str>, <str>], missing list[<str>]:
+        Local SIF of each cached image, and the images to pull
+    """
+    manifest = read_manifest(sif_cache)
+    present = None
+    if listing:
+        try:
+            present = set(os.listdir(sif_cache))
+        except OSError:
+            present = set()
+    cached, missing = {}, []
+    for uri in uris:
+        name = sif_name(uri)
+        sif = os.path.join(sif_cache, name)
+        record = manifest.get(name)
+        if record is not None and record.get("uri") == uri:
+            found = present is None or name in present
+        elif present is not None:
+            found = name in present
+        else:
+            found = os.path.exists(sif)
+        if found:
+            cached[uri] = sif
+        else:
+            missing.append(uri)
+    return cached, missing
+
+
+def sha256sum(filename, blocksize=1 << 20):
+    """Returns the SHA-256 digest of a file."""
+    hasher = hashlib.sha256()
+    with open(filename, "rb") as fh:
+        for block in iter(lambda: fh.read(blocksize), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def pull_image(
+    uri, sif_cache, singularity="singularity", tmp_dir=None, retries=5, delay=4
+):
+    """Pulls an image into the SIF cache. The image is pulled to a temporary
+    name and renamed into place, so an interrupted pull never leaves a partial
+    SIF behind. Failed pulls are retried with an exponential back-off.
+    @param uri <str>:
+        Image URI, i.e. docker://nciccbr/ccbr_picard:v0.0.1
+    @param sif_cache <str>:
+        Path to the local SIF cache
+    @param singularity <str>:
+        Singularity executable
+    @param tmp_dir <str>:
+        Optional singularity cache directory, each image uses its own
+        sub-directory so concurrent pulls do not share layers
+    @param retries <int>:
+        Number of times a failed pull is retried
+    @param delay <int>:
+        Base of the back-off, waits delay**attempt seconds between attempts
+    @return record <dict>:
+        Manifest record of the pulled SIF (uri, sha256, size)
+    """
+    name = sif_name(uri)
+    tmp = os.path.join(
+        sif_cache, ".{}.{}.{}.tmp".format(name, os.getpid(), threading.get_ident())
+    )
+    env = dict(os.environ)
+    if tmp_dir:
+        env["SINGULARITY_CACHEDIR"] = os.path.join(tmp_dir, name)
+    try:
+        for attempt in range(retries + 1):
+            try:
+                subprocess.check_output(
+                    [singularity, "pull", "--force", tmp, uri],
+                    stderr=subprocess.STDOUT,
+                    env=env,
+                )
+                break
+            except subprocess.CalledProcessError as e:
+                if attempt == retries:
+                    raise e
+                print(
+                    "Failed to pull {}, attempt {}/{}".format(
+                        uri, attempt + 1, retries
+                    ),
+                    file=sys.stderr,
+                )
+                time.sleep(delay ** (attempt + 1))
+        record = {"uri": uri, "sha256": sha256sum(tmp), "size": os.path.getsize(tmp)}
+        os.replace(tmp, os.path.join(sif_cache, name))
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return record
+
+
+def pull_images(uris, sif_cache, threads=4, **kwargs):
+    """Pulls images into the SIF cache concurrently with a bounded pool of
+    workers, see pull_image(). The manifest is updated as each pull finishes.
+    @param uris list[<str>]:
+        Image URIs to pull
+    @param sif_cache <str>:
+        Path to the local SIF cache
+    @param threads <int>:
+        Maximum number of concurrent pulls
+    @return pulled dict[<str>, <dict>], failed dict[<str>, <str>]:
+        Manifest record of each pulled image, and the error of each failed pull
+    """
+    lock = threading.Lock()
+    pulled, failed = {}, {}
+
+    def worker(uri):
+        try:
+            record = pull_image(uri, sif_cache, **kwargs)
+        except (OSError, subprocess.CalledProcessError) as e:
+            output = getattr(e, "output", None) or b""
+            with lock:
+                failed[uri] = "{}\n{}".format(e, output.decode("utf-8", "replace"))
+            return
+        with lock:
+            pulled[uri] = record
+            update_manifest(sif_cache, {sif_name(uri): record})
+
+    with ThreadPoolExecutor(max_workers=max(1, int(threads))) as pool:
+        list(pool.map(worker, uris))
+    return pulled, failed
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""In-process Snakemake executor for xavier run --snakemake-api.
+The Snakefile and config are parsed once, and the same workflow object is
+used for the mandatory dry-run and for local execution. Snakemake 7 builds
+the DAG inside each Workflow.execute() call, so the DAG is still built twice,
+once for the dry-run and once for the run; files inspected while building the
+dry-run DAG stay in snakemake's IOCache, so the second one is built without
+another round of metadata calls on the filesystem.
+Log records are written to the log file as snakemake emits them.
+"""
+
+# Python standard library
+from __future__ import print_function
+import contextlib
+import io
+import os
+import subprocess
+
+
+class _Tee(object):
+    """File-like object that writes to several streams, flushing each write."""
+
+    def __init__(self, *streams):
+        self.streams = streams
+
+    def write(self, data):
+        for stream in self.streams:
+            stream.write(data)
+            stream.flush()
+
+    def flush(self):
+        for stream in self.streams:
+            stream.flush()
+
+
+@contextlib.contextmanager
+def _environment(workdir, env):
+    """Temporarily changes the working directory and environment variables."""
+    olddir = os.getcwd()
+    # Only the variables set here are restored, others changed by the
+    # workflow are kept
+    oldenv = dict((key, os.environ.get(key)) for key in env)
+    os.environ.update(env)
+    os.chdir(workdir)
+    try:
+        yield
+    finally:
+        os.chdir(olddir)
+        for key, value in oldenv.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+class SnakemakeWorkflow(object):
+    """Parses the pipeline's Snakefile once with the snakemake API, see
+    dryrun() and execute(). Provides the returncode and wait() of a
+    subprocess.Popen() object, so it can be returned by run.runner().
+    @param outdir <str>:
+        Pipeline output PATH, the working directory of the workflow
+    @param config <str>:
+        Config file, relative to outdir
+    @param snakefile <str>:
+        Snakefile, relative to outdir
+    @param cores <int>:
+        Number of cores for local execution
+    @param singularity_args <str>:
+        Arguments passed to singularity, i.e. bind paths
+    @param env dict[<str>, <str>]:
+        Environment variables set while the workflow is parsed and executed
+    """
+
+    def __init__(
+        self,
+        outdir,
+        config="config.json",
+        snakefile=os.path.join("workflow", "Snakefile"),
+        cores=1,
+        singularity_args="",
+        env={},
+    ):
+        self.outdir = os.path.abspath(outdir)
+        self.config = config
+        self.snakefile = snakefile
+        self.cores = int(cores)
+        self.singularity_args = singularity_args
+        self.env = env
+        self.workflow = None
+        self.returncode = None
+
+    def _logger(self, stream, dryrun):
+        """Sends snakemake's log records to stream as they are emitted."""
+        from snakemake.logging import setup_logger, logger, ColorizingStreamHandler
+
+        setup_logger(printshellcmds=True, printreason=True, nocolor=True, dryrun=dryrun)
+        logger.set_stream_handler(ColorizingStreamHandler(nocolor=True, stream=stream))
+        if not dryrun:
+            # Complete log in .snakemake/log
+            logger.setup_logfile()
+        return logger
+
+    def _load(self):
+        """Parses the Snakefile and config once, re-used by later calls."""
+        if self.workflow is not None:
+            return self.workflow
+
+        from snakemake import RERUN_TRIGGERS
+        from snakemake.io import load_configfile
+        from snakemake.utils import update_config
+        from snakemake.workflow import Workflow
+
+        snakefile = os.path.abspath(self.snakefile)
+        configfile = os.path.abspath(self.config)
+        overwrite_config = {}
+        update_config(overwrite_config, load_configfile(configfile))
+        workflow = Workflow(
+            snakefile=snakefile,
+            rerun_triggers=RERUN_TRIGGERS,
+            overwrite_config=overwrite_config,
+            overwrite_configfiles=[configfile],
+            use_singularity=True,
+            singularity_args=self.singularity_args,
+            printshellcmds=True,
+            cores=self.cores,
+            nodes=1,
+        )
+        workflow.include(snakefile, overwrite_default_target=True)
+        workflow.check()
+        self.workflow = workflow
+        return workflow
+
+    def _execute(self, stream, dryrun):
+        """Builds the DAG of jobs and executes or dry-runs the workflow.
+        @return success <bool>:
+            True if the workflow completed without errors
+        """
+        from snakemake.exceptions import print_exception
+
+        workflow = None
+        with _environment(self.outdir, self.env):
+            # The log file is created relative to the working directory,
+            # i.e. outdir/.snakemake/log
+            logger = self._logger(stream, dryrun)
+            try:
+                workflow = self._load()
+                success = workflow.execute(
+                    dryrun=dryrun,
+                    printshellcmds=True,
+                    printreason=True,
+                    force_incomplete=True,
+                    updated_files=[],
+                )
+            except Exception as e:
+                # KeyboardInterrupt and SystemExit propagate
+                print_exception(e, workflow.linemaps if workflow else {})
+                success = False
+            finally:
+                if workflow is not None and workflow.persistence:
+                    workflow.persistence.unlock()
+                logger.cleanup()
+        return success
+
+    def dryrun(self, stream=None, capture=True):
+        """Dry-runs the pipeline, equivalent to snakemake -npr --rerun-incomplete.
+        @param stream <file-handle>:
+            Optional stream to write the dry-run output to as it is emitted
+        @param capture <bool>:
+            Keep the dry-run output in memory, otherwise it is only written to stream
+        @return dryrun_output <bytes>:
+            Byte string representation of the dry-run output, empty if not captured
+        """
+        output = io.StringIO()
+        if not capture:
+            ok = self._execute(stream, dryrun=True)
+        else:
+            ok = self._execute(_Tee(output, stream) if stream else output, dryrun=True)
+        dryrun_output = output.getvalue().encode("utf-8")
+        if not ok:
+            raise subprocess.CalledProcessError(
+                1, "snakemake -npr --rerun-incomplete", output=dryrun_output
+            )
+        return dryrun_output
+
+    def execute(self, logger):
+        """Runs the pipeline locally, re-using the workflow parsed by dryrun().
+        @param logger <file-handle>:
+            An open file handle for writing
+        @return self <SnakemakeWorkflow>:
+            Finished workflow with its returncode set
+        """
+        self.returncode = 0 if self._execute(logger, dryrun=False) else 1
+        return self
+
+    def wait(self):
+        """Execution is blocking, returns the exit code like Popen.wait()."""
+        return self.returncode
@@ -9,9 +9,16 @@ import os
 import re
 import json
 import shutil
+import stat
 import sys
 import subprocess
 import datetime
+import functools
+import glob
+import hashlib
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from ccbr_tools.pipeline.util import (
     git_commit_hash,
     join_jsons,
@@ -22,10 +29,15 @@ from ccbr_tools.pipeline.util import (
     require,
     get_hpcname,
 )
-from ccbr_tools.pipeline.cache import image_cache
 
 # Local imports
-from .util import get_version, xavier_base
+from .util import add_scripts_path, get_version, xavier_base
+from .cache import image_cache
+
+add_scripts_path()
+from checksum_cache import ChecksumCache, default_path
+import artifact_cache
+from resource_model import tune_file
 
 
 def run(sub_args):
@@ -45,10 +57,17 @@ def run(sub_args):
     # copy over required resources to run
     # the pipeline
     git_repo = xavier_base()
+    # Time spent in each setup step,
+    # reported with --profile-setup
+    timings = [] if getattr(sub_args, "profile_setup", False) else None
+    input_files = None
     if sub_args.runmode == "init":
         print("--Initializing")
         input_files = init(
-            repo_path=git_repo, output_path=sub_args.output, links=sub_args.input
+            repo_path=git_repo,
+            output_path=sub_args.output,
+            links=sub_args.input,
+            timings=timings,
         )
 
     # Required Step. Setup pipeline for execution,
@@ -66,23 +85,51 @@ def run(sub_args):
         output_path=sub_args.output,
         create_nidap_folder_YN=create_nidap_folder_YN,
         links=sub_args.input,
+        ifiles=input_files,
+        timings=timings,
     )
 
     # Required Step. Resolve docker/singularity bind
     # paths from the config file.
-    bindpaths = bind(sub_args, config=config)
+    with timed("bind", timings):
+        bindpaths = bind(sub_args, config=config)
+
+    if timings is not None:
+        print(profile_report(timings))
 
     # Optional Step: Dry-run pipeline
     # if sub_args.dry_run:
+    workflow = None
     if sub_args.runmode == "dryrun" or sub_args.runmode == "run":
         print("--Dry-Run")
-        # Dryrun pipeline
-        dryrun_output = dryrun(
-            outdir=sub_args.output
-        )  # python3 returns byte-string representation
-        print(
-            "\nDry-running XAVIER pipeline:\n{}".format(dryrun_output.decode("utf-8"))
-        )
+        if getattr(sub_args, "snakemake_api", False):
+            # Parse the workflow once in-process,
+            # local mode re-uses it to run the pipeline
+            workflow = api_workflow(sub_args, bindpaths)
+        # Print the full listing of jobs,
+        # or only the number of jobs per rule
+        summary = getattr(sub_args, "dryrun_summary", False)
+        logfile = None
+        if sub_args.runmode == "run" and not getattr(sub_args, "force_dryrun", False):
+            # Re-use the last dry-run if the config,
+            # workflow, and input files are unchanged
+            logfile = cached_dryrun(outdir=sub_args.output)
+        if logfile is not None:
+            print(
+                "\nRe-using cached dry-run of XAVIER pipeline (use --force-dryrun to re-plan):"
+            )
+            with open(logfile) as fh:
+                stats = tee_dryrun(fh, echo=not summary)
+        else:
+            # Dryrun pipeline, streamed line by line
+            # to the console and dryrun.<timestamp>.log
+            print("\nDry-running XAVIER pipeline:")
+            stats = stream_dryrun(
+                outdir=sub_args.output, workflow=workflow, echo=not summary
+            )
+            logfile = stats.logfile
+        if summary:
+            print("{}\nFull listing of jobs: {}".format(stats.report(), logfile))
     wait = ""
     if sub_args.wait:
         wait = "--wait"
@@ -115,6 +162,7 @@ def run(sub_args):
             additional_bind_paths=",".join(bindpaths),
             tmp_dir=sub_args.tmp_dir,
             wait=wait,
+            workflow=workflow,
         )
 
         # Step 5. Wait for subprocess to complete,
@@ -151,7 +199,11 @@ def run(sub_args):
 
 
 def init(
-    repo_path, output_path, links=[], required=["workflow", "resources", "config"]
+    repo_path,
+    output_path,
+    links=[],
+    required=["workflow", "resources", "config"],
+    timings=None,
 ):
     """Initialize the output directory. If user provides a output
     directory path that already exists on the filesystem as a file
@@ -165,6 +217,10 @@ def init(
         List of files to symlink into output_path
     @param required list[<str>]:
         List of folder to copy over into output_path
+    @param timings list[<tuple(str, float)>]:
+        Optional list to record the time spent in each step, see timed()
+    @return inputs list[<str>]:
+        List of renamed input files, see sym_safe()
     """
     if not exists(output_path):
         # Pipeline output directory
@@ -184,11 +240,17 @@ def init(
         )
 
     # Copy over templates are other required resources
-    copy_safe(source=repo_path, target=output_path, resources=required)
+    with timed("copy resources", timings):
+        copy_safe(source=repo_path, target=output_path, resources=required)
 
     # Create renamed symlinks for each rawdata
     # file provided as input to the pipeline
-    inputs = sym_safe(input_data=links, target=output_path)
+    inputs = sym_safe(
+        input_data=links,
+        target=output_path,
+        cache=default_path(output_path),
+        timings=timings,
+    )
 
     return inputs
 
@@ -216,31 +278,115 @@ def copy_safe(source, target, resources=[]):
             shutil.copytree(os.path.join(source, resource), destination)
 
 
-def sym_safe(input_data, target):
+@contextlib.contextmanager
+def timed(step, timings=None):
+    """Context manager that records the wall time spent in a step.
+    @param step <str>:
+        Name of the step
+    @param timings list[<tuple(str, float)>]:
+        List to append (step, seconds) to, nothing is recorded if None
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.append((step, time.perf_counter() - start))
+
+
+def profile_report(timings):
+    """Formats the time spent in each setup step, see timed().
+    @param timings list[<tuple(str, float)>]:
+        List of (step, seconds) tuples
+    @return report <str>:
+        Table of steps and seconds, followed by the total
+    """
+    width = max([len(step) for step, _ in timings] + [len("total")])
+    lines = ["\nSetup profile:"]
+    for step, seconds in timings:
+        lines.append("  {}  {:8.3f}s".format(step.ljust(width), seconds))
+    total = sum(seconds for _, seconds in timings)
+    lines.append("  {}  {:8.3f}s".format("total".ljust(width), total))
+    return "\n".join(lines)
+
+
+# Resolving a path is a metadata round-trip on network
+# filesystems like GPFS, each input is only resolved once
+# across init(), setup(), and get_rawdata_bind_paths()
+realpath = functools.lru_cache(maxsize=None)(os.path.realpath)
+
+
+def sym_safe(input_data, target, cache=None, threads=16, timings=None):
     """Creates re-named symlinks for each FastQ file provided
     as input. If a symlink already exists, it will not try to create a new symlink.
     If relative source PATH is provided, it will be converted to an absolute PATH.
+    Source paths are resolved, and existing symlinks are checked, concurrently.
     @param input_data <list[<str>]>:
         List of input files to symlink to target location
     @param target <str>:
         Target path to copy templates and required resources
+    @param cache <str>:
+        Optional path to the persistent checksum cache, inputs that are
+        unchanged since a previous run are reported as cache hits and
+        are not re-hashed by the pipeline
+    @param threads <int>:
+        Number of threads used to resolve and stat input files
+    @param timings list[<tuple(str, float)>]:
+        Optional list to record the time spent in each step, see timed()
     @return input_fastqs list[<str>]:
         List of renamed input FastQs
     """
-    input_fastqs = []  # store renamed fastq file names
-    for file in input_data:
-        filename = os.path.basename(file)
-        renamed = os.path.join(target, rename(filename))
-        input_fastqs.append(renamed)
-
-        if not exists(renamed):
-            # Create a symlink if it does not already exist
-            # Follow source symlinks to resolve any binding issues
-            os.symlink(os.path.abspath(os.path.realpath(file)), renamed)
+    with timed("rename inputs", timings):
+        # store renamed fastq file names
+        input_fastqs = [
+            os.path.join(target, rename(os.path.basename(file))) for file in input_data
+        ]
+
+    workers = max(1, min(threads, len(input_data)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        with timed("resolve inputs", timings):
+            sources = list(pool.map(realpath, input_data))
+            linked = list(pool.map(exists, input_fastqs))
+
+        with timed("create symlinks", timings):
+            seen = set()
+            for source, renamed, found in zip(sources, input_fastqs, linked):
+                if not found and renamed not in seen:
+                    # Create a symlink if it does not already exist
+                    # Follow source symlinks to resolve any binding issues
+                    os.symlink(os.path.abspath(source), renamed)
+                seen.add(renamed)
+
+        if cache:
+            with timed("checksum cache", timings):
+                checksums = ChecksumCache(cache)
+                list(pool.map(checksums.get, sorted(seen)))
+                # Drop records of changed or deleted files
+                checksums.compact()
+                print(checksums.stats())
 
     return input_fastqs
 
 
+# Covers common extensions from SF, SRA, EBI, TCGA, and external sequencing providers
+# regex to match string and how it will be renamed, compiled once and tried in order
+RENAME_EXTENSIONS = [
+    (re.compile(regex), new_ext)
+    for regex, new_ext in [
+        # Matches: _R[12]_fastq.gz, _R[12].fastq.gz, _R[12]_fq.gz, etc.
+        (".R1.f(ast)?q.gz$", ".R1.fastq.gz"),
+        (".R2.f(ast)?q.gz$", ".R2.fastq.gz"),
+        # Matches: _R[12]_001_fastq_gz, _R[12].001.fastq.gz, _R[12]_001.fq.gz, etc.
+        # Capture lane information as named group
+        (".R1.(?P<lane>...).f(ast)?q.gz$", ".R1.fastq.gz"),
+        (".R2.(?P<lane>...).f(ast)?q.gz$", ".R2.fastq.gz"),
+        # Matches: _[12].fastq.gz, _[12].fq.gz, _[12]_fastq_gz, etc.
+        ("_1.f(ast)?q.gz$", ".R1.fastq.gz"),
+        ("_2.f(ast)?q.gz$", ".R2.fastq.gz"),
+    ]
+]
+
+
 def rename(filename):
     """Dynamically renames FastQ file to have one of the following extensions: *.R1.fastq.gz, *.R2.fastq.gz
     To automatically rename the fastq files, a few assumptions are made. If the extension of the
@@ -251,21 +397,6 @@ def rename(filename):
     @return filename <str>:
         A renamed FastQ filename
     """
-    # Covers common extensions from SF, SRA, EBI, TCGA, and external sequencing providers
-    # key = regex to match string and value = how it will be renamed
-    extensions = {
-        # Matches: _R[12]_fastq.gz, _R[12].fastq.gz, _R[12]_fq.gz, etc.
-        ".R1.f(ast)?q.gz$": ".R1.fastq.gz",
-        ".R2.f(ast)?q.gz$": ".R2.fastq.gz",
-        # Matches: _R[12]_001_fastq_gz, _R[12].001.fastq.gz, _R[12]_001.fq.gz, etc.
-        # Capture lane information as named group
-        ".R1.(?P<lane>...).f(ast)?q.gz$": ".R1.fastq.gz",
-        ".R2.(?P<lane>...).f(ast)?q.gz$": ".R2.fastq.gz",
-        # Matches: _[12].fastq.gz, _[12].fq.gz, _[12]_fastq_gz, etc.
-        "_1.f(ast)?q.gz$": ".R1.fastq.gz",
-        "_2.f(ast)?q.gz$": ".R2.fastq.gz",
-    }
-
     if (
         filename.endswith(".R1.fastq.gz")
         or filename.endswith(".R2.fastq.gz")
@@ -275,12 +406,12 @@ def rename(filename):
         return filename
 
     converted = False
-    for regex, new_ext in extensions.items():
-        matched = re.search(regex, filename)
+    for regex, new_ext in RENAME_EXTENSIONS:
+        matched = regex.search(filename)
         if matched:
             # regex matches with a pattern in extensions
             converted = True
-            filename = re.sub(regex, new_ext, filename)
+            filename = regex.sub(new_ext, filename)
             break  # only rename once
 
     if not converted:
@@ -302,7 +433,15 @@ def rename(filename):
     return filename
 
 
-def setup(sub_args, repo_path, output_path, create_nidap_folder_YN="no", links=[]):
+def setup(
+    sub_args,
+    repo_path,
+    output_path,
+    create_nidap_folder_YN="no",
+    links=[],
+    ifiles=None,
+    timings=None,
+):
     """Setup the pipeline for execution and creates config file from templates
     @param sub_args <parser.parse_args() object>:
         Parsed arguments for run sub-command
@@ -312,14 +451,25 @@ def setup(sub_args, repo_path, output_path, create_nidap_folder_YN="no", links=[
         Pipeline output path, created if it does not exist
     @param create_nidap_folder_YN <str>:
         yes or no
+    @param links list[<str>]:
+        List of files to symlink into output_path
+    @param ifiles list[<str>]:
+        Renamed input files if they were already staged by init()
+    @param timings list[<tuple(str, float)>]:
+        Optional list to record the time spent in each step, see timed()
     @return config <dict>:
          Config dictionary containing metadata to run the pipeline
     """
     # Check for mixed inputs,
     # inputs which are a mixture
     # of FastQ and BAM files
-    ifiles = sym_safe(input_data=links, target=output_path)
-    mixed_inputs(ifiles)
+    checksum_cache = default_path(output_path)
+    if ifiles is None:
+        ifiles = sym_safe(
+            input_data=links, target=output_path, cache=checksum_cache, timings=timings
+        )
+    with timed("check inputs", timings):
+        mixed_inputs(ifiles)
 
     shorthostname = get_hpcname()
     if not shorthostname:
@@ -358,15 +508,24 @@ def setup(sub_args, repo_path, output_path, create_nidap_folder_YN="no", links=[
     )
     cluster_output = os.path.join(output_path, "cluster.json")
     shutil.copyfile(cluster_config, cluster_output)
+    # Memory and time learned from past runs,
+    # scaled to the inputs of this run
+    resource_model = getattr(sub_args, "resource_model", None)
+    if resource_model:
+        with timed("resource model", timings):
+            tune_file(resource_model, cluster_output, output_path)
 
     # Global config file for pipeline, config.json
-    config = join_jsons(required.values())  # uses templates in the rna-seek repo
-    config = add_user_information(config)
-    config = add_rawdata_information(sub_args, config, ifiles)
+    with timed("join configs", timings):
+        config = join_jsons(required.values())  # uses templates in the rna-seek repo
+        config = add_user_information(config)
+    with timed("rawdata information", timings):
+        config = add_rawdata_information(sub_args, config, ifiles)
 
     # Resolves if an image needs to be pulled from an OCI registry or
     # a local SIF generated from the rna-seek cache subcommand exists
-    config = image_cache(sub_args, config)
+    with timed("image cache", timings):
+        config = image_cache(sub_args, config)
 
     # Add other cli collected info
     config["project"]["annotation"] = sub_args.genome
@@ -391,6 +550,37 @@ def setup(sub_args, repo_path, output_path, create_nidap_folder_YN="no", links=[
     config["input_params"]["PAIRS_FILE"] = str(sub_args.pairs)
     config["input_params"]["BASE_OUTDIR"] = str(sub_args.output)
     config["input_params"]["tmpdisk"] = str(sub_args.tmp_dir)
+    config["input_params"]["CHECKSUM_CACHE"] = checksum_cache
+    # Derived reference artifacts shared across output
+    # directories, created now so it is bound into containers
+    artifact_cache_path = getattr(sub_args, "artifact_cache", None)
+    if not artifact_cache_path:
+        artifact_cache_path = artifact_cache.default_path()
+    os.makedirs(artifact_cache_path, exist_ok=True)
+    config["input_params"]["ARTIFACT_CACHE"] = artifact_cache_path
+    config["input_params"]["SCATTER_SHARDS"] = str(
+        getattr(sub_args, "scatter_shards", 0) or 0
+    )
+    config["input_params"]["SPLIT_BAMS"] = str(
+        getattr(sub_args, "split_bams", False)
+    ).lower()
+    config["input_params"]["LEAN_PREPROCESS"] = str(
+        getattr(sub_args, "lean_preprocess", False)
+    ).lower()
+    config["input_params"]["GERMLINE_ENGINE"] = getattr(
+        sub_args, "germline_engine", "combinegvcfs"
+    )
+    # Shared by the runs of a cohort, created
+    # now so it is bound into containers
+    gvcf_store = getattr(sub_args, "gvcf_store", None) or ""
+    if gvcf_store:
+        os.makedirs(gvcf_store, exist_ok=True)
+    config["input_params"]["GVCF_STORE"] = gvcf_store
+    # Local disk of the compute nodes, not created here
+    config["input_params"]["STAGE_DIR"] = getattr(sub_args, "stage_dir", None) or ""
+    config["input_params"]["KRAKEN_BATCH"] = str(
+        getattr(sub_args, "kraken_batch", 0) or 0
+    )
     config["input_params"]["create_nidap_folder"] = str(create_nidap_folder_YN)
 
     # Get latest git commit hash
@@ -456,53 +646,121 @@ def resolve_additional_bind_paths(search_paths):
     file path to avoid issues related to shared names across the /gpfs shared network
     filesystem. For each indexed list of file paths, a common path is found. Assumes
     that the paths provided are absolute paths, the build sub command creates reference
-    files with absolute filenames.
+    files with absolute filenames. The common path of each index is found by walking
+    a trie of directory tokens, instead of comparing every path in the index.
     @param search_paths list[<str>]:
         List of absolute file paths to find common bind paths from
     @return common_paths list[<str>]:
         Returns a list of common shared file paths to create additional singularity bind paths
     """
-    common_paths = []
+    common_paths = set()
     indexed_paths = {}
 
-    for ref in search_paths:
+    for ref in set(search_paths):
         # Skip over resources with remote URI and
         # skip over strings that are not file PATHS as
         # build command creates absolute resource PATHS
-        if (
-            ref.lower().startswith("sftp://")
-            or ref.lower().startswith("s3://")
-            or ref.lower().startswith("gs://")
-            or not ref.lower().startswith(os.sep)
-        ):
+        if not ref.startswith(os.sep):
             continue
 
         # Break up path into directory tokens
         path_list = os.path.abspath(ref).split(os.sep)
-        try:  # Create composite index from first two directories
-            # Avoids issues created by shared /gpfs/ PATHS
-            index = path_list[1:3]
-            index = tuple(index)
-        except IndexError:
-            index = path_list[1]  # ref startswith /
-        if index not in indexed_paths:
-            indexed_paths[index] = []
+        # Create composite index from first two directories
+        # Avoids issues created by shared /gpfs/ PATHS
+        index = tuple(path_list[1:3])
         # Create an INDEX to find common PATHS for each root
         # child directory like /scratch or /data. This prevents
         # issues when trying to find the common path between
-        # these two different directories (resolves to /)
-        indexed_paths[index].append(str(os.sep).join(path_list))
+        # these two different directories (resolves to /).
+        # Each index is a trie of directory tokens, a node is
+        # a dict of children and None marks the end of a path
+        node = indexed_paths.setdefault(index, {})
+        for token in path_list[1:]:
+            node = node.setdefault(token, {})
+        node[None] = {}
+
+    for index, node in indexed_paths.items():
+        # Find common paths for each path index, follow
+        # the trie while all paths share the next token
+        tokens = [""]
+        while len(node) == 1 and None not in node:
+            token, node = next(iter(node.items()))
+            tokens.append(token)
+        if None in node and len(tokens) > 2:
+            # A path ends at the common path, bind its
+            # parent directory like the directory of a file
+            tokens.pop()
+        # Avoids adding / to bind list when
+        # given /tmp or /scratch as input
+        common_paths.add(str(os.sep).join(tokens))
+
+    return list(common_paths)
+
+
+def probe_paths(values, stat_cache=None):
+    """Finds the existing paths in a list of values, i.e. the values of the config.
+    Only absolute paths are probed, each path is stat'ed once, and the result is
+    cached in stat_cache so it can be re-used within a run. Files are replaced by
+    the directory they are in.
+    @param values list[<any>]:
+        List of values to probe, non-string values are skipped
+    @param stat_cache dict[<str>, <bool>]:
+        Optional cache of probed paths, True for files, False for other
+        existing paths like directories, and None if a path does not exist
+    @return paths set[<str>]:
+        Set of existing directories, or directories of existing files
+    """
+    if stat_cache is None:
+        stat_cache = {}
+    paths = set()
+    for value in values:
+        if not isinstance(value, str) or not value.startswith(os.sep):
+            # Relative paths, remote URIs, and other
+            # strings are never bound to the container
+            continue
+        if value not in stat_cache:
+            try:
+                stat_cache[value] = stat.S_ISREG(os.stat(value).st_mode)
+            except (OSError, ValueError):
+                stat_cache[value] = None
+        isfile = stat_cache[value]
+        if isfile is not None:
+            paths.add(os.path.dirname(value) if isfile else value)
+
+    return paths
+
 
-    for index, paths in indexed_paths.items():
-        # Find common paths for each path index
-        p = os.path.dirname(os.path.commonprefix(paths))
-        if p == os.sep:
-            # Avoids adding / to bind list when
-            # given /tmp or /scratch as input
-            p = os.path.commonprefix(paths)
-        common_paths.append(p)
+def resolve_bind_paths(config, search_paths=[], stat_cache=None):
+    """Resolves bindpaths for singularity/docker images from the config.
+    @param config dict[<any>]:
+        Config dictionary generated by setup command.
+    @param search_paths list[<str>]:
+        Additional paths to bind, i.e. fastq_screen databases
+    @param stat_cache dict[<str>, <bool>]:
+        Optional cache of probed paths, see probe_paths()
+    @return bindpaths list[<str>]:
+        List of singularity/docker bind paths
+    """
+    bindpaths = probe_paths(unpacked(config), stat_cache)
+    # Local disk of the compute nodes, it may
+    # only exist on the host of the pipeline
+    stage_dir = config.get("input_params", {}).get("STAGE_DIR", "")
+    if stage_dir:
+        bindpaths.discard(stage_dir)
+
+    # Get other reference genome file paths
+    rawdata_bind_paths = [realpath(p) for p in config["project"]["datapath"].split(",")]
+    working_directory = realpath(config["project"]["workpath"])
+    kraken_db_path = config["references"]["KRAKENBACDB"]
+    # Add Bindpath for VCF2maf
+    vep_db_path = config["references"]["VCF2MAF"]["VEPRESOURCEBUNDLEPATH"]
+    genome_bind_paths = resolve_additional_bind_paths(
+        list(bindpaths) + list(search_paths) + [kraken_db_path] + [vep_db_path]
+    )
+    bindpaths = set([working_directory] + rawdata_bind_paths + genome_bind_paths)
+    bindpaths.discard(os.sep)
 
-    return list(set(common_paths))
+    return list(bindpaths)
 
 
 def bind(sub_args, config):
@@ -514,36 +772,13 @@ def bind(sub_args, config):
     @return bindpaths list[<str>]:
         List of singularity/docker bind paths
     """
-    bindpaths = []
-    for value in unpacked(config):
-        if not isinstance(value, str):
-            continue
-        if exists(value):
-            if os.path.isfile(value):
-                value = os.path.dirname(value)
-            if value not in bindpaths:
-                bindpaths.append(value)
-
     # Get FastQ Screen Database paths
-    # and other reference genome file paths
-    rawdata_bind_paths = [
-        os.path.realpath(p) for p in config["project"]["datapath"].split(",")
-    ]
-    working_directory = os.path.realpath(config["project"]["workpath"])
     fqscreen_cfg = config["references"]["FASTQ_SCREEN_CONFIG"]
     fq_screen_paths = get_fastq_screen_paths(
         [os.path.join(sub_args.output, fqscreen_cfg)]
     )
-    kraken_db_path = config["references"]["KRAKENBACDB"]
-    # Add Bindpath for VCF2maf
-    vep_db_path = config["references"]["VCF2MAF"]["VEPRESOURCEBUNDLEPATH"]
-    genome_bind_paths = resolve_additional_bind_paths(
-        bindpaths + fq_screen_paths + [kraken_db_path] + [vep_db_path]
-    )
-    bindpaths = [working_directory] + rawdata_bind_paths + genome_bind_paths
-    bindpaths = list(set([p for p in bindpaths if p != os.sep]))
 
-    return bindpaths
+    return resolve_bind_paths(config, fq_screen_paths)
 
 
 def mixed_inputs(ifiles):
@@ -720,39 +955,64 @@ def get_rawdata_bind_paths(input_files):
     bindpaths = []
     for file in input_files:
         # Get directory of input file
-        rawdata_src_path = os.path.dirname(os.path.abspath(os.path.realpath(file)))
+        rawdata_src_path = os.path.dirname(os.path.abspath(realpath(file)))
         if rawdata_src_path not in bindpaths:
             bindpaths.append(rawdata_src_path)
 
     return bindpaths
 
 
+def api_workflow(sub_args, bindpaths):
+    """Creates an in-process snakemake workflow for the run sub-command.
+    @param sub_args <parser.parse_args() object>:
+        Parsed arguments for run sub-command
+    @param bindpaths list[<str>]:
+        List of singularity/docker bind paths, see bind()
+    @return workflow <executor.SnakemakeWorkflow>:
+        Workflow that is parsed on its first dry-run
+    """
+    from .executor import SnakemakeWorkflow
+
+    bindpaths, cache = singularity_environment(
+        sub_args.output,
+        sub_args.singularity_cache,
+        ",".join(bindpaths),
+        sub_args.tmp_dir,
+    )
+    return SnakemakeWorkflow(
+        outdir=sub_args.output,
+        cores=sub_args.threads,
+        singularity_args="'-B {}'".format(bindpaths),
+        env={"SINGULARITY_CACHEDIR": cache},
+    )
+
+
 def dryrun(
-    outdir, config="config.json", snakefile=os.path.join("workflow", "Snakefile"),
-     write_to_file=True,
+    outdir,
+    config="config.json",
+    snakefile=os.path.join("workflow", "Snakefile"),
+    write_to_file=True,
+    workflow=None,
 ):
     """Dryruns the pipeline to ensure there are no errors prior to running.
     @param outdir <str>:
         Pipeline output PATH
+    @param workflow <executor.SnakemakeWorkflow>:
+        Optional in-process workflow, otherwise the snakemake binary is called
     @return dryrun_output <str>:
-        Byte string representation of dryrun command
+        Byte string representation of dryrun command, see stream_dryrun()
+        to avoid holding the output of large DAGs in memory
     """
+    key = dryrun_key(outdir, config, snakefile)
     try:
-        dryrun_output = subprocess.check_output(
-            [
-                "snakemake",
-                "-npr",
-                "--rerun-incomplete",
-                "-s",
-                str(snakefile),
-                "--use-singularity",
-                "--cores",
-                str(1),
-                "--configfile={}".format(config),
-            ],
-            cwd=outdir,
-            stderr=subprocess.STDOUT,
-        )
+        if workflow is not None:
+            dryrun_output = workflow.dryrun()
+        else:
+            dryrun_output = subprocess.check_output(
+                _dryrun_command(config, snakefile),
+                cwd=outdir,
+                stderr=subprocess.STDOUT,
+            )
     except OSError as e:
         # Catch: OSError: [Errno 2] No such file or directory
         #  Occurs when command returns a non-zero exit-code
@@ -771,12 +1031,359 @@ def dryrun(
     
     if write_to_file:
         now = _now()
-        with open(os.path.join(outdir, "dryrun." + str(now) + ".log"), "w") as outfile:
+        logfile = "dryrun." + str(now) + ".log"
+        with open(os.path.join(outdir, logfile), "w") as outfile:
             outfile.write("{}".format(dryrun_output.decode("utf-8")))
+        _record_dryrun(outdir, key, logfile, config, snakefile)
 
     return dryrun_output
 
 
+def _dryrun_command(
+    config="config.json", snakefile=os.path.join("workflow", "Snakefile")
+):
+    """Snakemake command to dry-run the pipeline, see dryrun()."""
+    return [
+        "snakemake",
+        "-npr",
+        "--rerun-incomplete",
+        "-s",
+        str(snakefile),
+        "--use-singularity",
+        "--cores",
+        str(1),
+        "--configfile={}".format(config),
+    ]
+
+
+# Index of the last dry-run, relative to the output directory
+DRYRUN_CACHE = os.path.join(".xavier", "dryrun.json")
+
+
+def dryrun_key(
+    outdir, config="config.json", snakefile=os.path.join("workflow", "Snakefile")
+):
+    """Hashes everything a dry-run's plan depends on: the contents of the config
+    file, cluster.json, the Snakefile, its rules and scripts, and the targets BED
+    file, the name, size, and mtime of each input file the Snakefile globs for,
+    i.e. FASTQ_SOURCE/*.fastq.gz or BAM_SOURCE/*.bam, the gVCFs of GVCF_STORE,
+    and the outputs, i.e. the mtimes of the .snakemake/metadata and
+    .snakemake/incomplete records, which change as jobs finish or start.
+    @param outdir <str>:
+        Pipeline output PATH
+    @param config <str>:
+        Config file, relative to outdir
+    @param snakefile <str>:
+        Snakefile, relative to outdir
+    @return key <str>:
+        SHA-256 hex digest, or None if the config file does not exist
+    """
+    hasher = hashlib.sha256()
+    configfile = os.path.join(outdir, config)
+    try:
+        with open(configfile, "rb") as fh:
+            contents = fh.read()
+    except (IOError, OSError):
+        return None
+    hasher.update(contents)
+    params = json.loads(contents.decode("utf-8")).get("input_params", {})
+
+    snakefile = os.path.join(outdir, snakefile)
+    workflow = (
+        [snakefile]
+        + sorted(glob.glob(os.path.join(os.path.dirname(snakefile), "rules", "*")))
+        + sorted(glob.glob(os.path.join(os.path.dirname(snakefile), "scripts", "*.py")))
+        + [os.path.join(outdir, "cluster.json")]
+    )
+    if params.get("EXOME_TARGETS"):
+        workflow.append(os.path.join(outdir, params["EXOME_TARGETS"]))
+    for file in workflow:
+        hasher.update(os.path.relpath(file, outdir).encode("utf-8"))
+        try:
+            with open(file, "rb") as fh:
+                hasher.update(fh.read())
+        except (IOError, OSError):
+            hasher.update(b"\tmissing")
+
+    inputs = glob.glob(
+        os.path.join(outdir, params.get("FASTQ_SOURCE", ""), "*.fastq.gz")
+    ) + glob.glob(os.path.join(outdir, params.get("BAM_SOURCE", ""), "*.bam"))
+    for file in sorted(inputs):
+        try:
+            st = os.stat(file)
+            manifest = "{}\t{}\t{}".format(
+                os.path.basename(file), st.st_size, st.st_mtime_ns
+            )
+        except OSError:
+            manifest = "{}\tmissing".format(os.path.basename(file))
+        hasher.update(manifest.encode("utf-8"))
+
+    # Samples of the store join the cohort, see gvcf_store.stored_samples()
+    if params.get("GVCF_STORE"):
+        store = os.path.join(outdir, params["GVCF_STORE"])
+        for file in sorted(glob.glob(os.path.join(store, "*", "gVCFs", "*"))):
+            hasher.update(os.path.relpath(file, store).encode("utf-8"))
+
+    # Jobs finished or started since
+    for name in ("metadata", "incomplete"):
+        try:
+            state = "{}\t{}".format(
+                name, os.stat(os.path.join(outdir, ".snakemake", name)).st_mtime_ns
+            )
+        except OSError:
+            state = "{}\tmissing".format(name)
+        hasher.update(state.encode("utf-8"))
+
+    return hasher.hexdigest()
+
+
+def cached_dryrun(
+    outdir, config="config.json", snakefile=os.path.join("workflow", "Snakefile")
+):
+    """Returns the log of the last successful dry-run if the config, workflow,
+    and input files have not changed since, see dryrun_key().
+    @param outdir <str>:
+        Pipeline output PATH
+    @return logfile <str>:
+        PATH of the cached dry-run log, or None on a cache miss
+    """
+    try:
+        with open(os.path.join(outdir, DRYRUN_CACHE)) as fh:
+            index = json.load(fh)
+        key = dryrun_key(outdir, config, snakefile)
+        if index["key"] is None or index["key"] != key:
+            return None
+        logfile = os.path.join(outdir, index["log"])
+        return logfile if os.path.isfile(logfile) else None
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+
+def _record_dryrun(outdir, key, logfile, config, snakefile):
+    """Records the log of a successful dry-run, see cached_dryrun(), unless
+    its key changed while it ran, i.e. snakemake created .snakemake/metadata
+    or the jobs of another run finished."""
+    if key is None or dryrun_key(outdir, config, snakefile) != key:
+        return
+    index = os.path.join(outdir, DRYRUN_CACHE)
+    os.makedirs(os.path.dirname(index), exist_ok=True)
+    with open(index, "w") as fh:
+        json.dump({"key": key, "log": logfile}, fh, indent=4)
+
+
+class JobStats(object):
+    """Parses the job-count table of a snakemake dry-run one line at a time,
+    keeping only the per-rule counts, so memory does not grow with the DAG.
+    Snakemake prints the table before and after the listing of jobs, the
+    last complete table wins.
+    """
+
+    def __init__(self):
+        self.counts = []
+        self.lines = 0
+        self._table = None
+
+    def feed(self, line):
+        """Parses a single line of dry-run output."""
+        self.lines += 1
+        line = line.rstrip()
+        if line == "Job stats:":
+            # Header and separator follow
+            self._table = []
+            self._skip = 2
+        elif self._table is not None:
+            if self._skip:
+                self._skip -= 1
+            elif line:
+                fields = line.split()
+                if len(fields) > 1 and fields[1].isdigit():
+                    self._table.append((fields[0], int(fields[1])))
+            else:
+                self.counts = self._table
+                self._table = None
+
+    def report(self):
+        """Per-rule summary of the dry-run.
+        @return summary <str>:
+            Table of job counts per rule
+        """
+        if not self.counts:
+            return "Nothing to be done, all requested files are up to date."
+        width = max(len("rule"), max(len(rule) for rule, _ in self.counts))
+        summary = ["{}  {:>8}".format("rule".ljust(width), "jobs")]
+        summary += [
+            "{}  {:>8}".format(rule.ljust(width), count) for rule, count in self.counts
+        ]
+        return "\n".join(summary)
+
+
+class _LineWriter(object):
+    """File-like object that calls a function with each complete line written."""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.buffer = ""
+
+    def write(self, data):
+        lines = (self.buffer + data).split("\n")
+        self.buffer = lines.pop()
+        for line in lines:
+            self.callback(line + "\n")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.buffer:
+            self.callback(self.buffer)
+            self.buffer = ""
+
+
+def tee_dryrun(lines, outfile=None, echo=True, tail=50):
+    """Tees dry-run output line by line to a log file and the console.
+    @param lines <iterable[str]>:
+        Lines of dry-run output
+    @param outfile <file-handle>:
+        Optional log file to write each line to
+    @param echo <bool>:
+        Print each line to standard output
+    @param tail <int>:
+        Number of trailing lines kept to report errors
+    @return stats <JobStats>:
+        Parsed job counts, with the last lines of output in stats.tail
+    """
+    stats, handle = _dryrun_sink(outfile, echo, tail)
+    for line in lines:
+        handle(line)
+    return stats
+
+
+def _dryrun_sink(outfile=None, echo=True, tail=50):
+    """Returns a JobStats object and a function that tees one line of dry-run
+    output to the log file and console and parses it, see tee_dryrun()."""
+    stats = JobStats()
+    stats.tail = deque(maxlen=tail)
+
+    def handle(line):
+        if outfile is not None:
+            outfile.write(line)
+        if echo:
+            sys.stdout.write(line)
+        stats.feed(line)
+        stats.tail.append(line)
+
+    return stats, handle
+
+
+def stream_dryrun(
+    outdir,
+    config="config.json",
+    snakefile=os.path.join("workflow", "Snakefile"),
+    workflow=None,
+    echo=True,
+):
+    """Dry-runs the pipeline like dryrun(), but streams the output line by line
+    to dryrun.<timestamp>.log and optionally the console instead of holding it
+    in memory. Memory is bounded regardless of the size of the DAG.
+    @param outdir <str>:
+        Pipeline output PATH
+    @param workflow <executor.SnakemakeWorkflow>:
+        Optional in-process workflow, otherwise the snakemake binary is called
+    @param echo <bool>:
+        Print the dry-run output as it is emitted
+    @return stats <JobStats>:
+        Parsed job counts, the log file is in stats.logfile
+    """
+    key = dryrun_key(outdir, config, snakefile)
+    logfile = "dryrun." + str(_now()) + ".log"
+    with open(os.path.join(outdir, logfile), "w") as outfile:
+        if workflow is not None:
+            stats, handle = _dryrun_sink(outfile, echo)
+            writer = _LineWriter(handle)
+            try:
+                workflow.dryrun(stream=writer, capture=False)
+            except subprocess.CalledProcessError as e:
+                writer.close()
+                e.output = "".join(stats.tail).encode("utf-8")
+                print(e, e.output)
+                raise e
+            writer.close()
+        else:
+            command = _dryrun_command(config, snakefile)
+            try:
+                proc = subprocess.Popen(
+                    command,
+                    cwd=outdir,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                )
+            except OSError as e:
+                if e.errno == 2 and not which("snakemake"):
+                    # Failure caused because snakemake is NOT in $PATH
+                    err(
+                        "\n\x1b[6;37;41mError: Are snakemake AND singularity in your $PATH?\x1b[0m"
+                    )
+                    fatal("\x1b[6;37;41mPlease check before proceeding again!\x1b[0m")
+                raise e
+            with io.TextIOWrapper(
+                proc.stdout, encoding="utf-8", errors="replace"
+            ) as out:
+                stats = tee_dryrun(out, outfile, echo)
+            if proc.wait() != 0:
+                e = subprocess.CalledProcessError(
+                    proc.returncode,
+                    command,
+                    output="".join(stats.tail).encode("utf-8"),
+                )
+                print(e, e.output)
+                raise e
+    _record_dryrun(outdir, key, logfile, config, snakefile)
+    stats.logfile = os.path.join(outdir, logfile)
+    return stats
+
+
+def singularity_environment(
+    outdir,
+    alt_cache=None,
+    additional_bind_paths=None,
+    tmp_dir="/lscratch/$SLURM_JOBID/",
+):
+    """Resolves the singularity bind paths and cache of the pipeline's main process.
+    @param outdir <str>:
+        Pipeline output PATH
+    @param alt_cache <str>:
+        Alternative singularity cache location
+    @param additional_bind_paths <str>:
+        Additional paths to bind to container filesystem (i.e. input file paths)
+    @param tmp_dir <str>:
+        Path for writing intermediate, temporary output files
+    @return bindpaths, cache <tuple(str, str)>:
+        Comma separated bind paths, and the value of SINGULARITY_CACHEDIR
+    """
+    # Add additional singularity bind PATHs
+    # to mount the local filesystem to the
+    # containers filesystem, NOTE: these
+    # PATHs must be an absolute PATHs
+    outdir = os.path.abspath(outdir)
+    # Add any default PATHs to bind to
+    # the container's filesystem, like
+    # tmp directories, /lscratch
+    bindpaths = "{},{}".format(outdir, os.path.dirname(tmp_dir.rstrip("/")))
+    # Set ENV variable 'SINGULARITY_CACHEDIR'
+    # to output directory
+    cache = os.path.join(outdir, ".singularity")
+    if alt_cache:
+        # Override the pipeline's default
+        # cache location
+        cache = alt_cache
+
+    if additional_bind_paths:
+        # Add Bind PATHs for rawdata directories
+        bindpaths = "{},{}".format(additional_bind_paths, bindpaths)
+
+    return bindpaths, cache
+
+
 def runner(
     mode,
     outdir,
@@ -788,6 +1395,7 @@ def runner(
     submission_script="runner",
     tmp_dir="/lscratch/$SLURM_JOBID/",
     wait="",
+    workflow=None,
 ):
     """Runs the pipeline via selected executor: local or slurm.
     If 'local' is selected, the pipeline is executed locally on a compute node/instance.
@@ -811,32 +1419,18 @@ def runner(
         Name of the master job
     @param wait <str>:
         "--wait" or "" ... used only while submitting job via HPC API
+    @param workflow <executor.SnakemakeWorkflow>:
+        Workflow parsed in-process for the dry-run, local mode re-uses it
+        instead of starting a new snakemake process, see --snakemake-api
     @return masterjob <subprocess.Popen() object>:
     """
-    # Add additional singularity bind PATHs
-    # to mount the local filesystem to the
-    # containers filesystem, NOTE: these
-    # PATHs must be an absolute PATHs
     outdir = os.path.abspath(outdir)
-    # Add any default PATHs to bind to
-    # the container's filesystem, like
-    # tmp directories, /lscratch
-    bindpaths = "{},{}".format(outdir, os.path.dirname(tmp_dir.rstrip("/")))
-    # Set ENV variable 'SINGULARITY_CACHEDIR'
-    # to output directory
+    bindpaths, cache = singularity_environment(
+        outdir, alt_cache, additional_bind_paths, tmp_dir
+    )
     my_env = {}
     my_env.update(os.environ)
-    cache = os.path.join(outdir, ".singularity")
     my_env["SINGULARITY_CACHEDIR"] = cache
-    if alt_cache:
-        # Override the pipeline's default
-        # cache location
-        my_env["SINGULARITY_CACHEDIR"] = alt_cache
-        cache = alt_cache
-
-    if additional_bind_paths:
-        # Add Bind PATHs for rawdata directories
-        bindpaths = "{},{}".format(additional_bind_paths, bindpaths)
 
     if not exists(os.path.join(outdir, "logfiles")):
         # Create directory for logfiles
@@ -853,7 +1447,12 @@ def runner(
 
     # Run on compute node or instance
     # without submitting jobs to a scheduler
-    if mode == "local":
+    if mode == "local" and workflow is not None:
+        # Run pipeline's main process in-process
+        # with the workflow parsed for the dry-run
+        masterjob = workflow.execute(logger)
+
+    elif mode == "local":
         # Run pipeline's main process
         # Look into later: it maybe worth
         # replacing Popen subprocess with a direct
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""Collects the cluster stats of the jobs of a pipeline run, see xavier stats.
+The jobs submitted to SLURM are read from logfiles/snakemake.log, and their
+accounting records are queried with sacct in batches of job IDs, instead of
+several sacct calls per job as in resources/gather_cluster_stats.
+"""
+
+from __future__ import print_function, division
+import os
+import subprocess
+import sys
+
+from .util import add_scripts_path
+
+add_scripts_path()
+from cluster_groups import parse_time
+from resource_model import parse_mem, snakemake_jobs
+
+# Fields of sacct --parsable2 output
+SACCT_FIELDS = [
+    "JobID", "JobName", "State", "Submit", "Start", "End", "Elapsed",
+    "Timelimit", "ReqCPUS", "AllocCPUS", "ReqMem", "AveRSS", "MaxRSS",
+    "NodeList", "Partition", "QOS", "Account", "User", "WorkDir",
+]  # fmt: skip
+
+# Columns of the stats of each job
+COLUMNS = [
+    "jobid", "rule", "wildcards", "state", "job_name", "submit", "start",
+    "end", "queued_s", "elapsed_s", "time_limit_s", "req_cpus", "alloc_cpus",
+    "req_mem_gb", "max_rss_gb", "ave_rss_gb", "node", "partition", "qos",
+    "account", "user", "workdir",
+]  # fmt: skip
+
+# Columns of the aggregates of each rule
+RULE_COLUMNS = [
+    "rule", "jobs", "completed", "failed", "cpu_hours", "elapsed_s_mean",
+    "elapsed_s_max", "queued_s_mean", "queued_s_max", "max_rss_gb_mean",
+    "max_rss_gb_max", "req_mem_gb_max", "mem_efficiency",
+]  # fmt: skip
+
+# Job IDs per sacct call
+BATCH_SIZE = 1000
+
+
+def _number(value, cast=int):
+    """Converts a sacct field, None if it was not recorded."""
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _seconds(value):
+    """Converts a sacct duration, i.e. 1-02:03:04, to seconds."""
+    try:
+        return int(round(parse_time(value) * 60))
+    except (TypeError, ValueError):
+        # UNLIMITED, Partition_Limit, or empty
+        return None
+
+
+def sacct(jobids, batch_size=BATCH_SIZE, command="sacct"):
+    """Queries the accounting records of jobs, batch_size jobs per sacct call.
+    @param jobids list[<str>]:
+        SLURM job IDs
+    @param batch_size <int>:
+        Maximum number of job IDs per sacct call
+    @param command <str>:
+        sacct executable
+    @return records dict[<str>, dict]:
+        Fields of the allocation of each job, with the largest AveRSS and
+        MaxRSS of its steps
+    """
+    env = dict(os.environ, SLURM_TIME_FORMAT="%s")
+    records = {}
+    jobids = sorted(set(jobids), key=lambda j: (len(j), j))
+    for i in range(0, len(jobids), batch_size):
+        output = subprocess.check_output(
+            [
+                command, "--parsable2", "--noheader", "--allusers", "--units=G",
+                "--format={}".format(",".join(SACCT_FIELDS)),
+                "--jobs={}".format(",".join(jobids[i : i + batch_size])),
+            ],
+            env=env,
+            universal_newlines=True,
+        )  # fmt: skip
+        for line in output.splitlines():
+            fields = dict(zip(SACCT_FIELDS, line.split("|")))
+            if len(fields) != len(SACCT_FIELDS):
+                continue
+            jobid, _, step = fields["JobID"].partition(".")
+            record = records.setdefault(jobid, {})
+            if not step:
+                record.update(
+                    (k, v) for k, v in fields.items() if k not in ("AveRSS", "MaxRSS")
+                )
+            # Steps, i.e. batch and extern, record the memory used
+            for key in ("AveRSS", "MaxRSS"):
+                mem = parse_mem(fields[key])
+                if mem is not None and mem >= (record.get(key) or 0):
+                    record[key] = mem
+    return records
+
+
+def collect(logfile, batch_size=BATCH_SIZE, command="sacct"):
+    """Collects the stats of the jobs of a snakemake log.
+    @param logfile <str>:
+        Path to logfiles/snakemake.log
+    @return rows list[dict]:
+        Stats of each job, see COLUMNS, sorted by submit time
+    """
+    jobs = snakemake_jobs(logfile)
+    records = sacct(list(jobs), batch_size, command)
+    rows = []
+    for jobid, record in records.items():
+        if jobid not in jobs or "State" not in record:
+            # Not accountable, i.e. purged from the database
+            continue
+        job = jobs[jobid]
+        submit = _number(record["Submit"])
+        start = _number(record["Start"])
+        rows.append(
+            {
+                # Job names are {rule}.{wildcards}, or GROUP.* for group jobs
+                # whose group is read from the snakemake log
+                "jobid": jobid,
+                "rule": job["rule"] or record["JobName"].split(".")[0],
+                "wildcards": ",".join(
+                    "{}={}".format(k, v) for k, v in sorted(job["wildcards"].items())
+                ),
+                "state": (record["State"].split() or [""])[0],
+                "job_name": record["JobName"],
+                "submit": submit,
+                "start": start,
+                "end": _number(record["End"]),
+                "queued_s": start - submit if start and submit else None,
+                "elapsed_s": _seconds(record["Elapsed"]),
+                "time_limit_s": _seconds(record["Timelimit"]),
+                "req_cpus": _number(record["ReqCPUS"]),
+                "alloc_cpus": _number(record["AllocCPUS"]),
+                "req_mem_gb": parse_mem(record["ReqMem"]),
+                "max_rss_gb": record.get("MaxRSS"),
+                "ave_rss_gb": record.get("AveRSS"),
+                "node": record["NodeList"],
+                "partition": record["Partition"],
+                "qos": record["QOS"],
+                "account": record["Account"],
+                "user": record["User"],
+                "workdir": record["WorkDir"],
+            }
+        )
+    return sorted(rows, key=lambda r: (r["submit"] or 0, len(r["jobid"]), r["jobid"]))
+
+
+def aggregate(rows):
+    """Aggregates the stats of the jobs of each rule.
+    @param rows list[dict]:
+        Stats of each job, see collect()
+    @return rules list[dict]:
+        Aggregates of each rule, see RULE_COLUMNS
+    """
+    rules = {}
+    for row in rows:
+        rules.setdefault(row["rule"], []).append(row)
+
+    def values(jobs, key):
+        return [j[key] for j in jobs if j[key] is not None]
+
+    aggregates = []
+    for rule, jobs in sorted(rules.items()):
+        elapsed, queued = values(jobs, "elapsed_s"), values(jobs, "queued_s")
+        rss, req = values(jobs, "max_rss_gb"), values(jobs, "req_mem_gb")
+        completed = sum(1 for j in jobs if j["state"] == "COMPLETED")
+        aggregates.append(
+            {
+                "rule": rule,
+                "jobs": len(jobs),
+                "completed": completed,
+                "failed": sum(
+                    1 for j in jobs if j["state"] not in ("COMPLETED", "RUNNING", "PENDING")
+                ),
+                "cpu_hours": sum(
+                    (j["elapsed_s"] or 0) * (j["alloc_cpus"] or 0) for j in jobs
+                ) / 3600.0,
+                "elapsed_s_mean": sum(elapsed) / len(elapsed) if elapsed else None,
+                "elapsed_s_max": max(elapsed) if elapsed else None,
+                "queued_s_mean": sum(queued) / len(queued) if queued else None,
+                "queued_s_max": max(queued) if queued else None,
+                "max_rss_gb_mean": sum(rss) / len(rss) if rss else None,
+                "max_rss_gb_max": max(rss) if rss else None,
+                "req_mem_gb_max": max(req) if req else None,
+                # Peak memory over the memory requested
+                "mem_efficiency": max(rss) / max(req) if rss and req and max(req) else None,
+            }
+        )  # fmt: skip
+    return aggregates
+
+
+def write(rows, columns, path):
+    """Writes rows to a TSV file, or a Parquet file if path ends with .parquet.
+    @param rows list[dict]:
+        Rows to write
+    @param columns list[<str>]:
+        Columns to write, in order
+    @param path <str>:
+        Output file
+    """
+    if path.endswith(".parquet"):
+        try:
+            import pandas as pd
+        except ImportError:
+            sys.exit("Fatal: writing Parquet files requires pandas and pyarrow")
+
+        pd.DataFrame(rows, columns=columns).to_parquet(path, index=False)
+        return
+
+    def cell(value):
+        if value is None:
+            return ""
+        if isinstance(value, float):
+            return "{:.4g}".format(value)
+        return str(value)
+
+    with open(path, "w") as fh:
+        fh.write("\t".join(columns) + "\n")
+        for row in rows:
+            fh.write("\t".join(cell(row[c]) for c in columns) + "\n")
+
+
+def rules_path(path):
+    """Path of the per-rule aggregates of a stats file, i.e. stats.rules.tsv."""
+    stem, ext = os.path.splitext(path)
+    return stem + ".rules" + ext
+
+
+def stats(output, logfile=None, path=None, batch_size=BATCH_SIZE, command="sacct"):
+    """Writes the stats of the jobs of a pipeline run, and their aggregates
+    per rule.
+    @param output <str>:
+        Pipeline output directory
+    @param logfile <str>:
+        Snakemake log, default logfiles/snakemake.log of output
+    @param path <str>:
+        Stats file, .tsv or .parquet, default logfiles/cluster_stats.tsv of output
+    @return path <str>:
+        Stats file, the aggregates are written next to it, see rules_path()
+    """
+    logfile = logfile or os.path.join(output, "logfiles", "snakemake.log")
+    path = path or os.path.join(output, "logfiles", "cluster_stats.tsv")
+    if not os.path.isfile(logfile):
+        sys.exit("Fatal: snakemake log does not exist: {}".format(logfile))
+    try:
+        rows = collect(logfile, batch_size, command)
+    except OSError as e:
+        sys.exit("Fatal: failed to run {}, is SLURM available? {}".format(command, e))
+    except subprocess.CalledProcessError as e:
+        sys.exit("Fatal: {}".format(e))
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    write(rows, COLUMNS, path)
+    write(aggregate(rows), RULE_COLUMNS, rules_path(path))
+    print(
+        "Wrote the stats of {} jobs to {} and {}".format(
+            len(rows), path, rules_path(path)
+        )
+    )
+    return path
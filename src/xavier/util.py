@@ -32,3 +32,14 @@ def get_version(debug=False):
     with open(version_file, "r") as vfile:
         version = f"v{vfile.read().strip()}"
     return version
+
+
+def add_scripts_path():
+    """Adds workflow/scripts to the module search path, as the Snakefile does,
+    so its modules import from a checkout, i.e. bin/xavier or main.py
+    @return path <str>
+    """
+    path = xavier_base("workflow", "scripts")
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return path
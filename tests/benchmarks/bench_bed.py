@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""Benchmarks workflow/scripts/normalize_bed.py against the previous chain of
+reformat_bed.py and correct_target_bed.py, which wrote three temporary files
+and called sort, awk, and sort. Both outputs are compared byte for byte.
+USAGE:
+  $ python tests/benchmarks/bench_bed.py [--intervals 1000000] [--bed targets.bed]
+"""
+
+import argparse
+import filecmp
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from xavier.src.xavier.util import xavier_base
+
+NORMALIZE_BED = xavier_base("workflow", "scripts", "normalize_bed.py")
+
+
+def legacy_reformat_bed(infile, outfile):
+    """Previous reformat_bed.py with --output_fields 6, without its
+    message for every repeated start site."""
+    last_start = "-1"
+    with open(infile, "r") as inputFile, open(outfile, "w") as exome_bed:
+        for line in inputFile:
+            if line.startswith(("#", "track", "browser")):
+                continue
+            curr_cols = line.strip().split("\t")
+            if len(curr_cols) < 4:
+                curr_cols.append(".")
+            bed_output = "\t".join(curr_cols[:3]) + "\t" + curr_cols[3] + "\t0\t.\n"
+            if curr_cols[1] == last_start:
+                bed_output = ""
+            exome_bed.write(bed_output)
+            last_start = curr_cols[1]
+
+
+def legacy_correct_target_bed(inputBed, outputBed):
+    """Previous correct_target_bed.py."""
+    annotations = dict()
+    with open(inputBed, "r") as iBed:
+        for line in iBed.readlines():
+            line = line.strip().split("\t")
+            region = line[0] + "##" + line[1] + "##" + line[2]
+            if not region in annotations:
+                annotations[region] = {"1": [], "2": []}
+            annotations[region]["1"].extend(line[3].split(","))
+            annotations[region]["2"].extend(line[4].split(","))
+    with open(outputBed + ".tmp", "w") as oBed:
+        for k, v in annotations.items():
+            region = k.split("##")
+            oBed.write(
+                "%s\t%s\t%s\t%s\t%s\t.\n"
+                % (region[0], region[1], region[2], ",".join(v["1"]), ",".join(v["2"]))
+            )
+    env = dict(os.environ, LC_ALL="C")
+    subprocess.run(
+        "sort -k1,1 -k2,2n -k3,3n {0}.tmp > {0}.tmp2".format(outputBed),
+        shell=True,
+        check=True,
+        env=env,
+    )
+    subprocess.run(
+        'awk -F"\\t" -v OFS="\\t" \'{seen[$1"##"$2]+=1;if (seen[$1"##"$2]!=1){$2=$2+seen[$1"##"$2]-1};print}\' '
+        + "{0}.tmp2 > {0}.tmp3".format(outputBed),
+        shell=True,
+        check=True,
+        env=env,
+    )
+    subprocess.run(
+        "sort -k1,1 -k2,2n -k3,3n {0}.tmp3 > {0}".format(outputBed),
+        shell=True,
+        check=True,
+        env=env,
+    )
+    for suffix in [".tmp", ".tmp2", ".tmp3"]:
+        os.remove(outputBed + suffix)
+
+
+def simulate(filename, intervals, seed=42):
+    """Writes a capture kit with repeated start sites, duplicate regions,
+    and out of order regions, like the kits FREEC errors out on."""
+    rng = random.Random(seed)
+    chroms = ["chr{}".format(c) for c in list(range(1, 23)) + ["X", "Y"]]
+    position = dict((chrom, 10000) for chrom in chroms)
+    lines = ["track name=targets"]
+    for i in range(intervals):
+        chrom = rng.choice(chroms)
+        if rng.random() > 0.05:
+            position[chrom] += rng.randint(1, 400)
+        start = position[chrom]
+        end = start + rng.randint(50, 300)
+        lines.append("{}\t{}\t{}\tgene{}".format(chrom, start, end, i % 20000))
+    tail = lines[1:]
+    rng.shuffle(tail)
+    lines += tail[: intervals // 50]
+    with open(filename, "w") as fh:
+        fh.write("\n".join(lines) + "\n")
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--intervals", type=int, default=1000000)
+    parser.add_argument("--bed", help="Existing targets BED file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bed = args.bed
+        if not bed:
+            bed = os.path.join(tmp, "targets.bed")
+            simulate(bed, args.intervals)
+        legacy = os.path.join(tmp, "legacy.bed")
+        new = os.path.join(tmp, "new.bed")
+
+        def legacy_chain():
+            legacy_reformat_bed(bed, legacy + ".temp")
+            legacy_correct_target_bed(legacy + ".temp", legacy)
+
+        def normalize_bed():
+            subprocess.run(
+                [sys.executable, NORMALIZE_BED, "-i", bed, "-o", new],
+                check=True,
+                stderr=subprocess.DEVNULL,
+            )
+
+        old_time = timed(legacy_chain)
+        new_time = timed(normalize_bed)
+        assert filecmp.cmp(legacy, new, shallow=False)
+        print("intervals\tlegacy_s\tnew_s\tspeedup")
+        print(
+            "{}\t{:.2f}\t{:.2f}\t{:.2f}x".format(
+                sum(1 for _ in open(bed)), old_time, new_time, old_time / new_time
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
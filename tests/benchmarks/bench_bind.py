@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""Benchmarks bind path resolution in src/xavier/run.py against the previous
+implementation, which probed every string in the config twice (exists and
+isfile), de-duplicated with a list, and compared all paths in an index.
+USAGE:
+  $ python tests/benchmarks/bench_bind.py [--paths 5000] [--config config.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from xavier.src.xavier.run import (
+    resolve_additional_bind_paths,
+    resolve_bind_paths,
+    unpacked,
+)
+
+
+def legacy_resolve_additional_bind_paths(search_paths):
+    """Previous implementation of resolve_additional_bind_paths()."""
+    common_paths = []
+    indexed_paths = {}
+    for ref in search_paths:
+        if (
+            ref.lower().startswith("sftp://")
+            or ref.lower().startswith("s3://")
+            or ref.lower().startswith("gs://")
+            or not ref.lower().startswith(os.sep)
+        ):
+            continue
+        path_list = os.path.abspath(ref).split(os.sep)
+        index = tuple(path_list[1:3])
+        if index not in indexed_paths:
+            indexed_paths[index] = []
+        indexed_paths[index].append(str(os.sep).join(path_list))
+    for index, paths in indexed_paths.items():
+        p = os.path.dirname(os.path.commonprefix(paths))
+        if p == os.sep:
+            p = os.path.commonprefix(paths)
+        common_paths.append(p)
+    return list(set(common_paths))
+
+
+def legacy_bind(config, search_paths):
+    """Previous implementation of bind(), without parsing fastq_screen.conf."""
+    bindpaths = []
+    for value in unpacked(config):
+        if not isinstance(value, str):
+            continue
+        if os.path.exists(value):
+            if os.path.isfile(value):
+                value = os.path.dirname(value)
+            if value not in bindpaths:
+                bindpaths.append(value)
+    rawdata_bind_paths = [
+        os.path.realpath(p) for p in config["project"]["datapath"].split(",")
+    ]
+    working_directory = os.path.realpath(config["project"]["workpath"])
+    kraken_db_path = config["references"]["KRAKENBACDB"]
+    vep_db_path = config["references"]["VCF2MAF"]["VEPRESOURCEBUNDLEPATH"]
+    genome_bind_paths = legacy_resolve_additional_bind_paths(
+        bindpaths + search_paths + [kraken_db_path] + [vep_db_path]
+    )
+    bindpaths = [working_directory] + rawdata_bind_paths + genome_bind_paths
+    return list(set([p for p in bindpaths if p != os.sep]))
+
+
+def simulate(root, npaths, seed=42):
+    """Creates a config with npaths reference files, directories, missing
+    paths, and non-path strings under root."""
+    rng = random.Random(seed)
+    references = {}
+    for i in range(npaths):
+        kind = rng.choice(["file", "dir", "missing", "string"])
+        path = os.path.join(
+            root, "ref{}".format(rng.randint(0, 9)), "sub{}".format(i % 97), str(i)
+        )
+        if kind == "file":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "w").close()
+        elif kind == "dir":
+            os.makedirs(path, exist_ok=True)
+        elif kind == "string":
+            path = "option_{}".format(i)
+        references["key{}".format(i)] = path
+    references["KRAKENBACDB"] = os.path.join(root, "kraken")
+    references["VCF2MAF"] = {"VEPRESOURCEBUNDLEPATH": os.path.join(root, "vep")}
+    return {
+        "project": {"datapath": os.path.join(root, "rawdata"), "workpath": root},
+        "references": references,
+    }
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paths", type=int, default=5000)
+    parser.add_argument("--config", help="Existing config.json from xavier run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.config:
+            with open(args.config) as fh:
+                config = json.load(fh)
+        else:
+            config = simulate(tmp, args.paths)
+        old, old_time = timed(legacy_bind, config, [])
+        new, new_time = timed(resolve_bind_paths, config, [])
+        assert sorted(old) == sorted(new), (old, new)
+        values = [v for v in unpacked(config) if isinstance(v, str)]
+        assert sorted(legacy_resolve_additional_bind_paths(values)) == sorted(
+            resolve_additional_bind_paths(values)
+        )
+        print("values\tlegacy_s\tnew_s\tspeedup")
+        print(
+            "{}\t{:.4f}\t{:.4f}\t{:.2f}x".format(
+                len(values), old_time, new_time, old_time / new_time
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
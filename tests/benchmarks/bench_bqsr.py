@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""Measures the wall time of BaseRecalibrator over whole chromosomes in one
+process, like gatk_recal did, against the padded exome targets of each
+chromosome or shard of workflow/scripts/plan_scatter.py run in parallel, like
+gatk_scatter_recal, followed by GatherBQSRReports. Shards are padded when they
+are planned, the targets of each chromosome with --interval-padding. The
+reference, known sites, chromosomes, and targets are read from the config.json
+of an output directory.
+Requires gatk on $PATH, i.e. module load GATK/4.6.0.0.
+USAGE:
+  # Output directory of the test data, xavier run --input tests/data/*.R?.fastq.gz
+  $ python tests/benchmarks/bench_bqsr.py --output /data/$USER/xavier_hg38 \
+      --bam /data/$USER/xavier_hg38/bams/final_bams/WES_NC_N_1_sub.bam [--jobs 8]
+"""
+
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from xavier.workflow.scripts.plan_scatter import plan_targets, read_lengths
+
+
+def timed(commands, jobs):
+    """Wall time of running commands, at most jobs at once."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for _ in pool.map(
+            lambda command: subprocess.run(
+                command,
+                check=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            ),
+            commands,
+        ):
+            pass
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", required=True, help="xavier output directory")
+    parser.add_argument("--bam", required=True, help="Indexed BAM file of a sample")
+    parser.add_argument("--targets", help="Targets BED file, default: the run's")
+    parser.add_argument("--shards", type=int, help="Default: the run's")
+    parser.add_argument("--jobs", type=int, default=8)
+    args = parser.parse_args()
+
+    with open(os.path.join(args.output, "config.json")) as fh:
+        config = json.load(fh)
+    references = config["references"]
+    chroms = references["chroms"]
+    targets = args.targets or config["input_params"]["EXOME_TARGETS"]
+    shards = args.shards
+    if shards is None:
+        shards = int(config["input_params"].get("SCATTER_SHARDS", 0) or 0)
+    padding = int(config["input_params"].get("SCATTER_PADDING", 100) or 0)
+    fai = references["GENOME"] + ".fai"
+    lengths = read_lengths(fai) if os.path.isfile(fai) else None
+    recal = [
+        "gatk", "--java-options", "-Xmx4g", "BaseRecalibrator",
+        "--input", args.bam, "--reference", references["GENOME"],
+    ] + shlex.split(references["KNOWNRECAL"])  # fmt: skip
+
+    with tempfile.TemporaryDirectory() as tmp:
+        intervals = os.path.join(tmp, "intervals.list")
+        with open(intervals, "w") as fh:
+            fh.write("\n".join(chroms))
+        output = os.path.join(tmp, "before.grp")
+        before = timed([recal + ["--output", output, "--intervals", intervals]], 1)
+
+        scatter = os.path.join(tmp, "scatter")
+        units = [
+            unit
+            for unit in plan_targets(targets, scatter, shards, chroms, padding, lengths)
+            if os.path.getsize(os.path.join(scatter, unit + ".bed"))
+        ]
+        tables = [os.path.join(tmp, unit + ".grp") for unit in units]
+        # Shards are padded when they are planned
+        padded = ["--interval-padding", "0" if shards else "100"]
+        after = timed(
+            [
+                recal + ["--output", table, "--intervals", bed] + padded
+                for bed, table in zip(
+                    [os.path.join(scatter, unit + ".bed") for unit in units], tables
+                )
+            ],
+            args.jobs,
+        )
+        gather = ["gatk", "--java-options", "-Xmx4g", "GatherBQSRReports"]
+        for table in tables:
+            gather += ["--input", table]
+        after += timed([gather + ["--output", os.path.join(tmp, "after.grp")]], 1)
+
+    print("mode\tunits\tjobs\twall_s")
+    print("chroms\t1\t1\t{:.1f}".format(before))
+    print("targets\t{}\t{}\t{:.1f}".format(len(units), args.jobs, after))
+    print("wall time {:+.0%}".format(after / before - 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""Benchmarks the peak memory of the buffered dry-run, run.dryrun(), against
+the streamed dry-run, run.stream_dryrun(), which tees the output line by line
+to the log file and only keeps the per-rule job counts.
+USAGE:
+  # Initialized output directory, i.e. xavier run --runmode init
+  $ python tests/benchmarks/bench_dryrun.py --output /data/$USER/xavier_hg38
+  # Synthetic workflow with the fan-out of a 2000-sample cohort
+  $ python tests/benchmarks/bench_dryrun.py --samples 2000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_executor import simulate
+from xavier.src.xavier.run import dryrun, stream_dryrun
+
+
+def measured(func, *args, **kwargs):
+    """Returns the wall time and peak traced memory of a call."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="Initialized xavier output directory")
+    parser.add_argument("--samples", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        outdir = args.output
+        if not outdir:
+            outdir = tmp
+            simulate(outdir, args.samples)
+
+        buffered = measured(dryrun, outdir)
+        streamed = measured(stream_dryrun, outdir, echo=False)
+
+        print("mode\twall_s\tpeak_mb")
+        for mode, (elapsed, peak) in [("buffered", buffered), ("streamed", streamed)]:
+            print("{}\t{:.2f}\t{:.1f}".format(mode, elapsed, peak / 1e6))
+
+
+if __name__ == "__main__":
+    main()
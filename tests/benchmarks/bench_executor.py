@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""Benchmarks the startup of xavier run with the snakemake command against
+the in-process executor (--snakemake-api). The snakemake command parses the
+workflow and builds the DAG twice, once for the dry-run and once for the run;
+the in-process executor parses the workflow once, and builds the DAG twice
+re-using the file inventory of the dry-run. The run itself is replaced by a second dry-run, so no jobs execute.
+USAGE:
+  # Initialized output directory, i.e. xavier run --runmode init
+  $ python tests/benchmarks/bench_executor.py --output /data/$USER/xavier_hg38
+  # Synthetic workflow with the fan-out of a 200-sample cohort
+  $ python tests/benchmarks/bench_executor.py --samples 200
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+from xavier.src.xavier.executor import SnakemakeWorkflow
+
+# Per-sample chain of rules, similar in
+# shape to trimming, mapping, and calling
+SNAKEFILE = """
+configfile: "config.json"
+steps = config["steps"]
+rule all:
+    input: expand("calls/{sample}.vcf", sample=config["samples"])
+rule step:
+    input: lambda w: "fastq/{}.fastq.gz".format(w.sample) if int(w.i) == 0 else "step{}/{}.out".format(int(w.i) - 1, w.sample)
+    output: "step{i}/{sample}.out"
+    shell: "cat {input} > {output}"
+rule call:
+    input: "step{}/{{sample}}.out".format(steps - 1)
+    output: "calls/{sample}.vcf"
+    shell: "cat {input} > {output}"
+"""
+
+
+def simulate(outdir, samples, steps=10):
+    """Writes a synthetic workflow and input files for the benchmark."""
+    os.makedirs(os.path.join(outdir, "workflow"))
+    os.makedirs(os.path.join(outdir, "fastq"))
+    with open(os.path.join(outdir, "workflow", "Snakefile"), "w") as fh:
+        fh.write(SNAKEFILE)
+    names = ["sample{}".format(i) for i in range(samples)]
+    for name in names:
+        open(os.path.join(outdir, "fastq", name + ".fastq.gz"), "w").close()
+    with open(os.path.join(outdir, "config.json"), "w") as fh:
+        json.dump({"samples": names, "steps": steps}, fh)
+
+
+def snakemake_command(outdir):
+    """Dry-run with the snakemake command, as run.dryrun() does."""
+    subprocess.check_output(
+        [
+            "snakemake",
+            "-npr",
+            "--rerun-incomplete",
+            "-s",
+            os.path.join("workflow", "Snakefile"),
+            "--cores",
+            "1",
+            "--configfile=config.json",
+        ],
+        cwd=outdir,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="Initialized xavier output directory")
+    parser.add_argument("--samples", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        outdir = args.output
+        if not outdir:
+            outdir = tmp
+            simulate(outdir, args.samples)
+
+        command = timed(snakemake_command, outdir) + timed(snakemake_command, outdir)
+
+        workflow = SnakemakeWorkflow(outdir)
+        first = timed(workflow.dryrun)
+        second = timed(workflow.dryrun)
+
+        print("mode\tdryrun_s\trun_startup_s\ttotal_s")
+        print(
+            "command\t{:.2f}\t{:.2f}\t{:.2f}".format(command / 2, command / 2, command)
+        )
+        print("api\t{:.2f}\t{:.2f}\t{:.2f}".format(first, second, first + second))
+        print(
+            "saved\t{:.2f}s ({:.0%})".format(
+                command - first - second, 1 - (first + second) / command
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
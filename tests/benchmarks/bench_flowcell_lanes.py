@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""Benchmarks workflow/scripts/get_flowcell_lanes.py against the previous
+two-pass implementation, which hashed the raw file and then decompressed it
+again to parse every sequence identifier.
+USAGE:
+  $ python tests/benchmarks/bench_flowcell_lanes.py [--reads 2000000] [FASTQ ...]
+"""
+
+import argparse
+import gzip
+import hashlib
+import importlib.util
+import os
+import random
+import tempfile
+import time
+
+SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    os.pardir,
+    os.pardir,
+    "workflow",
+    "scripts",
+    "get_flowcell_lanes.py",
+)
+
+
+def load_script(path=SCRIPT):
+    """Imports a workflow script as a module."""
+    spec = importlib.util.spec_from_file_location("get_flowcell_lanes", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def two_pass(filename, get_flowcell_lane):
+    """Previous implementation: md5 over the raw file, then a second pass
+    over the decompressed file with list-based de-duplication."""
+    hasher = hashlib.md5()
+    with open(filename, "rb") as fh:
+        buf = fh.read(65536)
+        while buf:
+            hasher.update(buf)
+            buf = fh.read(65536)
+    meta = {"flowcell": [], "lane": [], "flowcell_lane": []}
+    i = 0
+    with gzip.open(filename, "rt") as file:
+        for line in file:
+            line = line.strip()
+            if i % 4 == 0:
+                fc, lane = get_flowcell_lane(line)
+                fc = fc.lstrip("@")
+                fc_lane = "{}_{}".format(fc, lane)
+                if fc not in meta["flowcell"]:
+                    meta["flowcell"].append(fc)
+                if lane not in meta["lane"]:
+                    meta["lane"].append(lane)
+                if fc_lane not in meta["flowcell_lane"]:
+                    meta["flowcell_lane"].append(fc_lane)
+            i += 1
+    return i // 4, hasher.hexdigest()
+
+
+def simulate(path, reads, length=150, seed=42):
+    """Writes a gzipped Casava >= 1.8 FastQ file with random reads."""
+    rng = random.Random(seed)
+    flowcells = ["HNYVJBBXX", "HNWCKBBXX"]
+    seq = "".join(rng.choice("ACGT") for _ in range(length))
+    qual = "F" * length
+    with gzip.open(path, "wt", compresslevel=6) as fh:
+        for i in range(reads):
+            fc = flowcells[i % len(flowcells)]
+            lane = 1 + (i // 1000) % 8
+            fh.write(
+                "@J00170:88:{}:{}:1101:{}:1244 1:N:0:ACTTGA\n{}\n+\n{}\n".format(
+                    fc, lane, i, seq, qual
+                )
+            )
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("fastqs", nargs="*", help="Gzipped FastQ files to benchmark")
+    parser.add_argument("--reads", type=int, default=2000000)
+    parser.add_argument("--decompressor", default="auto")
+    args = parser.parse_args()
+
+    script = load_script()
+    with tempfile.TemporaryDirectory() as tmp:
+        fastqs = args.fastqs
+        if not fastqs:
+            fastqs = [os.path.join(tmp, "simulated.R1.fastq.gz")]
+            simulate(fastqs[0], args.reads)
+
+        print("file\tMB\ttwo_pass_MB/s\tsingle_pass_MB/s\tspeedup")
+        for fastq in fastqs:
+            mb = os.path.getsize(fastq) / 1e6
+            (reads, md5), old = timed(two_pass, fastq, script.get_flowcell_lane)
+            meta, new = timed(script.scan, fastq, args.decompressor)
+            assert (reads, md5) == (meta["reads"], meta["md5"]), fastq
+            print(
+                "{}\t{:.1f}\t{:.1f}\t{:.1f}\t{:.2f}x".format(
+                    os.path.basename(fastq), mb, mb / old, mb / new, old / new
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""Measures the wall time and peak memory of workflow/scripts/merge_callers.py
+merging the VCF files of five callers of a simulated tumor-normal pair, like
+somatic_merge_callers. Each caller calls a random subset of a shared set of
+sites, a tenth of them filtered, so sites are called by one to five callers.
+Peak memory is the maximum resident set size of the merge process, which
+should not grow with the number of records. GATK3 CombineVariants ran with
+-Xmx60g and -nt 4 for the same merge.
+USAGE:
+  $ python tests/benchmarks/bench_merge_callers.py [--sizes 10000,100000,400000]
+"""
+
+import argparse
+import itertools
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT = os.path.join(
+    os.path.dirname(__file__), "..", "..", "workflow", "scripts", "merge_callers.py"
+)
+CALLERS = ["mutect2", "strelka", "mutect", "vardict", "varscan"]
+CONTIGS = ["chr{}".format(c) for c in list(range(1, 23)) + ["X", "Y"]]
+
+
+def simulate(tmp, sites, seed=1):
+    """Writes the reference index and a VCF file per caller."""
+    rng = random.Random(seed)
+    with open(os.path.join(tmp, "genome.fa.fai"), "w") as fh:
+        for contig in CONTIGS:
+            fh.write("{}\t250000000\t0\t60\t61\n".format(contig))
+    # Generated in order, ru_maxrss of the merge process
+    # includes the memory of the parent before exec
+    gap = 2 * 250000000 * len(CONTIGS) // sites
+    positions = (
+        (contig, pos)
+        for contig in range(len(CONTIGS))
+        for pos in itertools.accumulate(
+            rng.randint(1, gap) for _ in range(sites // len(CONTIGS))
+        )
+    )
+    handles = {}
+    for caller in CALLERS:
+        handles[caller] = open(os.path.join(tmp, caller + ".vcf"), "w")
+        handles[caller].write(
+            "##fileformat=VCFv4.2\n"
+            '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n'
+            '##FORMAT=<ID=AD,Number=R,Type=Integer,Description="Allelic depths">\n'
+            '##INFO=<ID=DP,Number=1,Type=Integer,Description="Depth">\n'
+            "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tNORMAL\tTUMOR\n"
+        )
+    for contig, pos in positions:
+        ref, alt = rng.sample("ACGT", 2)
+        if rng.random() < 0.1:
+            alt = ref + "T"
+        dp = rng.randrange(20, 200)
+        for caller in rng.sample(CALLERS, rng.randint(1, len(CALLERS))):
+            handles[caller].write(
+                "{}\t{}\t.\t{}\t{}\t.\t{}\tDP={}\tGT:AD\t0/0:{},0\t0/1:{},{}\n".format(
+                    CONTIGS[contig], pos, ref, alt,
+                    "LowQual" if rng.random() < 0.1 else "PASS",
+                    dp, dp // 2, dp // 2, dp - dp // 2,
+                )  # fmt: skip
+            )
+    for fh in handles.values():
+        fh.close()
+
+
+def run(tmp):
+    """Wall time in seconds and maximum RSS in MB of a merge."""
+    command = [
+        sys.executable, SCRIPT, "--reference", os.path.join(tmp, "genome.fa"),
+        "--priority", ",".join(CALLERS), "--output", os.path.join(tmp, "merged.vcf"),
+    ]  # fmt: skip
+    for caller in CALLERS:
+        command += ["--variant", caller, os.path.join(tmp, caller + ".vcf")]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stderr=subprocess.DEVNULL)
+    _, _, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+    # ru_maxrss is in KB on Linux
+    return wall, usage.ru_maxrss / 1024.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default="10000,100000,400000",
+        help="Comma-separated numbers of simulated sites",
+    )
+    args = parser.parse_args()
+
+    print("sites\trecords_in\trecords_out\twall_s\tmax_rss_mb")
+    for sites in [int(s) for s in args.sizes.split(",")]:
+        with tempfile.TemporaryDirectory() as tmp:
+            simulate(tmp, sites)
+            records_in = 0
+            for caller in CALLERS:
+                with open(os.path.join(tmp, caller + ".vcf")) as fh:
+                    records_in += sum(1 for line in fh if not line.startswith("#"))
+            wall, rss = run(tmp)
+            with open(os.path.join(tmp, "merged.vcf")) as fh:
+                records_out = sum(1 for line in fh if not line.startswith("#"))
+        print(
+            "{}\t{}\t{}\t{:.1f}\t{:.0f}".format(
+                sites, records_in, records_out, wall, rss
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
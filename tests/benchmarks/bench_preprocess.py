@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""Measures the bytes read and written by the preprocessing rules of
+workflow/rules/trim_map_preprocess.smk, before and with LEAN_PREPROCESS. The
+same command, i.e. snakemake with local cores for the final BAM files of a few
+samples, runs in each pipeline output directory, and the bytes its process tree
+sent to and read from storage are taken from /proc/self/io once it has exited;
+writes to temporary files that were removed before they reached the disk are
+not counted. Kept is the size of the BAM files left in the output directory.
+Initialize one output directory without and one with --lean-preprocess, and
+run with --mode local; jobs submitted to a cluster are not measured. Linux only.
+USAGE:
+  $ python tests/benchmarks/bench_preprocess.py \\
+      --command "snakemake -j 16 --use-singularity bams/final_bams/S1.bam" \\
+      before_output/ lean_output/
+"""
+
+import argparse
+import os
+import subprocess
+import time
+
+
+def io_counters():
+    """Returns the I/O counters of this process, which include the counters
+    of the children it has waited for."""
+    with open("/proc/self/io") as fh:
+        return dict(
+            (key, int(value))
+            for key, value in (line.split(":") for line in fh if line.strip())
+        )
+
+
+def kept_bytes(outdir):
+    """Size of the BAM files in an output directory."""
+    total = 0
+    for root, _, files in os.walk(outdir):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith(".bam") and not os.path.islink(path):
+                total += os.path.getsize(path)
+    return total
+
+
+def measure(command, outdir):
+    """Runs a command in an output directory.
+    @return read <int>, written <int>, kept <int>, seconds <float>:
+        Bytes read from and written to storage by the command's process tree,
+        bytes of BAM files left in outdir, and the wall-clock time
+    """
+    before = io_counters()
+    start = time.time()
+    subprocess.check_call(command, shell=True, cwd=outdir)
+    seconds = time.time() - start
+    after = io_counters()
+    delta = dict((key, after[key] - before[key]) for key in after)
+    written = delta["write_bytes"] - delta["cancelled_write_bytes"]
+    return delta["read_bytes"], written, kept_bytes(outdir), seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--command", required=True, help="Command run in each output directory"
+    )
+    parser.add_argument(
+        "outdirs", nargs="+", help="Output directories, i.e. before and lean"
+    )
+    args = parser.parse_args()
+
+    print("outdir\tread_gb\twritten_gb\tkept_gb\tseconds")
+    results = []
+    for outdir in args.outdirs:
+        read, written, kept, seconds = measure(args.command, outdir)
+        results.append(written)
+        print(
+            "{}\t{:.2f}\t{:.2f}\t{:.2f}\t{:.0f}".format(
+                outdir, read / 1e9, written / 1e9, kept / 1e9, seconds
+            )
+        )
+    for outdir, written in zip(args.outdirs[1:], results[1:]):
+        if results[0]:
+            print(
+                "bytes written by {} {:+.0%}".format(outdir, written / results[0] - 1)
+            )
+
+
+if __name__ == "__main__":
+    main()
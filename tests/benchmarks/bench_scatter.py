@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""Compares the critical path of the somatic calling DAG of a simulated cohort
+scattered per chromosome against the shards of workflow/scripts/plan_scatter.py.
+Each tumor/normal pair splits both BAMs per scatter unit, runs five callers on
+each unit, and merges each caller's calls; the runtime of a job is a fixed
+overhead plus a cost per targeted megabase. The critical path is the runtime of
+the longest chain of jobs, and the makespan schedules the cohort's jobs on a
+fixed number of cluster slots in the order snakemake would submit them.
+USAGE:
+  $ python tests/benchmarks/bench_scatter.py [--pairs 50] [--slots 500] [--shards 48]
+  $ python tests/benchmarks/bench_scatter.py --bed Agilent_SSv8_allExons_hg38.bed
+"""
+
+import argparse
+import heapq
+import random
+
+from xavier.workflow.scripts.plan_scatter import plan, read_targets
+
+# Protein-coding genes per chromosome in GRCh38,
+# the targets of a capture kit follow the genes
+GENES = [
+    ("chr1", 2058), ("chr2", 1309), ("chr3", 1078), ("chr4", 752),
+    ("chr5", 876), ("chr6", 1048), ("chr7", 989), ("chr8", 677),
+    ("chr9", 786), ("chr10", 733), ("chr11", 1298), ("chr12", 1034),
+    ("chr13", 327), ("chr14", 830), ("chr15", 613), ("chr16", 873),
+    ("chr17", 1197), ("chr18", 270), ("chr19", 1472), ("chr20", 544),
+    ("chr21", 234), ("chr22", 488), ("chrX", 842), ("chrY", 63),
+]  # fmt: skip
+
+# Seconds of overhead and per targeted megabase
+# of each job, i.e. JVM startup and reading the BAM
+COSTS = {
+    "split": (30, 60),
+    "mutect2": (120, 2400),
+    "mutect": (90, 1200),
+    "strelka": (120, 600),
+    "vardict": (60, 1800),
+    "varscan": (60, 900),
+}
+MERGE = 120
+
+
+def simulate(seed=42, exons=10):
+    """Returns the BED lines of a capture kit with ~exons targets per gene."""
+    rng = random.Random(seed)
+    lines = []
+    for chrom, genes in GENES:
+        position = 10000
+        for _ in range(genes * exons):
+            position += rng.randint(200, 20000)
+            end = position + rng.randint(80, 300)
+            lines.append("{}\t{}\t{}".format(chrom, position, end).encode("utf-8"))
+            position = end
+    return lines
+
+
+def units(intervals, shards):
+    """Targeted megabases of each scatter unit, per chromosome or per shard."""
+    if shards:
+        groups = plan(intervals, shards)
+    else:
+        groups = {}
+        for interval in intervals:
+            groups.setdefault(interval[0], []).append(interval)
+        groups = list(groups.values())
+    return [sum(end - start for _, start, end in g) / 1e6 for g in groups]
+
+
+def cohort(sizes, pairs):
+    """Jobs of the cohort's DAG as (name, seconds, dependencies), in the
+    order they become ready."""
+    jobs = []
+    for pair in range(pairs):
+        splits = []
+        for sample in ("tumor", "normal"):
+            for i, mb in enumerate(sizes):
+                name = "split.{}.{}.{}".format(pair, sample, i)
+                jobs.append((name, COSTS["split"][0] + COSTS["split"][1] * mb, []))
+                splits.append(name)
+        for caller in ("mutect2", "mutect", "strelka", "vardict", "varscan"):
+            calls = []
+            for i, mb in enumerate(sizes):
+                name = "{}.{}.{}".format(caller, pair, i)
+                deps = [
+                    "split.{}.tumor.{}".format(pair, i),
+                    "split.{}.normal.{}".format(pair, i),
+                ]
+                jobs.append((name, COSTS[caller][0] + COSTS[caller][1] * mb, deps))
+                calls.append(name)
+            jobs.append(("merge.{}.{}".format(caller, pair), MERGE, calls))
+    return jobs
+
+
+def critical_path(jobs):
+    """Length of the longest chain of jobs, with unlimited slots."""
+    finish = {}
+    for name, seconds, deps in jobs:
+        finish[name] = max([finish[d] for d in deps] or [0]) + seconds
+    return max(finish.values())
+
+
+def makespan(jobs, slots):
+    """Time to run all jobs on a number of slots, submitting ready jobs in
+    order, like the cluster executor does."""
+    pending = {name: set(deps) for name, _, deps in jobs}
+    dependents = {}
+    for name, _, deps in jobs:
+        for d in deps:
+            dependents.setdefault(d, []).append(name)
+    seconds = {name: s for name, s, _ in jobs}
+    order = {name: i for i, (name, _, _) in enumerate(jobs)}
+    ready = [(order[n], n) for n, deps in pending.items() if not deps]
+    heapq.heapify(ready)
+    running, now = [], 0.0
+    while ready or running:
+        while ready and len(running) < slots:
+            _, name = heapq.heappop(ready)
+            heapq.heappush(running, (now + seconds[name], name))
+        now, done = heapq.heappop(running)
+        for child in dependents.get(done, []):
+            pending[child].discard(done)
+            if not pending[child]:
+                heapq.heappush(ready, (order[child], child))
+    return now
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bed", help="Existing targets BED file")
+    parser.add_argument("--pairs", type=int, default=50)
+    parser.add_argument("--slots", type=int, default=500)
+    parser.add_argument("--shards", type=int, default=48)
+    args = parser.parse_args()
+
+    chroms = [chrom for chrom, _ in GENES]
+    if args.bed:
+        with open(args.bed, "rb") as fh:
+            intervals = read_targets(fh, chroms)
+    else:
+        intervals = read_targets(simulate(), chroms)
+
+    print("scatter\tunits\tmax_unit_mb\tjobs\tcritical_path_h\tmakespan_h")
+    results = []
+    for label, shards in (("chrom", 0), ("shards", args.shards)):
+        sizes = units(intervals, shards)
+        jobs = cohort(sizes, args.pairs)
+        path = critical_path(jobs) / 3600
+        span = makespan(jobs, args.slots) / 3600
+        results.append((path, span))
+        print(
+            "{}\t{}\t{:.2f}\t{}\t{:.2f}\t{:.2f}".format(
+                label, len(sizes), max(sizes), len(jobs), path, span
+            )
+        )
+    (old_path, old_span), (new_path, new_span) = results
+    print(
+        "critical path -{:.0%}, makespan -{:.0%}".format(
+            1 - new_path / old_path, 1 - new_span / old_span
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
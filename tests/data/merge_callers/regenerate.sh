@@ -0,0 +1,28 @@
+#!/usr/bin/env bash
+# Regenerates expected.vcf with GATK3 CombineVariants, as the
+# somatic_merge_callers rule ran it before merge_callers.py,
+# from the same three caller VCFs.
+# Usage:
+#  module load GATK/3.8-1
+#  tests/data/merge_callers/regenerate.sh /path/to/Homo_sapiens_assembly38.fasta
+set -euo pipefail
+
+genome=$1
+data=$(cd "$(dirname "$0")" && pwd)
+tmp=$(mktemp -d)
+trap 'rm -rf "$tmp"' EXIT
+
+java -Xmx4g -Djava.io.tmpdir=${tmp} -jar $GATK_JAR -T CombineVariants \
+    -R ${genome} \
+    -nt 1 \
+    --filteredrecordsmergetype KEEP_IF_ANY_UNFILTERED \
+    --genotypemergeoption PRIORITIZE \
+    --rod_priority_list mutect2,strelka,vardict \
+    --minimumN 1 \
+    -o ${tmp}/expected.vcf \
+    --variant:mutect2 ${data}/mutect2.vcf \
+    --variant:strelka ${data}/strelka.vcf \
+    --variant:vardict ${data}/vardict.vcf
+
+# GATK3 adds the command line and the date of the run
+grep -v '^##GATKCommandLine' ${tmp}/expected.vcf > ${data}/expected.vcf
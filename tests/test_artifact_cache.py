@@ -0,0 +1,79 @@
+import os
+import sys
+import tempfile
+import time
+from xavier.workflow.scripts.artifact_cache import (
+    ArtifactCache,
+    artifact_key,
+    cached_write,
+    run,
+)
+
+
+def test_artifact_cache_run():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = ArtifactCache(os.path.join(tmp_dir, "cache"))
+        targets = os.path.join(tmp_dir, "targets.bed")
+        with open(targets, "w") as fh:
+            fh.write("chr1\t1\t2\n")
+        outputs = [os.path.join(tmp_dir, "out{}.bed".format(i)) for i in range(2)]
+        for output in outputs:
+            copy = "import shutil; shutil.copy('{}', '{}')".format(targets, output)
+            command = [sys.executable, "-c", copy]
+            run(cache, "exome_targets.bed", [targets], output, command)
+        # Built once, then copied from the cache
+        assert (cache.hits, cache.misses) == (1, 1)
+        (key,) = [key for _, _, key in cache.entries()]
+        artifact = os.path.join(cache.entry(key), "exome_targets.bed")
+        assert not os.path.samefile(outputs[1], artifact)
+        assert open(outputs[1]).read() == "chr1\t1\t2\n"
+        assert not os.stat(artifact).st_mode & 0o222
+        # A hit refreshes the entry, but not the outputs of other runs
+        os.utime(cache.entry(key), (0, 0))
+        os.utime(outputs[1], (0, 0))
+        third = os.path.join(tmp_dir, "out2.bed")
+        run(cache, "exome_targets.bed", [targets], third, command)
+        assert os.path.getmtime(cache.entry(key)) > time.time() - 60
+        assert os.path.getmtime(outputs[1]) == 0
+        # Outputs holding the artifact are left untouched
+        run(cache, "exome_targets.bed", [targets], outputs[1], command)
+        assert os.path.getmtime(outputs[1]) == 0
+
+
+def test_artifact_cache_eviction():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = ArtifactCache(os.path.join(tmp_dir, "cache"), max_size=10)
+        intervals = os.path.join(tmp_dir, "intervals.list")
+        assert not cached_write(cache, "intervals.list", b"chr1\nchr2", intervals)
+        assert cached_write(cache, "intervals.list", b"chr1\nchr2", intervals)
+        # Over the size cap, but used within the grace period
+        other = os.path.join(tmp_dir, "other.list")
+        cached_write(cache, "intervals.list", b"chrX\nchrY", other)
+        assert len(cache.entries()) == 2
+        # Unused entries are evicted least recently used first
+        old = artifact_key("intervals.list", contents=[b"chr1\nchr2"])
+        os.utime(cache.entry(old), (time.time() - 8 * 86400,) * 2)
+        assert cache.evict() == [old] and len(cache.entries()) == 1
+        assert open(intervals).read() == "chr1\nchr2"
+
+
+def test_artifact_cache_replace():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = ArtifactCache(os.path.join(tmp_dir, "cache"), max_size=10, grace_days=0)
+        intervals = os.path.join(tmp_dir, "intervals.list")
+        assert not cached_write(cache, "intervals.list", b"chr1\nchr2", intervals)
+        # Link of an older version, rebuilt without writing through it
+        (key,) = [key for _, _, key in cache.entries()]
+        os.remove(intervals)
+        os.symlink(os.path.join(cache.entry(key), "intervals.list"), intervals)
+        assert not cached_write(cache, "intervals.list", b"chrX\nchrY", intervals)
+        assert not os.path.islink(intervals)
+        assert open(intervals).read() == "chrX\nchrY"
+        # Copies outlive the eviction of their entry
+        other = os.path.join(tmp_dir, "other.list")
+        assert cached_write(cache, "intervals.list", b"chrX\nchrY", other)
+        cached_write(cache, "intervals.list", b"chr3\nchr4", intervals)
+        assert len(cache.entries()) == 1
+        assert open(other).read() == "chrX\nchrY"
+        assert cached_write(cache, "intervals.list", b"chr3\nchr4", other)
+        assert open(other).read() == "chr3\nchr4"
@@ -0,0 +1,71 @@
+import multiprocessing
+import os
+import stat
+import tempfile
+
+from xavier.src.xavier.cache import (
+    pull_images,
+    read_manifest,
+    sif_name,
+    update_manifest,
+    verify_cache,
+)
+
+# Writes the URI to the output file, like singularity pull -F OUTPUT URI
+SINGULARITY = """#!/bin/sh
+case "$4" in *missing*) echo "FATAL: manifest unknown" >&2; exit 255;; esac
+printf '%s' "$4" > "$3"
+"""
+
+
+def fake_singularity(tmp_dir):
+    singularity = os.path.join(tmp_dir, "singularity")
+    with open(singularity, "w") as fh:
+        fh.write(SINGULARITY)
+    os.chmod(singularity, os.stat(singularity).st_mode | stat.S_IEXEC)
+    return singularity
+
+
+def test_pull_images():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sif_cache = os.path.join(tmp_dir, "sifs")
+        os.makedirs(sif_cache)
+        uris = [
+            "docker://nciccbr/ccbr_picard:v0.0.1",
+            "docker://nciccbr/ccbr_python:v0.0.1",
+        ]
+        missing = "docker://nciccbr/missing:v1"
+        assert verify_cache(sif_cache, uris) == ({}, uris)
+        pulled, failed = pull_images(
+            uris + [missing],
+            sif_cache,
+            threads=3,
+            singularity=fake_singularity(tmp_dir),
+            retries=0,
+        )
+        assert sorted(pulled) == sorted(uris) and list(failed) == [missing]
+        # Only the renamed SIFs, the manifest, and its lock are left behind
+        assert sorted(os.listdir(sif_cache)) == sorted(
+            [sif_name(uri) for uri in uris] + ["manifest.json", ".manifest.json.lock"]
+        )
+        manifest = read_manifest(sif_cache)
+        assert manifest["ccbr_picard_v0.0.1.sif"]["size"] == len(uris[0])
+        cached, missing_uris = verify_cache(sif_cache, uris + [missing])
+        assert cached == {uri: os.path.join(sif_cache, sif_name(uri)) for uri in uris}
+        assert missing_uris == [missing]
+        # A deleted SIF is caught by the directory listing
+        os.remove(os.path.join(sif_cache, "ccbr_python_v0.0.1.sif"))
+        assert verify_cache(sif_cache, uris, listing=True)[1] == [uris[1]]
+
+
+def _update(args):
+    sif_cache, i = args
+    update_manifest(sif_cache, {"{}.sif".format(i): {"size": i}})
+
+
+def test_update_manifest():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Concurrent xavier cache jobs keep each other's records
+        with multiprocessing.Pool(8) as pool:
+            pool.map(_update, [(tmp_dir, i) for i in range(200)])
+        assert len(read_manifest(tmp_dir)) == 200
@@ -0,0 +1,53 @@
+import os
+import tempfile
+from xavier.workflow.scripts.checksum_cache import ChecksumCache, default_path
+
+
+def test_checksum_cache_hits():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fastq = os.path.join(tmp_dir, "sample.R1.fastq.gz")
+        with open(fastq, "w") as fh:
+            fh.write("@read\nACGT\n+\nFFFF\n")
+        path = default_path(tmp_dir)
+        cache = ChecksumCache(path)
+        md5 = cache.md5sum(fastq)
+        # New instance reads the records back from disk
+        cache = ChecksumCache(path)
+        assert cache.md5sum(fastq) == md5
+        assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_checksum_cache_stale():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fastq = os.path.join(tmp_dir, "sample.R1.fastq.gz")
+        with open(fastq, "w") as fh:
+            fh.write("@read\nACGT\n+\nFFFF\n")
+        cache = ChecksumCache(default_path(tmp_dir))
+        cache.put(fastq, md5="stale")
+        with open(fastq, "a") as fh:
+            fh.write("@read\nACGT\n+\nFFFF\n")
+        assert cache.get(fastq) is None
+        assert cache.md5sum(fastq) != "stale"
+        os.remove(fastq)
+        cache.compact()
+        assert ChecksumCache(cache.path).get(fastq, field="path") is None
+
+
+def test_checksum_cache_compact_concurrent():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fastqs = []
+        for name in ("a", "b"):
+            fastqs.append(os.path.join(tmp_dir, name + ".R1.fastq.gz"))
+            with open(fastqs[-1], "w") as fh:
+                fh.write("@" + name + "\nACGT\n+\nFFFF\n")
+        path = default_path(tmp_dir)
+        first = ChecksumCache(path)
+        first.md5sum(fastqs[0])
+        # Appended by another run after the first loaded the cache
+        ChecksumCache(path).md5sum(fastqs[1])
+        first.compact()
+        assert not [f for f in os.listdir(os.path.dirname(path)) if f.endswith(".tmp")]
+        cache = ChecksumCache(path)
+        assert all(cache.get(fastq) for fastq in fastqs)
+        with open(path) as fh:
+            assert len(fh.readlines()) == 2
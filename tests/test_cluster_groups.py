@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from xavier.workflow.scripts.cluster_groups import (
+    check,
+    groups,
+    job_stats,
+    load,
+    parse_time,
+    simulate,
+    snakemake_args,
+)
+
+CLUSTER = {
+    "__default__": {"threads": "4", "mem": "8g", "time": "2:00:00"},
+    "samtools_flagstats": {"group": "qc_sample", "runtime": "0:05:00"},
+    "bcftools_stats": {"group": "qc_sample", "runtime": "0:02:00"},
+    "qc_sample": {"threads": "8", "mem": "32G", "time": "4:00:00", "pack": "1:00:00"},
+    "bwa_mem": {"threads": "32", "mem": "64G", "time": "1-00:00:00"},
+}
+
+DRYRUN = """Building DAG of jobs...
+Job stats:
+job                   count
+------------------  -------
+all                       1
+bcftools_stats           20
+bwa_mem                  10
+samtools_flagstats       10
+total                    41
+
+[Mon Oct 12 10:00:00 2026]
+rule bwa_mem:
+"""
+
+
+def test_parse_time():
+    assert parse_time("30") == 30
+    assert parse_time("0:02:30") == 2.5
+    assert parse_time("4:00:00") == 240
+    assert parse_time("2-00:00:00") == 2 * 24 * 60
+    assert parse_time("1-12") == 36 * 60
+
+
+def test_snakemake_args():
+    assert snakemake_args(CLUSTER) == [
+        "--groups",
+        "bcftools_stats=qc_sample",
+        "samtools_flagstats=qc_sample",
+        "--group-components",
+        "qc_sample=12",
+    ]
+    assert snakemake_args({"bwa_mem": CLUSTER["bwa_mem"]}) == []
+    with pytest.raises(ValueError, match="no runtime"):
+        snakemake_args({"qc_sample": {}, "snpeff": {"group": "qc_sample"}})
+
+
+def test_simulate(tmp_path):
+    dryrun = tmp_path / "dryrun.log"
+    dryrun.write_text(DRYRUN)
+    jobs = job_stats(str(dryrun))
+    assert jobs == {
+        "all": 1,
+        "bcftools_stats": 20,
+        "bwa_mem": 10,
+        "samtools_flagstats": 10,
+    }
+    rows = dict((row["name"], row) for row in simulate(CLUSTER, jobs, local=["all"]))
+    assert rows["qc_sample"]["submissions"] == 30 and rows["qc_sample"]["short"] == 20
+    # 12 jobs of at most 5 minutes per submission
+    assert rows["qc_sample"]["grouped"] == 3 and rows["qc_sample"]["grouped_short"] == 0
+    assert rows["bwa_mem"]["grouped"] == 10
+    assert rows["total"]["submissions"] == 40 and rows["total"]["grouped"] == 13
+    assert rows["total"]["grouped_queue_hours"] == pytest.approx(13 * 10 / 60.0)
+
+
+def test_check():
+    # 12 jobs of 4 threads and 8G in parallel
+    info = groups(CLUSTER)["qc_sample"]
+    assert (info["components"], info["threads"], info["mem"]) == (12, 48, 96)
+    assert check(CLUSTER) == [
+        "Group qc_sample requests 8 threads and 32G, its 12 parallel jobs "
+        "need 48 threads and 96G"
+    ]
+    sized = dict(CLUSTER, qc_sample=dict(CLUSTER["qc_sample"], pack="0:10:00"))
+    assert check(sized) == []
+    config = os.path.join(os.path.dirname(__file__), os.pardir, "config")
+    for name in ("cluster.biowulf.json", "cluster.frce.json"):
+        assert check(load(os.path.join(config, name))) == []
@@ -0,0 +1,59 @@
+import os
+import tempfile
+
+import pytest
+
+from xavier.src.xavier.executor import SnakemakeWorkflow
+
+SNAKEFILE = """
+configfile: "config.json"
+rule all:
+    input: expand("out/{sample}.txt", sample=config["samples"])
+rule touch:
+    output: "out/{sample}.txt"
+    shell: "echo {wildcards.sample} > {output}"
+"""
+
+
+def test_snakemake_workflow(tmp_path, monkeypatch):
+    # Nothing is written to the working directory of the caller
+    cwd = tmp_path / "cwd"
+    cwd.mkdir()
+    monkeypatch.chdir(cwd)
+    monkeypatch.setenv("XAVIER_TEST_KEPT", "1")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.makedirs(os.path.join(tmp_dir, "workflow"))
+        with open(os.path.join(tmp_dir, "workflow", "Snakefile"), "w") as fh:
+            fh.write(SNAKEFILE)
+        with open(os.path.join(tmp_dir, "config.json"), "w") as fh:
+            fh.write('{"samples": ["s1", "s2"]}')
+        workflow = SnakemakeWorkflow(tmp_dir, env={"XAVIER_TEST_SET": "1"})
+        dryrun_output = workflow.dryrun().decode("utf-8")
+        assert "This was a dry-run" in dryrun_output
+        assert not os.path.exists(os.path.join(tmp_dir, "out"))
+        parsed = workflow.workflow
+        with open(os.path.join(tmp_dir, "snakemake.log"), "w") as logger:
+            assert workflow.execute(logger).wait() == 0
+        # The workflow is only parsed once
+        assert workflow.workflow is parsed
+        assert sorted(os.listdir(os.path.join(tmp_dir, "out"))) == ["s1.txt", "s2.txt"]
+        with open(os.path.join(tmp_dir, "snakemake.log")) as fh:
+            assert "Finished job" in fh.read()
+        assert os.listdir(os.path.join(tmp_dir, ".snakemake", "log"))
+    assert os.getcwd() == str(cwd)
+    assert os.listdir(str(cwd)) == []
+    # Only the variables set by the workflow are restored
+    assert "XAVIER_TEST_SET" not in os.environ
+    assert os.environ["XAVIER_TEST_KEPT"] == "1"
+
+
+def test_snakemake_workflow_interrupt(tmp_path, monkeypatch):
+    workflow = SnakemakeWorkflow(str(tmp_path))
+
+    def interrupt():
+        raise KeyboardInterrupt()
+
+    # Ctrl-C stops xavier run instead of failing the workflow
+    monkeypatch.setattr(workflow, "_load", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        workflow.dryrun()
@@ -0,0 +1,158 @@
+import gzip
+import hashlib
+import os
+import random
+import struct
+import zlib
+
+import pytest
+
+from xavier.workflow.scripts.get_flowcell_lanes import (
+    _consume,
+    _inflate_external,
+    _summary,
+    _tee,
+    get_flowcell_lane,
+    is_bgzf,
+    sample,
+    scan,
+)
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def fastq(lanes, reads, seed=1):
+    """Returns FastQ records with Casava >= 1.8 identifiers, one lane after another."""
+    rand = random.Random(seed)
+    records = []
+    for lane in lanes:
+        for i in range(reads):
+            seq = "".join(rand.choices("ACGT", k=100))
+            qual = "".join(rand.choices("AFJ", k=100))
+            records.append(
+                "@J00170:88:HNYVJBBXX:{}:1101:{}:1244 1:N:0:ACTTGA\n{}\n+\n{}\n".format(
+                    lane, i, seq, qual
+                )
+            )
+    return "".join(records).encode()
+
+
+def bgzf(data, size=65280):
+    """Returns data compressed in BGZF blocks, like bgzip, and the EOF block."""
+    blocks = []
+    for start in range(0, len(data), size):
+        chunk = data[start : start + size]
+        deflate = zlib.compressobj(6, zlib.DEFLATED, -15)
+        cdata = deflate.compress(chunk) + deflate.flush()
+        header = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+        blocks.append(header + struct.pack("<H", 18 + len(cdata) + 8 - 1))
+        blocks.append(
+            cdata + struct.pack("<II", zlib.crc32(chunk) & 0xFFFFFFFF, len(chunk))
+        )
+    blocks.append(
+        b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00"
+        b"\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+    )
+    return b"".join(blocks)
+
+
+def baseline(filename):
+    """Reads, flowcell_lanes, and md5 as computed by the original line by line parser."""
+    fc_lanes, nlines = set(), 0
+    with gzip.open(filename, "rt") as fh:
+        for i, line in enumerate(fh):
+            if i % 4 == 0:
+                fc, lane = get_flowcell_lane(line.strip())
+                fc_lanes.add("{}_{}".format(fc.lstrip("@"), lane))
+            nlines += 1
+    with open(filename, "rb") as fh:
+        md5 = hashlib.md5(fh.read()).hexdigest()
+    return nlines // 4, fc_lanes, md5
+
+
+@pytest.mark.parametrize(
+    "name, reads, fc, md5",
+    [
+        # Output of the original script
+        ("WES_NC_N_1_sub.R1", 57442, "SRR7890845", "71c7cbfdb5a761dca05b46e8aeea2e8b"),
+        ("WES_NC_N_1_sub.R2", 57442, "SRR7890845", "43aa60b0f4d66d157b9ca93e6c42c57e"),
+        ("WES_NC_T_1_sub.R1", 54923, "SRR7890844", "e5e95d258b5bb62eb2759cd611b7b3f5"),
+        ("WES_NC_T_1_sub.R2", 54923, "SRR7890844", "399db46a85ac92a500569be3b1a21667"),
+    ],
+)
+def test_scan(name, reads, fc, md5):
+    filename = os.path.join(DATA, name + ".fastq.gz")
+    # Small blocks split records and lines across chunks
+    for blocksize in (4194304, 1000):
+        meta = scan(filename, blocksize=blocksize)
+        assert meta["reads"] == reads
+        # SRA identifiers without a flowcell or lane
+        assert meta["flowcell"] == meta["lane"] == set([fc])
+        assert meta["flowcell_lane"] == set([fc + "_" + fc])
+        assert meta["md5"] == md5
+
+
+def test_scan_multi_member(tmp_path):
+    filename = str(tmp_path / "sample.R1.fastq.gz")
+    data = fastq(["1", "2", "3"], 500)
+    # Concatenated FastQ files, members split mid-record
+    with open(filename, "wb") as fh:
+        for start in range(0, len(data), 70001):
+            fh.write(gzip.compress(data[start : start + 70001]))
+    reads, fc_lanes, md5 = baseline(filename)
+    assert reads == 1500
+    for blocksize in (4194304, 4096, 17):
+        meta = scan(filename, blocksize=blocksize)
+        assert meta["reads"] == reads
+        assert meta["flowcell"] == set(["HNYVJBBXX"])
+        assert meta["lane"] == set(["1", "2", "3"])
+        assert meta["flowcell_lane"] == fc_lanes
+        assert meta["md5"] == md5
+
+
+def test_inflate_external(tmp_path):
+    filename = str(tmp_path / "sample.R1.fastq.gz")
+    with open(filename, "wb") as fh:
+        fh.write(gzip.compress(fastq(["1"], 300)))
+        fh.write(gzip.compress(fastq(["2"], 200, seed=2)))
+    reads, fc_lanes, md5 = baseline(filename)
+    # gzip -d -c takes the place of igzip and pigz
+    hasher, pairs = hashlib.md5(), set()
+    with open(filename, "rb") as fh:
+        blocks = _tee(fh, hasher, 4096)
+        nlines, exhausted = _consume(_inflate_external(blocks, "gzip", 4096), pairs)
+    meta = _summary(pairs, nlines // 4, hasher.hexdigest())
+    assert exhausted and meta["reads"] == reads == 500
+    assert meta["flowcell_lane"] == fc_lanes
+    assert meta["md5"] == md5
+
+
+def test_sample_bgzf(tmp_path):
+    filename = str(tmp_path / "sample.R1.fastq.gz")
+    # Lanes 2-4 only appear after the sampled prefix
+    with open(filename, "wb") as fh:
+        fh.write(bgzf(fastq(["1", "2", "3", "4"], 3000)))
+    assert is_bgzf(filename)
+    exact = scan(filename)
+    meta = sample(filename, reads=1000, windows=16)
+    assert meta["flowcell"] == exact["flowcell"]
+    assert meta["lane"] == exact["lane"] == set(["1", "2", "3", "4"])
+    assert meta["flowcell_lane"] == exact["flowcell_lane"]
+    assert abs(meta["reads"] - exact["reads"]) <= 0.1 * exact["reads"]
+    assert meta["md5"] is None
+    # Whole file in the prefix
+    assert sample(filename, reads=20000) == exact
+
+
+def test_sample_gzip(tmp_path):
+    filename = str(tmp_path / "sample.R1.fastq.gz")
+    with open(filename, "wb") as fh:
+        fh.write(gzip.compress(fastq(["1", "2", "3", "4"], 3000)))
+    assert not is_bgzf(filename)
+    exact = scan(filename)
+    # Falls back to the prefix, no windows
+    meta = sample(filename, reads=1000, windows=16)
+    assert "1" in meta["lane"] and "4" not in meta["lane"]
+    assert abs(meta["reads"] - exact["reads"]) <= 0.1 * exact["reads"]
+    assert meta["md5"] is None
+    assert sample(filename, reads=20000) == exact
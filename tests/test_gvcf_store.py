@@ -0,0 +1,80 @@
+import json
+import os
+
+from xavier.workflow.scripts.gvcf_store import (
+    import_plan,
+    new_samples,
+    stored_samples,
+    workspace_samples,
+)
+
+
+def test_stored_samples(tmp_path):
+    for sample, units in (
+        ("S1", ["chr1", "chr2"]),
+        ("S.2", ["chr1", "chr2"]),
+        # Missing the gVCF of chr2
+        ("S3", ["chr1"]),
+    ):
+        for unit in units:
+            (tmp_path / "{}.{}.g.vcf.gz".format(sample, unit)).write_bytes(b"")
+            (tmp_path / "{}.{}.g.vcf.gz.tbi".format(sample, unit)).write_bytes(b"")
+    # Without an index, the gVCF is incomplete
+    (tmp_path / "S4.chr1.g.vcf.gz").write_bytes(b"")
+    assert stored_samples(str(tmp_path), ["chr1", "chr2"]) == ["S.2", "S1"]
+    assert stored_samples(str(tmp_path / "missing"), ["chr1"]) == []
+
+
+def test_new_samples(tmp_path):
+    workspace = tmp_path / "chr1"
+    sample_map = tmp_path / "chr1.sample_map"
+    sample_map.write_text("S1\tS1.chr1.g.vcf.gz\nS2\tS2.chr1.g.vcf.gz\n")
+    # No workspace yet, all samples are imported
+    assert workspace_samples(str(workspace)) == set()
+    assert len(new_samples(str(sample_map), str(workspace))) == 2
+
+    workspace.mkdir()
+    (workspace / "callset.json").write_text(
+        json.dumps(
+            {"callsets": [{"sample_name": "S1", "row_idx": 0, "idx_in_file": 0}]}
+        )
+    )
+    assert workspace_samples(str(workspace)) == {"S1"}
+    assert new_samples(str(sample_map), str(workspace)) == ["S2\tS2.chr1.g.vcf.gz\n"]
+
+
+def test_import_plan(tmp_path):
+    workspace = tmp_path / "chr1"
+    complete = tmp_path / "chr1.complete"
+    sample_map = tmp_path / "chr1.sample_map"
+    gvcfs = dict((s, tmp_path / "{}.chr1.g.vcf.gz".format(s)) for s in ("S1", "S2"))
+    for gvcf in gvcfs.values():
+        gvcf.write_bytes(b"")
+        os.utime(str(gvcf), (1000, 1000))
+    sample_map.write_text("".join("{}\t{}\n".format(s, g) for s, g in gvcfs.items()))
+    workspace.mkdir()
+    (workspace / "callset.json").write_text(
+        json.dumps({"callsets": [{"sample_name": "S1"}]})
+    )
+    # Interrupted import, without its completion marker
+    assert import_plan(str(sample_map), str(workspace))[0] == "create"
+    complete.write_bytes(b"")
+    action, lines = import_plan(str(sample_map), str(workspace))
+    assert action == "update" and lines == ["S2\t{}\n".format(gvcfs["S2"])]
+    # Always rebuilt outside a store
+    assert import_plan(str(sample_map), str(workspace), rebuild=True)[0] == "create"
+    # The gVCF of an imported sample was called again
+    os.utime(str(gvcfs["S1"]), None)
+    os.utime(str(complete), (2000, 2000))
+    assert import_plan(str(sample_map), str(workspace))[0] == "create"
+    os.utime(str(complete), None)
+    # A sample was removed from the cohort
+    (workspace / "callset.json").write_text(
+        json.dumps({"callsets": [{"sample_name": "S1"}, {"sample_name": "S3"}]})
+    )
+    action, lines = import_plan(str(sample_map), str(workspace))
+    assert action == "create" and len(lines) == 2
+    (workspace / "callset.json").write_text(
+        json.dumps({"callsets": [{"sample_name": "S1"}, {"sample_name": "S2"}]})
+    )
+    assert import_plan(str(sample_map), str(workspace)) == ("none", [])
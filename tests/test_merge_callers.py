@@ -0,0 +1,59 @@
+import gzip
+import io
+import os
+import shutil
+
+import pytest
+
+from xavier.workflow.scripts.merge_callers import merge, read_contigs
+
+DATA = os.path.join(os.path.dirname(__file__), "data", "merge_callers")
+PRIORITY = ["mutect2", "strelka", "vardict"]
+
+
+def records(lines):
+    return [line for line in lines if not line.startswith("#")]
+
+
+def test_merge_golden(tmp_path):
+    # Merged records of CombineVariants --filteredrecordsmergetype
+    # KEEP_IF_ANY_UNFILTERED --genotypemergeoption PRIORITIZE
+    # --rod_priority_list mutect2,strelka,vardict; derived from its
+    # merge rules, see tests/data/merge_callers/regenerate.sh to
+    # regenerate them with GATK3
+    mutect2 = str(tmp_path / "mutect2.vcf.gz")
+    with open(os.path.join(DATA, "mutect2.vcf"), "rb") as src:
+        with gzip.open(mutect2, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+    output = io.StringIO()
+    nrecords = merge(
+        [
+            ("vardict", os.path.join(DATA, "vardict.vcf")),
+            ("mutect2", mutect2),
+            ("strelka", os.path.join(DATA, "strelka.vcf")),
+        ],
+        PRIORITY,
+        read_contigs(os.path.join(DATA, "genome.fa")),
+        output,
+    )
+    with open(os.path.join(DATA, "expected.vcf")) as fh:
+        expected = fh.read().splitlines(True)
+    merged = output.getvalue().splitlines(True)
+    assert nrecords == 7
+    assert records(merged) == records(expected)
+    assert merged[-8].startswith("#CHROM") and merged[-8].endswith(
+        "NORMAL_1\tTUMOR_1\n"
+    )
+    assert '##INFO=<ID=set,Number=1,Type=String,Description="Source VCF' in "".join(
+        merged
+    )
+
+
+def test_merge_priority():
+    with pytest.raises(ValueError, match="not in the priority list"):
+        merge(
+            [("mutect", os.path.join(DATA, "mutect2.vcf"))],
+            PRIORITY,
+            read_contigs(os.path.join(DATA, "genome.fa")),
+            io.StringIO(),
+        )
@@ -0,0 +1,33 @@
+from xavier.workflow.scripts.normalize_bed import normalize
+
+# Input and output of the previous reformat_bed.py | correct_target_bed.py chain
+TARGETS = b"""track name=targets
+chr1\t0100\t200\tA
+chr1\t100\t200\tB
+chr1\t100\t150\tC
+chr1\t101\t150\tD
+chr1\t1.5\t9\tE
+chr1\tx\t9\tF
+chr1\t-5\t9
+chr1\t 7\t9\tG
+chr1\t100\t200\tH
+Chr1\t3\t4
+chr1\t100\t300\tI,J
+"""
+
+EXPECTED = b"""Chr1\t3\t4\t.\t0\t.
+chr1\t-5\t9\t.\t0\t.
+chr1\tx\t9\tF\t0\t.
+chr1\t1.5\t9\tE\t0\t.
+chr1\t 7\t9\tG\t0\t.
+chr1\t0100\t200\tA\t0\t.
+chr1\t100\t200\tB,H\t0,0\t.
+chr1\t101\t150\tD\t0\t.
+chr1\t101\t300\tI,J\t0\t.
+"""
+
+
+def test_normalize_bed():
+    lines, stats = normalize(TARGETS.splitlines(True))
+    assert b"".join(line + b"\n" for line in lines) == EXPECTED
+    assert stats == {"regions": 9, "skipped": 1, "shifted": 1}
@@ -0,0 +1,100 @@
+import json
+import os
+
+from xavier.workflow.scripts.plan_scatter import plan, plan_targets, read_targets
+
+TARGETS = b"""track name=targets
+chr2\t100\t200\tA
+chr1\t500\t600\tB
+chr1\t550\t700\tC
+chr1\t700\t800\tD
+chrUn\t0\t1000\tE
+chr1\t0\t100\tF
+chr2\t1000\t1900\tG
+"""
+
+
+def test_read_targets():
+    intervals = read_targets(TARGETS.splitlines(True), ["chr1", "chr2"])
+    assert intervals == [
+        ("chr1", 0, 100),
+        ("chr1", 500, 800),
+        ("chr2", 100, 200),
+        ("chr2", 1000, 1900),
+    ]
+
+
+def test_plan():
+    intervals = read_targets(TARGETS.splitlines(True), ["chr1", "chr2"])
+    shards = plan(intervals, 4)
+    sizes = [sum(end - start for _, start, end in shard) for shard in shards]
+    # 1400 bp in 4 shards, chr2:1000-1900 is longer than a shard and split
+    assert sizes == [400, 400, 300, 300]
+    assert shards[2:] == [[("chr2", 1300, 1600)], [("chr2", 1600, 1900)]]
+    flat = [interval for shard in shards for interval in shard]
+    assert sum(end - start for _, start, end in flat) == 1400
+    for (c1, _, e1), (c2, s2, _) in zip(flat, flat[1:]):
+        assert c1 != c2 or e1 <= s2
+    assert len(plan(intervals, 100)) <= 100
+
+
+def test_plan_targets(tmp_path):
+    targets = tmp_path / "targets.bed"
+    targets.write_bytes(TARGETS)
+    outdir = str(tmp_path / "scatter")
+    names = plan_targets(str(targets), outdir, 2, ["chr1", "chr2"])
+    assert names == ["0001-of-0002", "0002-of-0002"]
+    beds = [os.path.join(outdir, name + ".bed") for name in names]
+    assert open(beds[0]).read() == "chr1\t0\t100\nchr1\t500\t800\nchr2\t100\t200\n"
+    # Re-used as long as the targets, shards, and chroms are unchanged
+    os.utime(beds[0], ns=(0, 0))
+    assert plan_targets(str(targets), outdir, 2, ["chr1", "chr2"]) == names
+    assert os.stat(beds[0]).st_mtime_ns == 0
+    assert plan_targets(str(targets), outdir, 3, ["chr1", "chr2"])[-1] == "0003-of-0003"
+    with open(os.path.join(outdir, "scatter.json")) as fh:
+        assert [s["bp"] for s in json.load(fh)["shards"]] == [500, 450, 450]
+
+
+def test_plan_targets_by_chrom(tmp_path):
+    targets = tmp_path / "targets.bed"
+    targets.write_bytes(TARGETS)
+    outdir = str(tmp_path / "scatter")
+    assert plan_targets(str(targets), outdir, 0, ["chr1", "chr2", "chrX"]) == [
+        "chr1",
+        "chr2",
+        "chrX",
+    ]
+    # Targets of each chromosome, unchanged
+    with open(os.path.join(outdir, "chr2.bed")) as fh:
+        assert fh.read() == "chr2\t100\t200\tA\nchr2\t1000\t1900\tG\n"
+    assert os.path.getsize(os.path.join(outdir, "chrX.bed")) == 0
+
+
+def test_plan_targets_padding(tmp_path):
+    targets = tmp_path / "targets.bed"
+    targets.write_bytes(TARGETS)
+    lengths = {"chr1": 10000, "chr2": 1950}
+    intervals = read_targets(TARGETS.splitlines(True), ["chr1", "chr2"], 100, lengths)
+    # Padded before merging, clipped to the chromosome ends
+    assert intervals == [
+        ("chr1", 0, 200),
+        ("chr1", 400, 900),
+        ("chr2", 0, 300),
+        ("chr2", 900, 1950),
+    ]
+    outdir = str(tmp_path / "scatter")
+    names = plan_targets(str(targets), outdir, 3, ["chr1", "chr2"], 100, lengths)
+    shards = []
+    for name in names:
+        with open(os.path.join(outdir, name + ".bed")) as fh:
+            shards.extend(tuple(line.split("\t")) for line in fh.read().splitlines())
+    # Shards cover the padded targets once, without overlaps
+    assert sum(int(end) - int(start) for _, start, end in shards) == 2050
+    for (c1, _, e1), (c2, s2, _) in zip(shards, shards[1:]):
+        assert c1 != c2 or int(e1) <= int(s2)
+    # Re-planned when the padding changes
+    with open(os.path.join(outdir, "scatter.json")) as fh:
+        key = json.load(fh)["key"]
+    plan_targets(str(targets), outdir, 3, ["chr1", "chr2"], 0)
+    with open(os.path.join(outdir, "scatter.json")) as fh:
+        assert json.load(fh)["key"] != key
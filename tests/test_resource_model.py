@@ -0,0 +1,155 @@
+import json
+import os
+
+from xavier.workflow.scripts.resource_model import (
+    fit,
+    history,
+    parse_mem,
+    sample_bytes,
+    tune,
+    tune_file,
+)
+
+DATA = os.path.join(os.path.dirname(__file__), "data", "resource_model")
+GB = 1024**3
+
+
+def inputs(workdir, sizes):
+    for sample, gb in sizes.items():
+        for read in ("R1", "R2"):
+            with open(
+                os.path.join(str(workdir), sample + "." + read + ".fastq.gz"), "wb"
+            ) as fh:
+                fh.truncate(int(gb * GB / 2))
+
+
+def records(tmp_path):
+    # Past run of 1 to 4 GB samples, see tests/data/resource_model
+    inputs(tmp_path, {"S1": 1, "S2": 2, "S3": 3, "S4": 4})
+    return history(
+        os.path.join(DATA, "cluster_stats.tsv"),
+        os.path.join(DATA, "snakemake.log"),
+        str(tmp_path),
+    )
+
+
+def test_parse_mem():
+    assert parse_mem("12.50G") == 12.5
+    assert parse_mem("32Gn") == 32
+    assert parse_mem("512M") == 0.5
+    assert parse_mem("") is None
+
+
+def test_history(tmp_path):
+    jobs = records(tmp_path)
+    assert len(jobs) == 14
+    assert jobs[0] == {
+        "rule": "bwa_mem",
+        "sample": "S1",
+        "bytes": GB,
+        "mem": 10.0,
+        "minutes": 60.0,
+        "state": "COMPLETED",
+    }
+    assert [j["state"] for j in jobs if j["rule"] == "strelka"].count(
+        "OUT_OF_MEMORY"
+    ) == 1
+    # Group jobs are named GROUP.*, their group is read from the snakemake log
+    assert [(j["rule"], j["sample"]) for j in jobs[-3:]] == [
+        ("qc_sample", "S1"),
+        ("qc_sample", "S2"),
+        ("qc_sample", "S3"),
+    ]
+
+
+def test_sample_bytes(tmp_path):
+    inputs(tmp_path, {"S1": 1})
+    bams = tmp_path / "input_files" / "bam"
+    bams.mkdir(parents=True)
+    # Written by gatk_recal for FastQ runs, and for BAM runs
+    for sample, gb in (("S1", 2), ("B1", 3)):
+        with open(str(bams / (sample + ".input.bam")), "wb") as fh:
+            fh.truncate(gb * GB)
+    assert sample_bytes(str(tmp_path)) == {"S1": GB, "B1": 3 * GB}
+
+
+def test_fit(tmp_path):
+    model = fit(records(tmp_path))
+    # Too few kraken jobs
+    assert sorted(model) == ["bwa_mem", "qc_sample", "strelka"]
+    # 6G plus 4G per input GB
+    assert abs(model["bwa_mem"]["mem"]["intercept"] - 6) < 1e-6
+    assert abs(model["bwa_mem"]["mem"]["slope"] - 4) < 1e-6
+    assert model["strelka"]["mem"]["slope"] == 0 and model["strelka"]["out_of_memory"]
+
+
+def test_tune(tmp_path):
+    model = fit(records(tmp_path))
+    cluster = {
+        "__default__": {"threads": "4", "mem": "16G", "time": "2-00:00:00"},
+        "bwa_mem": {"threads": "24", "mem": "100G"},
+        "strelka": {"threads": "16", "time": "16:00:00", "mem": "32G"},
+        "kraken": {"mem": "64G"},
+    }
+    tuned = tune(cluster, model)
+    # 22G for a 4 GB sample, with a 25% margin
+    assert tuned["bwa_mem"] == {"threads": "24", "mem": "28G", "time": "5:00:00"}
+    # Ran out of memory, never lowered
+    assert tuned["strelka"]["mem"] == "32G" and tuned["strelka"]["time"] == "1:15:00"
+    assert tuned["kraken"] == {"mem": "64G"}
+    # Scaled to the largest sample of a new run
+    assert tune(cluster, model, {"S9": 10 * GB})["bwa_mem"]["mem"] == "58G"
+
+
+def test_tune_groups(tmp_path):
+    model = fit(records(tmp_path))
+    # Grouped with qc_sample in this run
+    model["samtools_flagstats"] = model["bwa_mem"]
+    # Job name of group jobs, see history()
+    model["GROUP"] = model["strelka"]
+    cluster = {
+        "__default__": {"threads": "4", "mem": "16G", "time": "2-00:00:00"},
+        "fastqc_bam": {"group": "qc_sample", "runtime": "0:10:00", "mem": "8G"},
+        "samtools_flagstats": {"group": "qc_sample", "runtime": "0:05:00"},
+        "qc_sample": {
+            "threads": "16",
+            "mem": "4G",
+            "time": "4:00:00",
+            "pack": "1:00:00",
+        },
+    }
+    tuned = tune(cluster, model)
+    assert "GROUP" not in tuned
+    # sbatch reads the memory of the group, not of its jobs
+    assert tuned["fastqc_bam"] == cluster["fastqc_bam"]
+    assert tuned["samtools_flagstats"] == {
+        "group": "qc_sample",
+        "runtime": "5:00:00",
+    }
+    # One 5 hour job per submission, raised to the 28G of samtools_flagstats
+    # over the 10G of qc_sample
+    assert tuned["qc_sample"] == {
+        "threads": "16",
+        "mem": "28G",
+        "time": "4:00:00",
+        "pack": "1:00:00",
+    }
+    # 6 jobs of 4 threads and at most 16G in parallel
+    del model["samtools_flagstats"]
+    tuned = tune(cluster, model)
+    assert tuned["qc_sample"]["mem"] == "96G"
+    assert tuned["qc_sample"]["threads"] == "24"
+
+
+def test_tune_file(tmp_path):
+    model = tmp_path / "model.json"
+    model.write_text(json.dumps(fit(records(tmp_path))))
+    cluster = tmp_path / "cluster.json"
+    cluster.write_text(
+        json.dumps({"__default__": {"mem": "16G", "time": "2-00:00:00"}})
+    )
+    workdir = tmp_path / "run"
+    workdir.mkdir()
+    inputs(workdir, {"T1": 8, "N1": 6})
+    tune_file(str(model), str(cluster), str(workdir))
+    assert json.loads(cluster.read_text())["bwa_mem"]["mem"] == "48G"
@@ -1,13 +1,25 @@
 import argparse
 import glob
+import json
 import os
 import tempfile
+import time
 from ccbr_tools.pipeline.util import get_tmp_dir, get_hpcname
 from ccbr_tools.pipeline.cache import get_sif_cache_dir
 from ccbr_tools.shell import exec_in_context
 
 from xavier.src.xavier.util import xavier_base
-from xavier.src.xavier.run import run
+from xavier.src.xavier.run import (
+    run,
+    cached_dryrun,
+    dryrun_key,
+    tee_dryrun,
+    DRYRUN_CACHE,
+    sym_safe,
+    profile_report,
+    probe_paths,
+    resolve_additional_bind_paths,
+)
 
 
 def test_dryrun():
@@ -45,3 +57,122 @@ def test_dryrun():
                 in allout_2,
             ]
         )
+
+
+def test_sym_safe():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rawdata = os.path.join(tmp_dir, "rawdata")
+        os.makedirs(rawdata)
+        inputs = []
+        for name in ["s1_R1_001.fastq.gz", "s1_R2_001.fastq.gz", "s2_1.fq.gz"]:
+            inputs.append(os.path.join(rawdata, name))
+            open(inputs[-1], "w").close()
+        timings = []
+        # Duplicate inputs are only linked once
+        renamed = sym_safe(inputs + inputs[:1], tmp_dir, timings=timings)
+        assert [os.path.basename(f) for f in renamed] == [
+            "s1.R1.fastq.gz",
+            "s1.R2.fastq.gz",
+            "s2.R1.fastq.gz",
+            "s1.R1.fastq.gz",
+        ]
+        assert all(os.path.islink(f) for f in renamed)
+        # Existing symlinks are left as is
+        assert sym_safe(inputs, tmp_dir) == renamed[:3]
+        assert "create symlinks" in profile_report(timings)
+
+
+def test_cached_dryrun():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.makedirs(os.path.join(tmp_dir, "workflow", "rules"))
+        for name in ["Snakefile", os.path.join("rules", "qc.smk")]:
+            with open(os.path.join(tmp_dir, "workflow", name), "w") as fh:
+                fh.write("rule all:\n    input: []\n")
+        with open(os.path.join(tmp_dir, "config.json"), "w") as fh:
+            fh.write('{"input_params": {"FASTQ_SOURCE": "", "BAM_SOURCE": ""}}')
+        fastq = os.path.join(tmp_dir, "s1.R1.fastq.gz")
+        open(fastq, "w").close()
+        assert cached_dryrun(tmp_dir) is None
+        with open(os.path.join(tmp_dir, "dryrun.log"), "w") as fh:
+            fh.write("Job stats:\n")
+        os.makedirs(os.path.dirname(os.path.join(tmp_dir, DRYRUN_CACHE)))
+        with open(os.path.join(tmp_dir, DRYRUN_CACHE), "w") as fh:
+            json.dump({"key": dryrun_key(tmp_dir), "log": "dryrun.log"}, fh)
+        assert cached_dryrun(tmp_dir) == os.path.join(tmp_dir, "dryrun.log")
+        # Modified input files invalidate the cached dry-run
+        with open(fastq, "w") as fh:
+            fh.write("@read\n")
+        assert cached_dryrun(tmp_dir) is None
+
+
+def test_dryrun_key():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.makedirs(os.path.join(tmp_dir, "workflow", "scripts"))
+        os.makedirs(os.path.join(tmp_dir, "store", "0123", "gVCFs"))
+        os.makedirs(os.path.join(tmp_dir, ".snakemake", "metadata"))
+        with open(os.path.join(tmp_dir, "workflow", "Snakefile"), "w") as fh:
+            fh.write("rule all:\n    input: []\n")
+        with open(os.path.join(tmp_dir, "config.json"), "w") as fh:
+            params = {"EXOME_TARGETS": "targets.bed", "GVCF_STORE": "store"}
+            json.dump({"input_params": params}, fh)
+        changes = [
+            ("workflow/scripts/plan_scatter.py", "PADDING = 100\n"),
+            ("targets.bed", "chr1\t1\t2\n"),
+            ("cluster.json", "{}\n"),
+            ("store/0123/gVCFs/S9.chr1.g.vcf.gz.tbi", ""),
+            # Outputs of a finished job
+            (".snakemake/metadata/b3V0cHV0", "{}"),
+        ]
+        for name, content in changes:
+            key = dryrun_key(tmp_dir)
+            assert dryrun_key(tmp_dir) == key
+            time.sleep(0.01)
+            with open(os.path.join(tmp_dir, name), "w") as fh:
+                fh.write(content)
+            assert dryrun_key(tmp_dir) != key, name
+
+
+def test_tee_dryrun():
+    table = ["Job stats:\n", "job      count\n", "-----  -------\n"]
+    rows = ["bwa_mem      20\n", "all           1\n", "total        21\n", "\n"]
+    lines = ["Building DAG of jobs...\n"] + table + rows + ["rule bwa_mem:\n"] * 20
+    lines += table + rows + ["This was a dry-run (flag -n).\n"]
+    stats = tee_dryrun(lines, echo=False, tail=2)
+    assert stats.counts == [("bwa_mem", 20), ("all", 1), ("total", 21)]
+    assert stats.lines == len(lines) and len(stats.tail) == 2
+    assert stats.report().splitlines()[1].split() == ["bwa_mem", "20"]
+    assert "Nothing to be done" in tee_dryrun(["\n"], echo=False).report()
+
+
+def test_resolve_additional_bind_paths():
+    paths = [
+        "/data/refs/hg38/genome.fa",
+        "/data/refs/hg38/bwa/genome.fa.bwt",
+        "/data/refs/mm10",
+        "/data/refs/mm10/genome.fa",
+        "/fdb/VEP/102/cache",
+        "/fdb/VEP/102/cache",
+        "/tmp",
+        "s3://bucket/genome.fa",
+        "relative/genome.fa",
+    ]
+    assert sorted(resolve_additional_bind_paths(paths)) == [
+        "/data/refs",
+        "/fdb/VEP/102",
+        "/tmp",
+    ]
+    assert sorted(resolve_additional_bind_paths(paths[:2])) == ["/data/refs/hg38"]
+
+
+def test_probe_paths():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fasta = os.path.join(tmp_dir, "genome.fa")
+        open(fasta, "w").close()
+        stat_cache = {}
+        values = [fasta, tmp_dir, os.path.join(tmp_dir, "missing.fa"), 2, "hg38"]
+        assert probe_paths(values, stat_cache) == {tmp_dir}
+        assert stat_cache == {
+            fasta: True,
+            tmp_dir: False,
+            os.path.join(tmp_dir, "missing.fa"): None,
+        }
@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from xavier.workflow.scripts.stage_reference import Stage, fastq_screen, parse_size
+
+
+def reference(path, files):
+    os.makedirs(path)
+    for name, content in files.items():
+        filename = os.path.join(path, name)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "w") as fh:
+            fh.write(content)
+    return path
+
+
+def test_stage(tmp_path):
+    kraken = reference(
+        str(tmp_path / "kraken2"), {"hash.k2d": "A" * 64, "taxo.k2d": "B"}
+    )
+    stage = Stage(str(tmp_path / "stage"))
+    staged = stage.stage(kraken)
+    assert os.path.basename(staged) == "kraken2"
+    assert sorted(os.listdir(staged)) == ["hash.k2d", "taxo.k2d"]
+    with open(os.path.join(os.path.dirname(staged), "SHA256SUMS")) as fh:
+        assert [line.split()[1] for line in fh] == [
+            "kraken2/hash.k2d",
+            "kraken2/taxo.k2d",
+        ]
+    # Re-used, unless the copy is incomplete
+    checksums = os.stat(os.path.join(os.path.dirname(staged), "SHA256SUMS")).st_ino
+    assert stage.stage(kraken) == staged
+    assert (
+        os.stat(os.path.join(os.path.dirname(staged), "SHA256SUMS")).st_ino == checksums
+    )
+    os.remove(os.path.join(staged, "taxo.k2d"))
+    assert stage.stage(kraken) == staged and os.path.isfile(
+        os.path.join(staged, "taxo.k2d")
+    )
+    # or, after a restart of the node, its checksums do not match
+    with open(os.path.join(staged, "hash.k2d"), "w") as fh:
+        fh.write("C" * 64)
+    assert stage.stage(kraken) == staged
+    assert open(os.path.join(staged, "hash.k2d")).read() == "C" * 64
+    with open(os.path.join(os.path.dirname(staged), ".validated"), "w") as fh:
+        fh.write("previous-boot")
+    assert stage.stage(kraken) == staged
+    assert open(os.path.join(staged, "hash.k2d")).read() == "A" * 64
+    # or the reference changes
+    with open(os.path.join(kraken, "taxo.k2d"), "w") as fh:
+        fh.write("BB")
+    assert stage.stage(kraken) != staged
+
+
+def test_stage_include(tmp_path):
+    vep = reference(
+        str(tmp_path / "cache"),
+        {
+            "homo_sapiens/102_GRCh38/info.txt": "38",
+            "homo_sapiens/102_GRCh37/info.txt": "37",
+            "mus_musculus/102_GRCm38/info.txt": "m38",
+        },
+    )
+    staged = Stage(str(tmp_path / "stage")).stage(
+        vep, include=["homo_sapiens/*_GRCh38"]
+    )
+    assert os.listdir(staged) == ["homo_sapiens"]
+    assert os.listdir(os.path.join(staged, "homo_sapiens")) == ["102_GRCh38"]
+
+
+def test_evict(tmp_path):
+    refs = [
+        reference(str(tmp_path / name), {"index": name * 400})
+        for name in ("a", "b", "c")
+    ]
+    # Registration of the job, see stage_reference() in the Snakefile
+    os.makedirs(str(tmp_path / "stage" / ".users"))
+    with open(str(tmp_path / "stage" / ".users" / "1"), "w") as user:
+        stage = Stage(str(tmp_path / "stage"), parse_size("1K"), user.fileno())
+        a = stage.stage(refs[0])
+        stage.user_fd = None
+        b = stage.stage(refs[1])
+        # Least recently used, but in use by the job
+        c = stage.stage(refs[2])
+        assert os.path.isdir(a) and not os.path.isdir(b) and os.path.isdir(c)
+        with pytest.raises(IOError, match="No room"):
+            stage.stage(reference(str(tmp_path / "d"), {"index": "d" * 2048}))
+
+
+def test_fastq_screen(tmp_path):
+    human = reference(str(tmp_path / "Human"), {"GRCh38.1.bt2": "h"})
+    config = tmp_path / "fastq_screen.conf"
+    config.write_text(
+        "# BOWTIE2 /usr/bin/bowtie2\nDATABASE\tHuman\t{}\n".format(
+            os.path.join(human, "GRCh38")
+        )
+    )
+    output = tmp_path / "staged.conf"
+    fastq_screen(Stage(str(tmp_path / "stage")), str(config), str(output))
+    lines = output.read_text().splitlines()
+    assert lines[0] == "# BOWTIE2 /usr/bin/bowtie2"
+    name, index = lines[1].split("\t")[1:]
+    assert name == "Human" and index.startswith(str(tmp_path / "stage"))
+    assert os.path.isfile(index + ".1.bt2")
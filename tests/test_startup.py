@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+# Cold startup budget for `xavier --help` in milliseconds,
+# can be raised on slow shared filesystems
+IMPORT_BUDGET_MS = float(os.environ.get("XAVIER_IMPORT_BUDGET_MS", 500))
+
+# Imported by sub-command handlers, never at startup
+LAZY_MODULES = [
+    "PySimpleGUI",
+    "tkinter",
+    "snakemake",
+    "ccbr_tools",
+    "xavier.src.xavier.run",
+    "xavier.src.xavier.gui",
+]
+
+
+def importtime(*args):
+    """Runs the xavier CLI with `python -X importtime` and returns the
+    cumulative import time of each top-level module in microseconds."""
+    code = "import sys; from xavier.src.xavier.__main__ import main; sys.argv[0] = 'xavier'; main()"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code] + list(args),
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    assert proc.returncode == 0, proc.stderr
+    modules = {}
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules[name.strip()] = (int(cumulative), len(name) - len(name.lstrip()))
+    return modules
+
+
+def test_help_startup():
+    modules = importtime("--help")
+    eager = [
+        m
+        for m in modules
+        for lazy in LAZY_MODULES
+        if m == lazy or m.startswith(lazy + ".")
+    ]
+    assert not eager
+    # Nested imports are indented, only count top-level imports
+    total_us = sum(us for us, depth in modules.values() if depth == 1)
+    assert total_us / 1000.0 < IMPORT_BUDGET_MS, sorted(
+        modules.items(), key=lambda item: -item[1][0]
+    )[:10]
@@ -0,0 +1,84 @@
+import os
+import stat
+
+import pytest
+
+from xavier.src.xavier.stats import aggregate, collect, stats
+from xavier.workflow.scripts.resource_model import read_stats
+
+LOG = os.path.join(os.path.dirname(__file__), "data", "resource_model", "snakemake.log")
+
+# Records a call per line, and prints the allocation and steps of each job
+SACCT = """#!/usr/bin/env python3
+import sys
+with open({calls!r}, "a") as fh:
+    fh.write(" ".join(sys.argv[1:]) + "\\n")
+jobs = [a.split("=", 1)[1] for a in sys.argv if a.startswith("--jobs=")][0]
+for jobid in jobs.split(","):
+    n = int(jobid) - 1000
+    if n == 11:
+        continue
+    state = "OUT_OF_MEMORY" if n == 9 else "COMPLETED"
+    rss = "{{}}.00G".format(n)
+    name = "GROUP.S{{}}".format(n - 11) if n > 11 else "job" + jobid
+    print("|".join([jobid, name, state, "1000", str(1000 + 60 * n), "5000",
+                    "01:00:00", "16:00:00", "4", "4", "32G", "", "", "cn0001", "norm",
+                    "global", "account", "user", "/data/project"]))
+    print("|".join([jobid + ".batch", "batch", state, "1000", "1000", "5000", "01:00:00",
+                    "", "4", "4", "", "0.50G", rss, "cn0001", "", "", "account", "", ""]))
+    print("|".join([jobid + ".extern", "extern", "COMPLETED", "1000", "1000", "5000",
+                    "01:00:00", "", "4", "4", "", "0", "0.01G", "cn0001", "", "", "account",
+                    "", ""]))
+"""
+
+
+@pytest.fixture
+def sacct(tmp_path):
+    calls = tmp_path / "calls.txt"
+    command = tmp_path / "sacct"
+    command.write_text(SACCT.format(calls=str(calls)))
+    command.chmod(command.stat().st_mode | stat.S_IXUSR)
+    return str(command), calls
+
+
+def test_collect(sacct):
+    command, calls = sacct
+    rows = collect(LOG, batch_size=4, command=command)
+    # 14 jobs in 4 calls, job 1011 is not accountable
+    assert len(calls.read_text().splitlines()) == 4
+    assert "--parsable2" in calls.read_text()
+    assert len(rows) == 13
+    assert rows[0]["jobid"] == "1001" and rows[0]["rule"] == "bwa_mem"
+    assert rows[0]["wildcards"] == "samples=S1"
+    assert rows[0]["queued_s"] == 60 and rows[0]["elapsed_s"] == 3600
+    assert rows[0]["max_rss_gb"] == 1.0 and rows[0]["req_mem_gb"] == 32
+    assert [r["jobid"] for r in rows] == [str(1001 + n) for n in range(14) if n != 10]
+    assert rows[8]["wildcards"] == "chroms=chr2,samples=S4"
+    assert rows[8]["state"] == "OUT_OF_MEMORY"
+    # Group jobs are named GROUP.*, see tests/data/resource_model
+    assert rows[-1]["job_name"] == "GROUP.S3" and rows[-1]["rule"] == "qc_sample"
+    assert rows[-1]["wildcards"] == "samples=S3"
+
+
+def test_aggregate(sacct):
+    command, _ = sacct
+    rules = dict((r["rule"], r) for r in aggregate(collect(LOG, command=command)))
+    assert sorted(rules) == ["bwa_mem", "kraken", "qc_sample", "strelka"]
+    assert rules["strelka"]["jobs"] == 5 and rules["strelka"]["failed"] == 1
+    assert rules["bwa_mem"]["cpu_hours"] == 16
+    assert rules["strelka"]["max_rss_gb_max"] == 9
+    assert rules["strelka"]["mem_efficiency"] == 9 / 32.0
+
+
+def test_stats(tmp_path, sacct):
+    command, _ = sacct
+    path = stats(str(tmp_path), logfile=LOG, command=command)
+    assert path == str(tmp_path / "logfiles" / "cluster_stats.tsv")
+    rules = (tmp_path / "logfiles" / "cluster_stats.rules.tsv").read_text().splitlines()
+    assert rules[0].split("\t")[:3] == ["rule", "jobs", "completed"]
+    assert len(rules) == 5
+    # Read by the resource model, see resource_model.py
+    jobs = read_stats(path)
+    assert len(jobs) == 13
+    assert jobs[0]["rule"] == "bwa_mem" and jobs[0]["wildcards"] == {"samples": "S1"}
+    assert jobs[0]["minutes"] == 60 and jobs[0]["mem"] == 1
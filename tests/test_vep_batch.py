@@ -0,0 +1,58 @@
+import io
+import os
+
+from xavier.workflow.scripts.vep_batch import join, read_contigs, sites
+
+DATA = os.path.join(os.path.dirname(__file__), "data", "merge_callers")
+CONTIGS = read_contigs(os.path.join(DATA, "genome.fa"))
+CALLERS = [
+    os.path.join(DATA, name + ".vcf") for name in ("mutect2", "strelka", "vardict")
+]
+
+
+def records(text):
+    return [line.split("\t") for line in text.splitlines() if not line.startswith("#")]
+
+
+def test_sites():
+    output = io.StringIO()
+    assert sites(CALLERS + [os.path.join(DATA, "expected.vcf")], CONTIGS, output) == 9
+    assert [r[:5] for r in records(output.getvalue())][3:6] == [
+        ["chr1", "400", ".", "AT", "A"],
+        ["chr1", "400", ".", "ATT", "A"],
+        ["chr1", "400", ".", "ATT", "AT,A"],
+    ]
+
+
+def test_join(tmp_path):
+    output = io.StringIO()
+    sites(CALLERS, CONTIGS, output)
+    # Annotation of each site by VEP
+    annotated = tmp_path / "sites.vep.vcf"
+    lines = []
+    for line in output.getvalue().splitlines(True):
+        if line.startswith("#CHROM"):
+            lines.append(
+                '##INFO=<ID=CSQ,Number=.,Type=String,Description="Format: Allele">\n'
+            )
+        elif not line.startswith("#"):
+            fields = line.split("\t")
+            fields[7] = "CSQ={}>{}".format(fields[3], fields[4])
+            line = "\t".join(fields)
+        lines.append(line)
+    annotated.write_text("".join(lines))
+
+    output = io.StringIO()
+    missing = join(os.path.join(DATA, "strelka.vcf"), str(annotated), CONTIGS, output)
+    assert missing == 0
+    assert "##INFO=<ID=CSQ," in output.getvalue()
+    assert [r[7] for r in records(output.getvalue())] == [
+        "DP=40;SOMATIC;CSQ=A>T",
+        "DP=35;SOMATIC;CSQ=G>A",
+        "DP=25;SOMATIC;CSQ=C>CA",
+        "DP=52;SOMATIC;CSQ=G>C",
+    ]
+    output = io.StringIO()
+    assert (
+        join(os.path.join(DATA, "expected.vcf"), str(annotated), CONTIGS, output) == 1
+    )
@@ -213,7 +213,8 @@ rule sobdetect_metrics:
 
 rule ffpefilter_mafs:
     input:
-        filtered_vcf = os.path.join(SOBDetector_out, "{vc_outdir}", "pass2", "{samples}.artifact_filtered.vcf.gz")
+        filtered_vcf = os.path.join(SOBDetector_out, "{vc_outdir}", "pass2", "{samples}.artifact_filtered.vcf.gz"),
+        annotated = os.path.join(output_somatic_snpindels, "vep", "sites.vep.vcf"),
     output:
         filtered_vcf = os.path.join(output_somatic_base, SOBDetector_out, "{vc_outdir}", "vcf", "{samples}.temp.vcf"),
         maf = os.path.join(output_somatic_base, SOBDetector_out, "{vc_outdir}", "maf", "{samples}.maf")
@@ -225,29 +226,42 @@ rule ffpefilter_mafs:
         bundle = config['references']['VCF2MAF']['VEPRESOURCEBUNDLEPATH'],
         species = config['references']['VCF2MAF']['SPECIES'],
         rname = 'vcf2maf',
-        vcf2maf_script = VCF2MAF_WRAPPER
-    threads: 4
+        vcf2maf_script = VCF2MAF_WRAPPER,
+        script = config['scripts']['vep_batch'],
+        set_tmp = set_tmp(),
+    threads: 1
+    # vep_batch.py runs on the python3 of the vcf2maf
+    # image, see docker/vcf2maf/Dockerfile
+    envmodules:
+        config['tools']['python3']['modname']
     container:
         config['images']['vcf2maf']
     shell: """
-    filetype=$(file -b --mime-type {input.filtered_vcf})
-    if [ $filetype == "application/gzip" ] ; then
-        zcat {input.filtered_vcf} > {output.filtered_vcf}
-    else
-        {input.filtered_vcf} > {output.filtered_vcf}
-    fi
+    # Setups temporary directory for
+    # intermediate files with built-in
+    # mechanism for deletion on exit
+    {params.set_tmp}
+
+    # Sites annotated by vep_cohort, with --inhibit-vep
+    # vcf2maf reads them from <tmp-dir>/<name>.vep.vcf
+    python3 {params.script} join \\
+        --reference {params.genome} \\
+        --annotated {input.annotated} \\
+        --input {input.filtered_vcf} \\
+        --output {output.filtered_vcf}
+    cp {output.filtered_vcf} "${{tmp}}/$(basename {output.filtered_vcf} .vcf).vep.vcf"
 
     vcf2maf.pl \\
         --input-vcf {output.filtered_vcf} \\
         --output-maf {output.maf} \\
+        --tmp-dir "${{tmp}}" \\
+        --inhibit-vep \\
         --tumor-id {params.tumorsample} \\
         --vep-path /opt/vep/src/ensembl-vep \\
         --vep-data {params.bundle} \\
         --ncbi-build {params.build} \\
         --species {params.species} \\
-        --vep-forks {threads} \\
-        --ref-fasta {params.genome} \\
-        --vep-overwrite
+        --ref-fasta {params.genome}
 
     """
 
@@ -2,7 +2,8 @@
 rule haplotypecaller:
     """
     Germline variant calling. This can be done independently across the
-    genome, so we're splitting it up by chromosome.
+    genome, so we're splitting it up by chromosome, or with SCATTER_SHARDS
+    by shards of the targets with a similar number of targeted bases.
     @Input:
         Aligned reads in BAM format
     @Output:
@@ -12,13 +13,13 @@ rule haplotypecaller:
         bam = os.path.join(output_bamdir,"final_bams","{samples}.bam"),
         bai = os.path.join(output_bamdir,"final_bams","{samples}.bai"),
     output:
-        gzvcf = temp(os.path.join(output_germline_base,"gVCFs","{samples}.{chroms}.g.vcf.gz")),
-        index = temp(os.path.join(output_germline_base,"gVCFs","{samples}.{chroms}.g.vcf.gz.tbi")),
+        gzvcf = gvcf_output(os.path.join(gvcf_dir,"{samples}.{chroms}.g.vcf.gz")),
+        index = gvcf_output(os.path.join(gvcf_dir,"{samples}.{chroms}.g.vcf.gz.tbi")),
     params:
         sample = "{samples}",
         genome = config['references']['GENOME'],
         snpsites=config['references']['DBSNP'],
-        chrom="{chroms}",
+        intervals=scatter_intervals,
         ver_gatk=config['tools']['gatk4']['version'],
         rname = "hapcaller"
     message: "Running GATK4 HaplotypeCaller on '{input.bam}' input file"
@@ -39,7 +40,7 @@ rule haplotypecaller:
             --annotation-group AS_StandardAnnotation \\
             --dbsnp {params.snpsites} \\
             --output {output.gzvcf} \\
-            --intervals {params.chrom} \\
+            --intervals {params.intervals} \\
             --max-alternate-alleles 3
         """
 
@@ -52,14 +53,15 @@ rule mergegvcfs:
     @Output:
         Multi-sample gVCF, scattered across chromosomes
     """
-    input: gzvcf = expand(os.path.join(output_germline_base,"gVCFs","{samples}.{{chroms}}.g.vcf.gz"),samples=samples),
-           index = expand(os.path.join(output_germline_base,"gVCFs","{samples}.{{chroms}}.g.vcf.gz.tbi"),samples=samples),
+    input: gzvcf = expand(os.path.join(gvcf_dir,"{samples}.{{chroms}}.g.vcf.gz"),samples=cohort),
+           index = expand(os.path.join(gvcf_dir,"{samples}.{{chroms}}.g.vcf.gz.tbi"),samples=cohort),
            # list = "gVCFs/gVCFs.{chroms}.list",
     output:
         gzvcf = os.path.join(output_germline_base,"gVCFs","merged.{chroms}.g.vcf.gz"),
         index = os.path.join(output_germline_base,"gVCFs","merged.{chroms}.g.vcf.gz.tbi"),
     params:
         genome = config['references']['GENOME'],
+        intervals=scatter_intervals,
         ver_gatk=config['tools']['gatk4']['version'],
         rname = "mergegvcfs"
     message: "Running GATK4 CombineGVCFs on '{input.gzvcf}' input file"
@@ -75,32 +77,114 @@ rule mergegvcfs:
             --annotation-group AS_StandardAnnotation \\
             $input_str \\
             --output {output.gzvcf} \\
-            --intervals {wildcards.chroms} \\
+            --intervals {params.intervals} \\
             --use-jdk-inflater \\
             --use-jdk-deflater
         """
 
 
+rule genomicsdb_import:
+    """
+    Imports the gVCFs of the cohort into a GenomicsDB workspace, with
+    GERMLINE_ENGINE genomicsdb instead of mergegvcfs. The samples are read
+    in batches, so memory does not grow with the size of the cohort. With
+    GVCF_STORE, only samples that are not yet in an existing workspace
+    are imported, i.e. the new samples of a wave, unless its last import
+    did not complete, a sample was removed, or a gVCF was called again,
+    see gvcf_store.py; then, or outside a store, the workspace is rebuilt.
+    @Input:
+        Single-sample gVCFs, scattered across chromosomes
+    @Output:
+        Sample name map of the samples in the GenomicsDB workspace
+    """
+    input: gzvcf = expand(os.path.join(gvcf_dir,"{samples}.{{chroms}}.g.vcf.gz"),samples=cohort),
+           index = expand(os.path.join(gvcf_dir,"{samples}.{{chroms}}.g.vcf.gz.tbi"),samples=cohort),
+           sample_map = os.path.join(genomicsdb_dir,"sample_maps","{chroms}.sample_map"),
+    output:
+        imported = os.path.join(genomicsdb_dir,"{chroms}.imported"),
+    params:
+        workspace = os.path.join(genomicsdb_workspaces,"{chroms}"),
+        intervals=scatter_intervals,
+        batch_size=50,
+        store_script = config['scripts']['gvcf_store'],
+        # Outside a store, the workspace is rebuilt when the rule re-runs
+        rebuild = "" if gvcf_store else "--rebuild",
+        ver_gatk=config['tools']['gatk4']['version'],
+        rname = "genomicsdb_import",
+        set_tmp = set_tmp(),
+    message: "Running GATK4 GenomicsDBImport on '{input.sample_map}' input file"
+    threads: 4
+    envmodules: config['tools']['gatk4']['modname']
+    container: config['images']['wes_base']
+    shell:
+        """
+        # Setups temporary directory for
+        # intermediate files with built-in
+        # mechanism for deletion on exit
+        {params.set_tmp}
+        mkdir -p "$(dirname {params.workspace})"
+
+        # Workspaces in a GVCF_STORE may be shared
+        # by concurrent runs, one import at a time
+        (
+        flock 9
+        action=$(python3 {params.store_script} new-samples \
+            --sample-map {input.sample_map} \
+            --workspace {params.workspace} \
+            --output "${{tmp}}/new.sample_map" {params.rebuild})
+        if [ "$action" = "update" ]; then
+            # Appends the new samples, over the
+            # intervals of the existing workspace
+            rm -f {params.workspace}.complete
+            gatk --java-options '-Xmx24g' GenomicsDBImport \
+                --genomicsdb-update-workspace-path {params.workspace} \
+                --sample-name-map "${{tmp}}/new.sample_map" \
+                --batch-size {params.batch_size} \
+                --reader-threads {threads} \
+                --genomicsdb-shared-posixfs-optimizations \
+                --tmp-dir ${{tmp}}
+        elif [ "$action" = "create" ]; then
+            # Removes an incomplete or stale workspace
+            rm -rf {params.workspace} {params.workspace}.complete
+            gatk --java-options '-Xmx24g' GenomicsDBImport \
+                --genomicsdb-workspace-path {params.workspace} \
+                --sample-name-map "${{tmp}}/new.sample_map" \
+                --batch-size {params.batch_size} \
+                --reader-threads {threads} \
+                --intervals {params.intervals} \
+                --merge-input-intervals \
+                --genomicsdb-shared-posixfs-optimizations \
+                --tmp-dir ${{tmp}}
+        fi
+        # Marks the import as complete
+        touch {params.workspace}.complete
+        ) 9> {params.workspace}.lock
+        cp {input.sample_map} {output.imported}
+        """
+
+
 rule genotype:
     """
     Joint genotyping of germline variants
     @Input:
-        Multi-sample gVCF, scattered across chromosomes
+        Multi-sample gVCF or GenomicsDB workspace, scattered across chromosomes
     @Output:
         Multi-sample gVCF, scattered across chromosomes (with joint genotyping updates)
     """
     input:
-        gzvcf = os.path.join(output_germline_base,"gVCFs","merged.{chroms}.g.vcf.gz"),
-        index = os.path.join(output_germline_base,"gVCFs","merged.{chroms}.g.vcf.gz.tbi"),
+        gvcfs = joint_gvcfs,
     output:
-        vcf = os.path.join(output_germline_base,"VCF","by_chrom","raw_variants.{chroms}.vcf.gz"),
+        vcf = os.path.join(output_germline_base,"VCF",scatter_dirname,"raw_variants.{chroms}.vcf.gz"),
     params:
         genome = config['references']['GENOME'],
         snpsites=config['references']['DBSNP'],
-        chr="{chroms}",
+        intervals=scatter_intervals,
+        variant=joint_variant,
+        # GenomicsDB reads the workspace outside of the Java heap
+        memory="32g" if germline_engine == 'genomicsdb' else "96g",
         ver_gatk=config['tools']['gatk4']['version'],
         rname = "genotype"
-    message: "Running GATK4 GenotypeGVCFs on '{input.gzvcf}' input file"
+    message: "Running GATK4 GenotypeGVCFs on '{params.variant}' input file"
     envmodules: config['tools']['gatk4']['modname']
     container: config['images']['wes_base']
     shell:
@@ -108,7 +192,7 @@ rule genotype:
         myoutdir="$(dirname {output.vcf})"
         if [ ! -d "$myoutdir" ]; then mkdir -p "$myoutdir"; fi
 
-        gatk --java-options '-Xmx96g' GenotypeGVCFs \\
+        gatk --java-options '-Xmx{params.memory}' GenotypeGVCFs \\
             --reference {params.genome} \\
             --use-jdk-inflater \\
             --use-jdk-deflater \\
@@ -116,8 +200,8 @@ rule genotype:
             --annotation-group AS_StandardAnnotation \\
             --dbsnp {params.snpsites} \\
             --output {output.vcf} \\
-            --variant {input.gzvcf} \\
-            --intervals {params.chr}
+            --variant {params.variant} \\
+            --intervals {params.intervals}
         """
 
 
@@ -130,19 +214,21 @@ rule germline_merge_chrom:
         Multi-sample gVCF with all chromosomes combined
     """
     input:
-        expand(os.path.join(output_germline_base,"VCF","by_chrom","raw_variants.{chroms}.vcf.gz"), chroms=chroms),
+        expand(os.path.join(output_germline_base,"VCF",scatter_dirname,"raw_variants.{chroms}.vcf.gz"), chroms=scatter),
     output:
         vcf = os.path.join(output_germline_base,"VCF","raw_variants.vcf.gz"),
-        clist = os.path.join(output_germline_base,"VCF","by_chrom","raw_variants_byChrom.list"),
+        clist = os.path.join(output_germline_base,"VCF",scatter_dirname,"raw_variants_byChrom.list"),
     params:
-        rname = "merge_chrom", genome = config['references']['GENOME']
+        rname = "merge_chrom", genome = config['references']['GENOME'],
+        # Skips shards of an earlier plan with a different number of shards
+        pattern = "raw_variants.*-of-{:04d}.vcf.gz".format(len(scatter)) if scatter_shards > 0 else "raw_variants.*.vcf.gz",
     message: "Running GATK4 MergeVcfs on all chrom split VCF files"
     envmodules: config['tools']['gatk4']['modname']
     container: config['images']['wes_base']
     shell:
         """
         # Avoids ARG_MAX issue which limits max length of a command
-        ls --color=never -d $(dirname "{output.clist}")/raw_variants.*.vcf.gz > "{output.clist}"
+        ls --color=never -d $(dirname "{output.clist}")/{params.pattern} > "{output.clist}"
 
         gatk MergeVcfs \\
             -R {params.genome} \\
@@ -20,6 +20,12 @@ rule fc_lane:
     params:
         rname = 'fc_lane',
         get_flowcell_lanes = os.path.join("workflow", "scripts", "get_flowcell_lanes.py"),
+        # Opt-in sampling mode, estimates read pairs
+        # from a bounded prefix and BGZF block seeks
+        mode = "--fast" if config['input_params'].get('FC_LANE_MODE', 'exact') == 'fast' else "--exact",
+        # Persistent cache of checksums, skips re-reading
+        # FastQ files that are unchanged since a previous run
+        cache = "--checksum-cache {}".format(config['input_params']['CHECKSUM_CACHE']) if config['input_params'].get('CHECKSUM_CACHE') else "",
     envmodules: config['tools']['python']['modname']
     container: config['images']['python']
     shell: """
@@ -27,7 +33,7 @@ rule fc_lane:
         mkdir -p "$(dirname {output.txt})"
     fi
 
-    python {params.get_flowcell_lanes} \\
+    python {params.get_flowcell_lanes} {params.mode} {params.cache} \\
         {input.r1} \\
         {wildcards.samples} > {output.txt}
     """
@@ -58,11 +64,26 @@ rule fastq_screen:
         # Exposed Parameters: modify resources/fastq_screen.conf to change
         # default locations to bowtie2 indices
         fastq_screen_config = config['references']['FASTQ_SCREEN_CONFIG'],
+        set_tmp = set_tmp(),
+        stage = stage_reference(),
     envmodules: config['tools']['fastq_screen']['modname']
     container: config['images']['fastq_screen']
     threads: 24
     shell: """
-    fastq_screen --conf {params.fastq_screen_config} \\
+    # Setups temporary directory for
+    # intermediate files with built-in
+    # mechanism for deletion on exit
+    {params.set_tmp}
+
+    # Screen against node-local copies of
+    # the bowtie2 indices shared by the
+    # jobs of a node, if they can be staged
+    {params.stage}
+    conf={params.fastq_screen_config}
+    if stage_reference fastq-screen -c {params.fastq_screen_config} -o "${{tmp}}/fastq_screen.conf"; then
+        conf="${{tmp}}/fastq_screen.conf"
+    fi
+    fastq_screen --conf "${{conf}}" \\
         --outdir {params.outdir} \\
         --threads {threads} \\
         --subset 1000000 \\
@@ -72,52 +93,120 @@ rule fastq_screen:
     """
 
 
-rule kraken:
-    """
-    Quality-control step to assess for potential sources of microbial contamination.
-    If there are high levels of microbial contamination, Kraken will provide an
-    estimation of the taxonomic composition. Kraken is used in conjunction with
-    Krona to produce an interactive reports.
-    @Input:
-        Trimmed FastQ files (scatter)
-    @Output:
-        Kraken logfile and interactive krona report
-    """
-    input:
-        fq1 = os.path.join(output_fqdir,"{samples}.R1.trimmed.fastq.gz"),
-        fq2 = os.path.join(output_fqdir,"{samples}.R2.trimmed.fastq.gz")
-    output:
-        out  = os.path.join(output_qcdir,"kraken","{samples}.trimmed.kraken_bacteria.out.txt"),
-        taxa = os.path.join(output_qcdir,"kraken","{samples}.trimmed.kraken_bacteria.taxa.txt"),
-        html = os.path.join(output_qcdir,"kraken","{samples}.trimmed.kraken_bacteria.krona.html"),
-    params:
-        rname  ='kraken',
-        outdir = os.path.join(output_qcdir, "kraken"),
-        bacdb  = config['references']['KRAKENBACDB'],
-        set_tmp = set_tmp()
-    envmodules:
-        config['tools']['kraken']['modname'],
-        config['tools']['kronatools']['modname']
-    container: config['images']['kraken']
-    threads: 24
-    shell: """
-    # Setups temporary directory for
-    # intermediate files with built-in
-    # mechanism for deletion on exit
-    {params.set_tmp}
-
-    # Copy kraken2 db to local node storage to reduce filesystem strain
-    cp -rv {params.bacdb} ${{tmp}}
-    kdb_base=$(basename {params.bacdb})
-    kraken2 --db ${{tmp}}/${{kdb_base}} \\
-        --threads {threads} --report {output.taxa} \\
-        --output {output.out} \\
-        --gzip-compressed \\
-        --paired {input.fq1} {input.fq2}
-    # Generate Krona Report
-    cut -f2,3 {output.out} | \\
-        ktImportTaxonomy - -o {output.html}
-    """
+if not kraken_batches:
+    rule kraken:
+        """
+        Quality-control step to assess for potential sources of microbial contamination.
+        If there are high levels of microbial contamination, Kraken will provide an
+        estimation of the taxonomic composition. Kraken is used in conjunction with
+        Krona to produce an interactive reports.
+        @Input:
+            Trimmed FastQ files (scatter)
+        @Output:
+            Kraken logfile and interactive krona report
+        """
+        input:
+            fq1 = os.path.join(output_fqdir,"{samples}.R1.trimmed.fastq.gz"),
+            fq2 = os.path.join(output_fqdir,"{samples}.R2.trimmed.fastq.gz")
+        output:
+            out  = os.path.join(output_qcdir,"kraken","{samples}.trimmed.kraken_bacteria.out.txt"),
+            taxa = os.path.join(output_qcdir,"kraken","{samples}.trimmed.kraken_bacteria.taxa.txt"),
+            html = os.path.join(output_qcdir,"kraken","{samples}.trimmed.kraken_bacteria.krona.html"),
+        params:
+            rname  ='kraken',
+            outdir = os.path.join(output_qcdir, "kraken"),
+            bacdb  = config['references']['KRAKENBACDB'],
+            set_tmp = set_tmp(),
+            stage = stage_reference(),
+        envmodules:
+            config['tools']['kraken']['modname'],
+            config['tools']['kronatools']['modname']
+        container: config['images']['kraken']
+        threads: 24
+        shell: """
+        # Setups temporary directory for
+        # intermediate files with built-in
+        # mechanism for deletion on exit
+        {params.set_tmp}
+
+        # Node-local copy of the kraken2 db shared by
+        # the jobs of a node, otherwise copy it to local
+        # node storage to reduce filesystem strain
+        {params.stage}
+        kdb=$(stage_reference path {params.bacdb}) || {{
+            cp -rv {params.bacdb} ${{tmp}}
+            kdb="${{tmp}}/$(basename {params.bacdb})"
+        }}
+        kraken2 --db "${{kdb}}" \\
+            --threads {threads} --report {output.taxa} \\
+            --output {output.out} \\
+            --gzip-compressed \\
+            --paired {input.fq1} {input.fq2}
+        # Generate Krona Report
+        cut -f2,3 {output.out} | \\
+            ktImportTaxonomy - -o {output.html}
+        """
+else:
+    rule kraken_batch:
+        """
+        Classifies the reads of a batch of samples with Kraken in one job, see
+        kraken. Each sample is classified against the same memory-mapped copy
+        of the database, so it is copied to the node and paged into memory once
+        per batch instead of being loaded into the memory of each process.
+        @Input:
+            Trimmed FastQ files of a batch of samples (scatter)
+        @Output:
+            Directory with the Kraken logfile and interactive krona report of
+            each sample of the batch
+        """
+        input:
+            fq1 = lambda w: expand(os.path.join(output_fqdir,"{samples}.R1.trimmed.fastq.gz"), samples=kraken_batches[w.kraken_batch]),
+            fq2 = lambda w: expand(os.path.join(output_fqdir,"{samples}.R2.trimmed.fastq.gz"), samples=kraken_batches[w.kraken_batch]),
+        output:
+            outdir = directory(os.path.join(output_qcdir,"kraken","{kraken_batch}")),
+        wildcard_constraints:
+            kraken_batch = r"batch[0-9]+"
+        params:
+            rname  = 'kraken_batch',
+            samples = lambda w: kraken_batches[w.kraken_batch],
+            fqdir  = output_fqdir,
+            bacdb  = config['references']['KRAKENBACDB'],
+            set_tmp = set_tmp(),
+            stage = stage_reference(),
+        envmodules:
+            config['tools']['kraken']['modname'],
+            config['tools']['kronatools']['modname']
+        container: config['images']['kraken']
+        threads: 24
+        shell: """
+        # Setups temporary directory for
+        # intermediate files with built-in
+        # mechanism for deletion on exit
+        {params.set_tmp}
+
+        # Node-local copy of the kraken2 db shared by
+        # the jobs of a node, otherwise copy it to local
+        # node storage once for the batch
+        {params.stage}
+        kdb=$(stage_reference path {params.bacdb}) || {{
+            cp -rv {params.bacdb} ${{tmp}}
+            kdb="${{tmp}}/$(basename {params.bacdb})"
+        }}
+        mkdir -p {output.outdir}
+        for sample in {params.samples}; do
+            prefix="{output.outdir}/${{sample}}.trimmed.kraken_bacteria"
+            kraken2 --db "${{kdb}}" \\
+                --memory-mapping \\
+                --threads {threads} --report "${{prefix}}.taxa.txt" \\
+                --output "${{prefix}}.out.txt" \\
+                --gzip-compressed \\
+                --paired "{params.fqdir}/${{sample}}.R1.trimmed.fastq.gz" \\
+                "{params.fqdir}/${{sample}}.R2.trimmed.fastq.gz"
+            # Generate Krona Report
+            cut -f2,3 "${{prefix}}.out.txt" | \\
+                ktImportTaxonomy - -o "${{prefix}}.krona.html"
+        done
+        """
 
 
 rule fastqc_bam:
@@ -166,18 +255,21 @@ rule reformat_targets_bed:
     output:
         bed=os.path.join(output_qcdir, "exome_targets.bed"),
     params:
-        script_path_reformat_bed=config['scripts']['reformat_bed'],
-        script_path_correct_target_bed=config['scripts']['correct_target_bed'],
+        script_path_normalize_bed=config['scripts']['normalize_bed'],
+        # Re-use the BED file normalized by other output directories,
+        # keyed by the contents of the targets BED file and the script
+        cache = lambda w, input, output: "python3 {} run --cache {} --max-size {} --name exome_targets.bed --inputs {} {} --output {} --".format(
+            config['scripts']['artifact_cache'], config['input_params']['ARTIFACT_CACHE'], config['input_params'].get('ARTIFACT_CACHE_MAX_SIZE', '1G'),
+            input.targets, config['scripts']['normalize_bed'], output.bed,
+        ) if config['input_params'].get('ARTIFACT_CACHE') else "",
         rname  = "reformat_bed"
     message: "Formatting targets bed file"
     envmodules: config['tools']['python3']['modname']
     container: config['images']['python']
     shell: """
-    python {params.script_path_reformat_bed} \\
+    {params.cache} python3 {params.script_path_normalize_bed} \\
         --input_bed {input.targets} \\
-        --output_bed {output.bed}.temp
-    python3 {params.script_path_correct_target_bed} {output.bed}.temp {output.bed}
-    rm -f {output.bed}.temp
+        --output_bed {output.bed}
     """
 
 
@@ -302,7 +394,6 @@ rule collectvariantcallmetrics:
         DBSNP={params.dbsnp} Validation_Stringency=SILENT
     """
 
-localrules: bcftools_stats
 rule bcftools_stats:
     """
     Quality-control step to collect summary statistics from bcftools stats.
@@ -502,7 +593,7 @@ if config['project']['annotation'] in ['hg38', 'hg38_noalt']:
         input:
             expand(os.path.join(output_fqdir,"{samples}.fastq.info.txt"), samples=samples),
             expand(os.path.join(output_qcdir,"FQscreen","{samples}.R2.trimmed_screen.txt"), samples=samples),
-            expand(os.path.join(output_qcdir,"kraken","{samples}.trimmed.kraken_bacteria.krona.html"), samples=samples),
+            kraken_reports(),
             expand(os.path.join(output_qcdir,"{samples}_fastqc.zip"), samples=samples),
             expand(os.path.join(output_qcdir,"{samples}","genome_results.txt"), samples=samples),
             expand(os.path.join(output_qcdir,"{samples}.samtools_flagstat.txt"), samples=samples),
@@ -618,7 +709,7 @@ if config['project']['annotation']=='mm10':
         input:
             expand(os.path.join(output_fqdir,"{samples}.fastq.info.txt"), samples=samples),
             expand(os.path.join(output_qcdir,"FQscreen","{samples}.R2.trimmed_screen.txt"), samples=samples),
-            expand(os.path.join(output_qcdir,"kraken","{samples}.trimmed.kraken_bacteria.krona.html"), samples=samples),
+            kraken_reports(),
             expand(os.path.join(output_qcdir,"{samples}_fastqc.zip"), samples=samples),
             expand(os.path.join(output_qcdir,"{samples}","genome_results.txt"), samples=samples),
             expand(os.path.join(output_qcdir,"{samples}.samtools_flagstat.txt"), samples=samples),
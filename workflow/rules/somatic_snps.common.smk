@@ -1,6 +1,13 @@
 # Common somatic SNP calling rules
-localrules: split_bam_by_chrom
 rule split_bam_by_chrom:
+    """
+    Fallback for tools without region queries, only used with SPLIT_BAMS.
+    By default, callers read each scatter unit of the indexed final BAM.
+    @Input:
+        Indexed final BAM file
+    @Output:
+        BAM file of a scatter unit, a chromosome or a shard of the targets
+    """
     input:
         bam = os.path.join(output_bamdir, "final_bams", "{samples}.bam"),
         bai = os.path.join(output_bamdir, "final_bams", "{samples}.bam.bai"),
@@ -8,6 +15,7 @@ rule split_bam_by_chrom:
         split_bam = os.path.join(output_bamdir, "chrom_split", "{samples}.{chroms}.split.bam"),
         split_bam_idx = os.path.join(output_bamdir, "chrom_split", "{samples}.{chroms}.split.bai")
     params:
+        region = scatter_region,
         ver_samtools = config['tools']['samtools']['version'],
         rname='bam_split'
     threads: 4
@@ -24,20 +32,20 @@ rule split_bam_by_chrom:
         -b \\
         -o {output.split_bam} \\
         -@ {threads} \\
-        {input.bam} {wildcards.chroms}
+        {input.bam} {params.region}
 
     samtools index \\
         -@ {threads} \\
         {output.split_bam} {output.split_bam_idx}
 
-    cp {output.split_bam_idx} {output.split_bam}.bai
+    ln -sf "$(basename {output.split_bam_idx})" {output.split_bam}.bai
     """
 
 
 rule LearnReadOrientationModel:
     input:
-        vcf = expand(os.path.join(output_somatic_snpindels, "mutect2_out", "chrom_split", "{{samples}}.{chroms}.vcf"), chroms=chroms),
-        read_orientation_file = expand(os.path.join(output_somatic_snpindels, "mutect2_out", "chrom_split", "{{samples}}.{chroms}.f1r2.tar.gz"), chroms=chroms)
+        vcf = expand(os.path.join(output_somatic_snpindels, "mutect2_out", "chrom_split", "{{samples}}.{chroms}.vcf"), chroms=scatter),
+        read_orientation_file = expand(os.path.join(output_somatic_snpindels, "mutect2_out", "chrom_split", "{{samples}}.{chroms}.f1r2.tar.gz"), chroms=scatter)
     output:
         model = os.path.join(output_somatic_snpindels, "mutect2_out", "read_orientation_data", "{samples}.read-orientation-model.tar.gz")
     params:
@@ -62,7 +70,7 @@ rule mutect2_filter:
         vcf = os.path.join(output_somatic_snpindels, "mutect2_out", "vcf", "{samples}.collected.vcf"),
         summary = os.path.join(output_somatic_base, "qc", "gatk_contamination", "{samples}.contamination.table"),
         model = os.path.join(output_somatic_snpindels, "mutect2_out", "read_orientation_data", "{samples}.read-orientation-model.tar.gz"),
-        statsfiles = expand(os.path.join(output_somatic_snpindels, "mutect2_out", "chrom_split", "{{samples}}.{chroms}.vcf.stats"), chroms=chroms)
+        statsfiles = expand(os.path.join(output_somatic_snpindels, "mutect2_out", "chrom_split", "{{samples}}.{chroms}.vcf.stats"), chroms=scatter)
     output:
         marked_vcf = os.path.join(output_somatic_snpindels, "mutect2_out", "vcf", "{samples}.filtered.vcf"),
         final = os.path.join(output_somatic_snpindels, "mutect2_out", "vcf", "{samples}.FINAL.vcf"),
@@ -118,7 +126,7 @@ rule mutect2_filter:
 
 rule somatic_merge_chrom:
     input:
-        vcf = expand(os.path.join(output_somatic_snpindels, "{{vc_out}}", "chrom_split", "{{samples}}.{chroms}.vcf"), chroms=chroms),
+        vcf = expand(os.path.join(output_somatic_snpindels, "{{vc_out}}", "chrom_split", "{{samples}}.{chroms}.vcf"), chroms=scatter),
     output:
         vcf = os.path.join(output_somatic_snpindels, "{vc_out}", "vcf", "{samples}.collected.vcf"),
     params:
@@ -142,6 +150,15 @@ rule somatic_merge_chrom:
 
 
 rule somatic_merge_callers:
+    """
+    Merges the variants of each caller with merge_callers.py, a streaming
+    re-implementation of GATK3 CombineVariants with KEEP_IF_ANY_UNFILTERED
+    and a priority list of callers, annotating the callers in set=.
+    @Input:
+        Normalized VCF file of each caller
+    @Output:
+        Merged VCF file of all callers
+    """
     input:
         vcf = expand(os.path.join(output_somatic_snpindels, "{vc_outdir}_out", "vcf", "{{samples}}.FINAL.norm.vcf"), vc_outdir=caller_list)
     output:
@@ -150,39 +167,123 @@ rule somatic_merge_callers:
         genome = config['references']['GENOME'],
         rodprioritylist = merge_callers_rodlist,
         variantsargs = lambda w: [merge_callers_args[w.samples]],
-        ver_gatk = config['tools']['gatk3']['version'],
+        script = config['scripts']['merge_callers'],
         rname = 'MergeSomaticCallers',
-        set_tmp = set_tmp(),
-    threads: 4
+    threads: 1
     envmodules:
-        config['tools']['gatk3']['modname']
+        config['tools']['python3']['modname']
     container:
-        config['images']['wes_base']
+        config['images']['python']
+    shell: """
+    if [ ! -d "$(dirname {output.mergedvcf})" ]; then
+      mkdir -p "$(dirname {output.mergedvcf})"
+    fi
+
+    python3 {params.script} \\
+        --reference {params.genome} \\
+        --priority {params.rodprioritylist} \\
+        --output {output.mergedvcf} \\
+        {params.variantsargs}
+    """
+
+
+rule vep_sites:
+    """
+    Collects the unique sites of the VCF files of every caller and sample,
+    including the FFPE-filtered ones, so VEP annotates each site once for
+    the whole cohort instead of once per sample and caller.
+    @Input:
+        Normalized VCF file of each caller and sample
+    @Output:
+        Unique sites of the cohort in VCF format
+    """
+    input:
+        vcfs = expand(os.path.join(output_somatic_snpindels, "{vc_outdir}", "vcf", "{samples}.FINAL.norm.vcf"), vc_outdir=somatic_callers_dirs, samples=samples_for_caller_merge)
+            + expand(os.path.join(SOBDetector_out, "{vc_outdir}", "pass2", "{samples}.artifact_filtered.vcf.gz"), vc_outdir=ffpe_caller_list, samples=ffpe_sample_list),
+    output:
+        vcf = temp(os.path.join(output_somatic_snpindels, "vep", "sites.vcf")),
+    params:
+        genome = config['references']['GENOME'],
+        script = config['scripts']['vep_batch'],
+        rname = 'vep_sites',
+    threads: 1
+    envmodules:
+        config['tools']['python3']['modname']
+    container:
+        config['images']['python']
+    shell: """
+    python3 {params.script} sites \\
+        --reference {params.genome} \\
+        --output {output.vcf} \\
+        {input.vcfs}
+    """
+
+
+rule vep_cohort:
+    """
+    Annotates the unique sites of the cohort with VEP, through vcf2maf so
+    the VEP options are the ones vcf2maf uses for each sample.
+    @Input:
+        Unique sites of the cohort in VCF format
+    @Output:
+        Unique sites of the cohort annotated by VEP
+    """
+    input:
+        vcf = os.path.join(output_somatic_snpindels, "vep", "sites.vcf"),
+    output:
+        vcf = os.path.join(output_somatic_snpindels, "vep", "sites.vep.vcf"),
+    params:
+        genome = config['references']['GENOME'],
+        build= config['references']['VCF2MAF']['GENOME_BUILD'],
+        species = config['references']['VCF2MAF']['SPECIES'],
+        bundle = config['references']['VCF2MAF']['VEPRESOURCEBUNDLEPATH'],
+        rname = 'vep_cohort',
+        set_tmp = set_tmp(),
+        stage = stage_reference(),
+    threads: 16
+    container:
+        config['images']['vcf2maf']
     shell: """
     # Setups temporary directory for
     # intermediate files with built-in
     # mechanism for deletion on exit
     {params.set_tmp}
 
-    if [ ! -d "$(dirname {output.mergedvcf})" ]; then
-      mkdir -p "$(dirname {output.mergedvcf})"
-    fi
+    # Node-local copy of the cache of the species
+    # and assembly shared by the jobs of a node
+    {params.stage}
+    bundle=$(stage_reference path {params.bundle} \\
+        --include "{params.species}/*_{params.build}") || bundle={params.bundle}
 
-    java8 -Xmx60g -Djava.io.tmpdir=${{tmp}} -jar $GATK_JAR -T CombineVariants \\
-        -R {params.genome} \\
-        -nt {threads} \\
-        --filteredrecordsmergetype KEEP_IF_ANY_UNFILTERED \\
-        --genotypemergeoption PRIORITIZE \\
-        --rod_priority_list {params.rodprioritylist} \\
-        --minimumN 1 \\
-        -o {output.mergedvcf} \\
-        {params.variantsargs}
+    # vcf2maf writes the annotated sites
+    # to <tmp-dir>/sites.vep.vcf
+    vcf2maf.pl \\
+        --input-vcf {input.vcf} \\
+        --output-maf "${{tmp}}/sites.maf" \\
+        --tmp-dir "$(dirname {output.vcf})" \\
+        --vep-path /opt/vep/src/ensembl-vep \\
+        --vep-data "${{bundle}}" \\
+        --ncbi-build {params.build} \\
+        --species {params.species} \\
+        --vep-forks {threads} \\
+        --ref-fasta {params.genome} \\
+        --vep-overwrite
     """
 
 
 rule somatic_mafs:
+    """
+    Converts the VCF file of a caller and sample to a MAF file, with the
+    annotation of its sites by vep_cohort instead of running VEP again.
+    @Input:
+        Normalized VCF file of a caller and sample
+        Unique sites of the cohort annotated by VEP
+    @Output:
+        MAF file of a caller and sample
+    """
     input:
-        filtered_vcf = os.path.join(output_somatic_snpindels, "{vc_outdir}", "vcf", "{samples}.FINAL.norm.vcf")
+        filtered_vcf = os.path.join(output_somatic_snpindels, "{vc_outdir}", "vcf", "{samples}.FINAL.norm.vcf"),
+        annotated = os.path.join(output_somatic_snpindels, "vep", "sites.vep.vcf"),
     output:
         maf = os.path.join(output_somatic_snpindels, "{vc_outdir}", "maf", "{samples}.maf")
     params:
@@ -191,28 +292,47 @@ rule somatic_mafs:
         build= config['references']['VCF2MAF']['GENOME_BUILD'],
         species = config['references']['VCF2MAF']['SPECIES'],
         bundle = config['references']['VCF2MAF']['VEPRESOURCEBUNDLEPATH'],
+        script = config['scripts']['vep_batch'],
         rname = 'vcf2maf',
         normalsample =  lambda w: "--normal-id {0}".format(
             pairs_dict[w.samples]
         ) if pairs_dict[w.samples] else "",
-    threads: 4
+        set_tmp = set_tmp(),
+    threads: 1
+    # vep_batch.py runs on the python3 of the vcf2maf
+    # image, see docker/vcf2maf/Dockerfile
+    envmodules:
+        config['tools']['python3']['modname']
     container:
         config['images']['vcf2maf']
     shell: """
+    # Setups temporary directory for
+    # intermediate files with built-in
+    # mechanism for deletion on exit
+    {params.set_tmp}
+
+    # With --inhibit-vep, vcf2maf reads the
+    # annotation from <tmp-dir>/<name>.vep.vcf
+    name="$(basename {input.filtered_vcf} .vcf)"
+    python3 {params.script} join \\
+        --reference {params.genome} \\
+        --annotated {input.annotated} \\
+        --input {input.filtered_vcf} \\
+        --output "${{tmp}}/${{name}}.vcf"
+    cp "${{tmp}}/${{name}}.vcf" "${{tmp}}/${{name}}.vep.vcf"
 
     vcf2maf.pl \\
-        --input-vcf {input.filtered_vcf} \\
+        --input-vcf "${{tmp}}/${{name}}.vcf" \\
         --output-maf {output.maf} \\
+        --tmp-dir "${{tmp}}" \\
+        --inhibit-vep \\
         --tumor-id {params.tumorsample} {params.normalsample} \\
         --vep-path /opt/vep/src/ensembl-vep \\
         --vep-data {params.bundle} \\
         --ncbi-build {params.build} \\
         --species {params.species} \\
-        --vep-forks {threads} \\
         --ref-fasta {params.genome} \\
-        --retain-info "set" \\
-        --vep-overwrite
-
+        --retain-info "set"
     """
 
 
@@ -1,8 +1,8 @@
 # Somatic SNP calling rules for tumor/normal pairs
 rule gatk_mutect2:
     input:
-        normal = lambda w: [os.path.join(output_bamdir, "chrom_split", pairs_dict[w.samples] + ".{chroms}.split.bam")],
-        tumor = os.path.join(output_bamdir, "chrom_split", "{samples}.{chroms}.split.bam")
+        normal = lambda w: [scatter_bam(pairs_dict[w.samples], w)],
+        tumor = lambda w: scatter_bam(w.samples, w)
     output:
         vcf = os.path.join(output_somatic_snpindels,"mutect2_out", "chrom_split", "{samples}.{chroms}.vcf"),
         read_orientation_file = os.path.join(output_somatic_snpindels, "mutect2_out", "chrom_split", "{samples}.{chroms}.f1r2.tar.gz"),
@@ -10,7 +10,7 @@ rule gatk_mutect2:
     params:
         normalsample = lambda w: [pairs_dict[w.samples]],
         tumorsample = '{samples}',
-        chrom = '{chroms}',
+        intervals = scatter_intervals,
         genome = config['references']['GENOME'],
         pon = config['references']['PON'],
         germsource = config['references']['GERMLINERESOURCE'],
@@ -32,7 +32,7 @@ rule gatk_mutect2:
         -normal {params.normalsample} \\
         --panel-of-normals {params.pon} \\
         {params.germsource} \\
-        -L {params.chrom} \\
+        -L {params.intervals} \\
         -O {output.vcf} \\
         --f1r2-tar-gz {output.read_orientation_file} \\
         --independent-mates
@@ -104,14 +104,18 @@ rule contamination_paired:
 
 rule strelka:
     input:
-        normal = lambda w: [os.path.join(output_bamdir, "chrom_split", pairs_dict[w.samples] + ".{chroms}.split.bam")],
-        tumor = os.path.join(output_bamdir, "chrom_split", "{samples}.{chroms}.split.bam")
+        normal = lambda w: [scatter_bam(pairs_dict[w.samples], w)],
+        tumor = lambda w: scatter_bam(w.samples, w)
     output:
         vcf = os.path.join(output_somatic_snpindels, "strelka_out", "chrom_split", "{samples}.{chroms}.vcf"),
     params:
         genome = config['references']['GENOME'],
         pon = config['references']['PON'],
         basedir = BASEDIR,
+        # Strelka calls wherever there are reads, restricts it to the
+        # targets of a shard, or to the chromosome of the final BAM
+        regions_bed = lambda w: scatter_targets(w) if scatter_shards > 0 else "",
+        regions_chrom = lambda w: w.chroms if scatter_shards == 0 and not split_bams else "",
         ver_strelka = config['tools']['strelka']['version'],
         rname = 'strelka',
         set_tmp = set_tmp(),
@@ -138,12 +142,24 @@ rule strelka:
     if [ -d "$myoutdir" ]; then rm -r "$myoutdir"; fi
     mkdir -p "$myoutdir"
 
+    call_regions=""
+    if [ -n "{params.regions_bed}" ]; then
+        bgzip -c "{params.regions_bed}" > "$myoutdir/call_regions.bed.gz"
+    elif [ -n "{params.regions_chrom}" ]; then
+        awk -v OFS='\\t' '$1 == "{params.regions_chrom}" {{print $1, 0, $2}}' "{params.genome}.fai" \\
+            | bgzip -c > "$myoutdir/call_regions.bed.gz"
+    fi
+    if [ -f "$myoutdir/call_regions.bed.gz" ]; then
+        tabix -f -p bed "$myoutdir/call_regions.bed.gz"
+        call_regions="--callRegions=$myoutdir/call_regions.bed.gz"
+    fi
+
     configureStrelkaSomaticWorkflow.py \\
         --ref={params.genome} \\
         --tumor={input.tumor} \\
         --normal={input.normal} \\
         --runDir="$myoutdir" \\
-        --exome
+        --exome $call_regions
     cd "$myoutdir"
     ./runWorkflow.py -m local -j {threads}
 
@@ -217,8 +233,8 @@ rule strelka_filter:
 
 rule mutect_paired:
     input:
-        normal = lambda w: [os.path.join(output_bamdir, "chrom_split", pairs_dict[w.samples] + ".{chroms}.split.bam")],
-        tumor = os.path.join(output_bamdir, "chrom_split", "{samples}.{chroms}.split.bam"),
+        normal = lambda w: [scatter_bam(pairs_dict[w.samples], w)],
+        tumor = lambda w: scatter_bam(w.samples, w),
     output:
         vcf = os.path.join(output_somatic_snpindels, "mutect_out", "chrom_split", "{samples}.{chroms}.vcf"),
         stats = os.path.join(output_somatic_snpindels, "mutect_out", "chrom_split", "{samples}.{chroms}.stats.out"),
@@ -228,6 +244,7 @@ rule mutect_paired:
         pon = config['references']['PON'],
         genome = config['references']['GENOME'],
         dbsnp_cosmic = config['references']['DBSNP_COSMIC'],
+        intervals = scatter_intervals,
         ver_mutect = config['tools']['mutect']['version'],
         rname = 'mutect',
         set_tmp = set_tmp(),
@@ -249,6 +266,7 @@ rule mutect_paired:
         --normal_panel {params.pon} \\
         --vcf {output.vcf} \\
         {params.dbsnp_cosmic} \\
+        -L {params.intervals} \\
         --disable_auto_index_creation_and_locking_when_reading_rods \\
         --input_file:normal {input.normal} \\
         --input_file:tumor {input.tumor} \\
@@ -303,15 +321,15 @@ rule mutect_filter:
 
 rule vardict_paired:
     input:
-        normal = lambda w: [os.path.join(output_bamdir, "chrom_split", pairs_dict[w.samples] + ".{chroms}.split.bam")],
-        tumor = os.path.join(output_bamdir, "chrom_split", "{samples}.{chroms}.split.bam"),
+        normal = lambda w: [scatter_bam(pairs_dict[w.samples], w)],
+        tumor = lambda w: scatter_bam(w.samples, w),
     output:
         vcf = os.path.join(output_somatic_snpindels, "vardict_out", "chrom_split", "{samples}.{chroms}.vcf"),
     params:
         normalsample = lambda w: [pairs_dict[w.samples]],
         tumorsample = "{samples}",
         genome = config['references']['GENOME'],
-        targets = exome_targets_bed,
+        targets = scatter_targets,
         pon = config['references']['PON'],
         rname = 'vardict'
     envmodules:
@@ -397,8 +415,8 @@ rule varscan_paired:
     """Note: Refactor formatting of shell command for readability to
     be more snake-thonic."""
     input:
-        normal = lambda w: [os.path.join(output_bamdir, "chrom_split", pairs_dict[w.samples] + ".{chroms}.split.bam")],
-        tumor = os.path.join(output_bamdir, "chrom_split", "{samples}.{chroms}.split.bam"),
+        normal = lambda w: [scatter_bam(pairs_dict[w.samples], w)],
+        tumor = lambda w: scatter_bam(w.samples, w),
         tumor_summary = os.path.join(output_somatic_base, "qc", "gatk_contamination", "{samples}.contamination.table"),
         normal_summary = lambda w: [os.path.join(output_somatic_base, "qc", "gatk_contamination", "{samples}_normal.contamination.table")],
     output:
@@ -407,6 +425,7 @@ rule varscan_paired:
         genome = config['references']['GENOME'],
         normalsample = lambda w: [pairs_dict[w.samples]],
         tumorsample = '{samples}',
+        pileup = lambda w: scatter_pileup([pairs_dict[w.samples], w.samples], w),
         ver_varscan = config['tools']['varscan']['version'],
         rname = 'varscan',
         set_tmp = set_tmp(),
@@ -427,7 +446,7 @@ rule varscan_paired:
     tumor_purity=$( echo "1-$(printf '%.6f' $(tail -n -1 {input.tumor_summary} | cut -f2 ))" | bc -l)
     normal_purity=$( echo "1-$(printf '%.6f' $(tail -n -1 {input.normal_summary} | cut -f2 ))" | bc -l)
     varscan_opts="--strand-filter 1 --min-var-freq 0.01 --min-avg-qual 30 --somatic-p-value 0.05 --output-vcf 1 --normal-purity $normal_purity --tumor-purity $tumor_purity"
-    dual_pileup="samtools mpileup -d 10000 -q 15 -Q 15 -f {params.genome} {input.normal} {input.tumor}"
+    dual_pileup="samtools mpileup -d 10000 -q 15 -Q 15 -f {params.genome} {params.pileup}"
     varscan_cmd="varscan somatic <($dual_pileup) {output.vcf} $varscan_opts --mpileup 1"
     eval "$varscan_cmd"
 
@@ -1,7 +1,7 @@
 # Somatic SNP calling rules for tumor only samples
 rule mutect2_single:
     input:
-        tumor = os.path.join(output_bamdir, "chrom_split", "{samples}.{chroms}.split.bam")
+        tumor = lambda w: scatter_bam(w.samples, w)
     output:
         vcf = os.path.join(output_somatic_snpindels, "mutect2_out", "chrom_split", "{samples}.{chroms}.vcf"),
         read_orientation_file = os.path.join(output_somatic_snpindels, "mutect2_out", "chrom_split", "{samples}.{chroms}.f1r2.tar.gz"),
@@ -11,6 +11,7 @@ rule mutect2_single:
         genome = config['references']['GENOME'],
         pon = config['references']['PON'],
         germsource = config['references']['GERMLINERESOURCE'],
+        intervals = scatter_intervals,
         ver_gatk = config['tools']['gatk4']['version'],
         rname = 'mutect2'
     threads: 2
@@ -28,7 +29,7 @@ rule mutect2_single:
         -I {input.tumor} \\
         --panel-of-normals {params.pon} \\
         {params.germsource} \\
-        -L {wildcards.chroms} \\
+        -L {params.intervals} \\
         -O {output.vcf} \\
         --f1r2-tar-gz {output.read_orientation_file} \\
         --independent-mates
@@ -91,7 +92,7 @@ rule contamination_single:
 
 rule mutect_single:
     input:
-        tumor = os.path.join(output_bamdir, "chrom_split", "{samples}.{chroms}.split.bam"),
+        tumor = lambda w: scatter_bam(w.samples, w),
     output:
         vcf = os.path.join(output_somatic_snpindels, "mutect_out", "chrom_split", "{samples}.{chroms}.vcf"),
         stats = os.path.join(output_somatic_snpindels, "mutect_out", "chrom_split", "{samples}.{chroms}.stats.out"),
@@ -99,6 +100,7 @@ rule mutect_single:
         genome = config['references']['GENOME'],
         pon = config['references']['PON'],
         dbsnp_cosmic = config['references']['DBSNP_COSMIC'],
+        intervals = scatter_intervals,
         ver_mutect = config['tools']['mutect']['version'],
         rname = 'mutect',
         set_tmp = set_tmp()
@@ -122,7 +124,7 @@ rule mutect_single:
         --normal_panel {params.pon} \\
         --vcf {output.vcf} \\
         {params.dbsnp_cosmic} \\
-        -L {wildcards.chroms} \\
+        -L {params.intervals} \\
         --disable_auto_index_creation_and_locking_when_reading_rods \\
         --input_file:tumor {input.tumor} \\
         --out {output.stats} \\
@@ -174,12 +176,12 @@ rule mutect_filter_single:
 
 rule vardict_single:
     input:
-        tumor = os.path.join(output_bamdir, "chrom_split", "{samples}.{chroms}.split.bam"),
+        tumor = lambda w: scatter_bam(w.samples, w),
     output:
         vcf = os.path.join(output_somatic_snpindels, "vardict_out", "chrom_split", "{samples}.{chroms}.vcf"),
     params:
         genome = config['references']['GENOME'],
-        targets = exome_targets_bed,
+        targets = scatter_targets,
         pon = config['references']['PON'],
         ver_bcftools = config['tools']['bcftools']['version'],
         rname = 'vardict'
@@ -262,11 +264,12 @@ rule vardict_filter_single:
 
 rule varscan_single:
     input:
-        tumor = os.path.join(output_bamdir, "chrom_split", "{samples}.{chroms}.split.bam"),
+        tumor = lambda w: scatter_bam(w.samples, w),
     output:
         vcf = os.path.join(output_somatic_snpindels, "varscan_out", "chrom_split", "{samples}.{chroms}.vcf"),
     params:
         genome = config['references']['GENOME'],
+        pileup = lambda w: scatter_pileup([w.samples], w),
         ver_varscan = config['tools']['varscan']['version'],
         ver_bcftools = config['tools']['bcftools']['version'],
         rname='varscan'
@@ -282,7 +285,7 @@ rule varscan_single:
     fi
 
     varscan_opts="--strand-filter 0 --min-var-freq 0.01 --output-vcf 1 --variants 1"
-    pileup_cmd="samtools mpileup -d 100000 -q 15 -Q 15 -f {params.genome} {input.tumor}"
+    pileup_cmd="samtools mpileup -d 100000 -q 15 -Q 15 -f {params.genome} {params.pileup}"
     varscan_cmd="varscan mpileup2cns <($pileup_cmd) $varscan_opts"
     eval "$varscan_cmd > {output.vcf}.gz"
     eval "bcftools view -U {output.vcf}.gz > {output.vcf}_temp"
@@ -94,13 +94,14 @@ rule bwa_mem:
     @Input:
         One pair of FASTQ files (scatter)
     @Output:
-        Aligned reads in BAM format
+        Aligned reads in BAM format, sorted and indexed as it is written
     """
     input:
         os.path.join(output_fqdir, "{samples}.R1.trimmed.fastq.gz"),
         os.path.join(output_fqdir, "{samples}.R2.trimmed.fastq.gz")
     output:
-        temp(os.path.join(output_bamdir, "preprocessing", "{samples}.raw_map.bam"))
+        bam = temp(os.path.join(output_bamdir, "preprocessing", "{samples}.raw_map.bam")),
+        bai = temp(os.path.join(output_bamdir, "preprocessing", "{samples}.raw_map.bai")),
     params:
         genome = config['references']['BWAGENOME'],
         sample = "{samples}",
@@ -115,46 +116,21 @@ rule bwa_mem:
         config['images']['wes_base']
     threads: 24
     shell: """
-    myoutdir="$(dirname {output})"
+    myoutdir="$(dirname {output.bam})"
     if [ ! -d "$myoutdir" ]; then mkdir -p "$myoutdir"; fi
+    # Fields and order of the read group bam_check writes, so
+    # final BAM files have the same header with LEAN_PREPROCESS
     bwa mem -M \\
-        -R \'@RG\\tID:{params.sample}\\tSM:{params.sample}\\tPL:illumina\\tLB:{params.sample}\\tPU:{params.sample}\\tCN:hgsc\\tDS:wes\' \\
+        -R \'@RG\\tID:{params.sample}\\tLB:{params.sample}\\tPL:illumina\\tSM:{params.sample}\\tPU:na\' \\
         -t {threads} \\
         {params.genome} \\
         {input} | \\
     samblaster -M | \\
-    samtools sort -@12 -m 4G - -o {output}
+    samtools sort -@12 -m 4G --write-index - -o {output.bam}##idx##{output.bai}
     """
 
-localrules: raw_index
-rule raw_index:
-    """
-    Make index of mapped BAM file.
-    Honestly, it makes more sense to bundle this with the map step in most cases.
-    The reason to keep it separate is if you want to allow custom mapped files (before
-    recalibration) to be input into the pipeline. But we're not doing that here.
-    @Input:
-        One pair of FASTQ files (scatter)
-    @Output:
-        Aligned reads in BAM format
-    """
-    input:
-        bam = os.path.join(output_bamdir, "preprocessing", "{samples}.raw_map.bam")
-    output:
-        bai = temp(os.path.join(output_bamdir,"preprocessing","{samples}.raw_map.bai")),
-    params:
-        ver_samtools = config['tools']['samtools']['version'],
-        rname = 'raw_index'
-    envmodules:
-        config['tools']['samtools']['modname']
-    container:
-        config['images']['wes_base']
-    shell: """
-    samtools index -@ 2 {input.bam} {output.bai}
-    """
 
-
-rule gatk_recal:
+rule gatk_scatter_recal:
     """
     Base quality recalibration (BQSR), part of the GATK Best Practices.
     The idea is that each sequencer/run will have systematic biases.
@@ -162,45 +138,208 @@ rule gatk_recal:
     and uses it to adjust base quality on all sites, including novel sites of
     variation.  Since base quality is taken into account during variant calling,
     this will help pick up real variants in low depth or otherwise noisy loci.
+    The biases are learned from the padded exome targets of each chromosome or
+    shard, where the reads are, and BaseRecalibrator is single-threaded, so the
+    scatter units of a sample run as separate jobs.
     @Input:
         Aligned reads in BAM format (scatter)
     @Output:
-        Aligned reads in BAM format, with altered quality scores
+        Recalibration table of the scatter unit
     """
     input:
         bam = os.path.join(output_bamdir, "preprocessing", "{samples}.raw_map.bam"),
         bai = os.path.join(output_bamdir, "preprocessing", "{samples}.raw_map.bai"),
     output:
-        bam = os.path.join(input_bamdir, "{samples}.input.bam"),
-        re = temp(os.path.join(output_bamdir, "preprocessing", "{samples}_recal_data.grp"))
+        re = temp(os.path.join(output_bamdir, "preprocessing", "bqsr", "{samples}.{chroms}.recal.grp"))
     params:
         genome = config['references']['GENOME'],
         knowns = config['references']['KNOWNRECAL'],
         ver_gatk = config['tools']['gatk4']['version'],
-        chrom = chroms,
-        intervals = intervals_file,
-        rname = 'recal'
+        targets = scatter_targets,
+        # Shards are padded before they are planned, see
+        # plan_scatter.py; padding them again would count
+        # the bases at shard boundaries twice
+        padding = 0 if scatter_shards > 0 else 100,
+        rname = 'recal_scatter'
     envmodules:
         config['tools']['gatk4']['modname']
     container:
         config['images']['wes_base']
-    threads: 24
+    threads: 2
     shell: """
-    gatk --java-options '-Xmx48g' BaseRecalibrator \\
+    gatk --java-options '-Xmx4g' BaseRecalibrator \\
         --input {input.bam} \\
         --reference {params.genome} \\
         {params.knowns} \\
         --output {output.re} \\
-        --intervals {params.intervals}
+        --intervals {params.targets} \\
+        --interval-padding {params.padding}
+    """
 
-    gatk --java-options '-Xmx48g' ApplyBQSR \\
-        --reference {params.genome} \\
-        --input {input.bam} \\
-        --bqsr-recal-file {output.re} \\
-        --output {output.bam} \\
-        --use-jdk-inflater \\
-        --use-jdk-deflater
+
+rule gatk_gather_recal:
     """
+    Gathers the recalibration tables of each scatter unit of a sample.
+    @Input:
+        Recalibration tables of each scatter unit (gather)
+    @Output:
+        Recalibration table of the sample
+    """
+    input:
+        tables = expand(os.path.join(output_bamdir, "preprocessing", "bqsr", "{{samples}}.{chroms}.recal.grp"), chroms=bqsr_units),
+    output:
+        re = temp(os.path.join(output_bamdir, "preprocessing", "{samples}_recal_data.grp"))
+    params:
+        tables = lambda w, input: " ".join("--input {}".format(t) for t in input.tables),
+        ver_gatk = config['tools']['gatk4']['version'],
+        rname = 'recal_gather'
+    envmodules:
+        config['tools']['gatk4']['modname']
+    container:
+        config['images']['wes_base']
+    shell: """
+    gatk --java-options '-Xmx4g' GatherBQSRReports \\
+        {params.tables} \\
+        --output {output.re}
+    """
+
+
+if not lean_preprocess:
+    rule gatk_recal:
+        """
+        Applies the recalibration table of a sample, see gatk_scatter_recal,
+        to all of its reads.
+        @Input:
+            Aligned reads in BAM format and recalibration table (scatter)
+        @Output:
+            Aligned reads in BAM format, with altered quality scores
+        """
+        input:
+            bam = os.path.join(output_bamdir, "preprocessing", "{samples}.raw_map.bam"),
+            bai = os.path.join(output_bamdir, "preprocessing", "{samples}.raw_map.bai"),
+            re = os.path.join(output_bamdir, "preprocessing", "{samples}_recal_data.grp"),
+        output:
+            bam = os.path.join(input_bamdir, "{samples}.input.bam"),
+        params:
+            genome = config['references']['GENOME'],
+            ver_gatk = config['tools']['gatk4']['version'],
+            rname = 'recal'
+        envmodules:
+            config['tools']['gatk4']['modname']
+        container:
+            config['images']['wes_base']
+        threads: 4
+        shell: """
+        gatk --java-options '-Xmx16g' ApplyBQSR \\
+            --reference {params.genome} \\
+            --input {input.bam} \\
+            --bqsr-recal-file {input.re} \\
+            --output {output.bam} \\
+            --use-jdk-inflater \\
+            --use-jdk-deflater
+        """
+else:
+    # With LEAN_PREPROCESS, ApplyBQSR streams into the final
+    # BAM, so neither input.bam nor bam_check's re-headered
+    # copy of it are written for FASTQ inputs
+    ruleorder: gatk_apply_recal > bam_check
+
+    rule gatk_apply_recal:
+        """
+        Applies the recalibration table of a sample to its reads and writes
+        the final BAM file in a single pass, see gatk_recal and bam_check.
+        The contigs of the BAM file are split into groups of a similar length,
+        and ApplyBQSR runs over each group in parallel, streaming its reads
+        through a named pipe into samtools merge; unmapped reads are
+        recalibrated with the last group. bwa_mem writes the read group
+        that bam_check's AddOrReplaceReadGroups writes for its BAM files,
+        ID, LB, and SM set to the sample name, PL:illumina, and PU:na, so
+        the final BAM files of both modes have the same @RG header line.
+        @Input:
+            Aligned reads in BAM format and recalibration table (scatter)
+        @Output:
+            Aligned reads in BAM format, with altered quality scores and index file
+        """
+        input:
+            bam = os.path.join(output_bamdir, "preprocessing", "{samples}.raw_map.bam"),
+            bai = os.path.join(output_bamdir, "preprocessing", "{samples}.raw_map.bai"),
+            re = os.path.join(output_bamdir, "preprocessing", "{samples}_recal_data.grp"),
+        output:
+            bam = os.path.join(output_bamdir, "final_bams", "{samples}.bam"),
+            bai = os.path.join(output_bamdir, "final_bams", "{samples}.bai"),
+            bai2 = os.path.join(output_bamdir, "final_bams", "{samples}.bam.bai"),
+        params:
+            genome = config['references']['GENOME'],
+            ver_gatk = config['tools']['gatk4']['version'],
+            ver_samtools = config['tools']['samtools']['version'],
+            rname = 'recal_apply',
+            set_tmp = set_tmp(),
+        envmodules:
+            config['tools']['samtools']['modname'],
+            config['tools']['gatk4']['modname']
+        container:
+            config['images']['wes_base']
+        threads: 24
+        shell: """
+        # Setups temporary directory for
+        # intermediate files with built-in
+        # mechanism for deletion on exit
+        {params.set_tmp}
+
+        # Contigs in groups of a similar length,
+        # one ApplyBQSR per group and 3 threads each
+        groups=$(samtools view -H {input.bam} | awk -F '\\t' -v n=$(( {threads} > 3 ? {threads} / 3 : 1 )) -v tmp="$tmp" '
+            BEGIN {{ c = 0 }}
+            $1 == "@SQ" {{
+                for (i = 2; i <= NF; i++) {{
+                    if ($i ~ /^SN:/) name[c] = substr($i, 4)
+                    else if ($i ~ /^LN:/) size[c] = substr($i, 4)
+                }}
+                total += size[c++]
+            }}
+            END {{
+                g = 0
+                for (i = 0; i < c; i++) {{
+                    if (filled > 0 && g < n - 1 && filled + size[i] / 2 > (g + 1) * total / n) g++
+                    print name[i] > (tmp "/" g ".list")
+                    filled += size[i]
+                }}
+                print g + 1
+            }}')
+
+        for g in $(seq 0 $((groups - 1))); do
+            unmapped=""
+            if [ "$g" -eq $((groups - 1)) ]; then unmapped="--intervals unmapped"; fi
+            mkfifo "$tmp/$g.bam"
+            (
+                gatk --java-options "-Xmx4g -Djava.io.tmpdir=${{tmp}}" ApplyBQSR \\
+                    --reference {params.genome} \\
+                    --input {input.bam} \\
+                    --bqsr-recal-file {input.re} \\
+                    --intervals "$tmp/$g.list" $unmapped \\
+                    --output "$tmp/$g.bam" \\
+                    --create-output-bam-index false \\
+                    --use-jdk-inflater \\
+                    --use-jdk-deflater \\
+                || touch "$tmp/failed"
+            ) &
+        done
+        ( samtools merge -@ {threads} -c -p -f {output.bam} "$tmp"/*.bam || touch "$tmp/failed" ) &
+
+        # A failed ApplyBQSR or merge leaves the others blocked on their
+        # named pipes, which are opened and closed without reading to end them
+        while [ -n "$(jobs -pr)" ] && [ ! -e "$tmp/failed" ]; do sleep 5; done
+        if [ -e "$tmp/failed" ]; then
+            kill $(jobs -pr) 2> /dev/null || true
+            for fifo in "$tmp"/*.bam; do exec 3<> "$fifo"; exec 3>&-; done
+            echo "Error: failed to apply BQSR to {input.bam}" >&2
+            exit 1
+        fi
+        wait
+
+        samtools index -@ 2 {output.bam} {output.bai}
+        cp {output.bai} {output.bai2}
+        """
 
 
 rule bam_check:
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+from __future__ import print_function, division
+import argparse, errno, filecmp, hashlib, os, shutil, subprocess, sys, time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+# Content-addressed cache of small reference artifacts derived from the
+# pipeline's inputs, i.e. the normalized targets BED file and intervals.list,
+# shared across pipeline output directories. An artifact is keyed by the
+# sha256 of the contents of its inputs, including the script that builds it,
+# so editing either one produces a new entry. Entries are published with an
+# atomic rename and evicted least recently used first once the cache grows
+# over its size cap; each hit refreshes the mtime of its entry directory, and
+# entries used within the grace period are never evicted. Outputs are copies
+# of the cached artifact, which are small, so a hit in one output directory
+# never changes the files, or their mtimes, of another; an output that already
+# holds the artifact is left untouched. Cached artifacts are read-only.
+#   <cache>/<key[:2]>/<key>/<name>
+# Example
+# $ python artifact_cache.py run --cache ~/.cache/xavier/artifacts \
+#     --name exome_targets.bed --inputs targets.bed normalize_bed.py \
+#     --output exome_targets.bed -- python3 normalize_bed.py -i targets.bed
+
+# Environment variable to override the default
+# location of the cache, see default_path()
+ENVIRONMENT_VARIABLE = "XAVIER_ARTIFACT_CACHE"
+
+# Default size cap of the cache
+DEFAULT_MAX_SIZE = "1G"
+
+# Entries used within this many days are never evicted
+DEFAULT_GRACE_DAYS = 7
+
+
+def default_path():
+    """Returns the default location of the artifact cache, shared by all of a
+    user's pipeline output directories: $XAVIER_ARTIFACT_CACHE, otherwise
+    $XDG_CACHE_HOME/xavier/artifacts or ~/.cache/xavier/artifacts.
+    @return path <str>:
+        Absolute path to the artifact cache
+    """
+    path = os.environ.get(ENVIRONMENT_VARIABLE, "")
+    if not path:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        path = os.path.join(base, "xavier", "artifacts")
+    return os.path.abspath(path)
+
+
+def parse_size(size):
+    """Converts a human readable size to bytes, i.e. 500M or 1G.
+    @param size <str>:
+        Number of bytes with an optional K, M, G, or T suffix
+    @return size <int>:
+        Number of bytes
+    """
+    size = str(size).strip().upper().rstrip("B")
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def artifact_key(name, inputs=[], contents=[]):
+    """Returns the key of an artifact.
+    @param name <str>:
+        Name of the artifact, i.e. exome_targets.bed
+    @param inputs list[<str>]:
+        Files the artifact is derived from, including the script that builds it
+    @param contents list[<bytes>]:
+        Additional content the artifact is derived from
+    @return key <str>:
+        sha256 hex digest of the name and the contents of each input
+    """
+    hasher = hashlib.sha256()
+    hasher.update(name.encode("utf-8"))
+    for filename in inputs:
+        hasher.update(b"\0file\0")
+        with open(filename, "rb") as fh:
+            for block in iter(lambda: fh.read(1 << 20), b""):
+                hasher.update(block)
+    for content in contents:
+        hasher.update(b"\0content\0")
+        hasher.update(content)
+    return hasher.hexdigest()
+
+
+def replace_copy(target, output):
+    """Copies target to output unless output is a file with the same
+    contents, replacing any existing file or symlink.
+    @return copied <bool>:
+        True if output was written
+    """
+    if (
+        os.path.isfile(output)
+        and not os.path.islink(output)
+        and filecmp.cmp(target, output, shallow=False)
+    ):
+        # Keeps its mtime, so rules using it are not re-run
+        return False
+    tmp = "{}.{}.tmp".format(output, os.getpid())
+    shutil.copyfile(target, tmp)
+    os.rename(tmp, output)
+    return True
+
+
+def remove(path):
+    """Removes a file or symlink, so writing to path never writes through a
+    link into the cache, i.e. of an older version of this script."""
+    if os.path.lexists(path):
+        os.remove(path)
+
+
+class ArtifactCache(object):
+    """Content-addressed cache of derived reference artifacts, see module
+    comment. Lookups are counted as hits or misses.
+    @param path <str>:
+        Path to the cache directory, created on first write
+    @param max_size <int>:
+        Size cap in bytes, least recently used entries are evicted above it
+    @param grace_days <float>:
+        Entries used within this many days are never evicted
+    """
+
+    def __init__(
+        self,
+        path,
+        max_size=parse_size(DEFAULT_MAX_SIZE),
+        grace_days=DEFAULT_GRACE_DAYS,
+    ):
+        self.path = os.path.abspath(path)
+        self.max_size = max_size
+        self.grace_days = grace_days
+        self.hits = 0
+        self.misses = 0
+
+    def entry(self, key):
+        """Directory of a cache entry."""
+        return os.path.join(self.path, key[:2], key)
+
+    def fetch(self, key, name, output):
+        """Copies a cached artifact to output, see replace_copy().
+        @return hit <bool>:
+            True if the artifact was cached, otherwise output is not touched
+        """
+        artifact = os.path.join(self.entry(key), name)
+        if not os.path.isfile(artifact):
+            self.misses += 1
+            return False
+        replace_copy(artifact, output)
+        try:
+            # Most recently used, see entries()
+            os.utime(self.entry(key), None)
+        except OSError:
+            # Owned by another user of a shared cache
+            pass
+        self.hits += 1
+        return True
+
+    def store(self, key, name, output):
+        """Copies an artifact into the cache, then evicts the least recently
+        used entries if the cache is over its size cap.
+        @return artifact <str>:
+            Path to the cached artifact
+        """
+        entry = self.entry(key)
+        if not os.path.isdir(entry):
+            parent = os.path.dirname(entry)
+            try:
+                os.makedirs(parent)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            tmp = os.path.join(parent, ".{}.{}.tmp".format(key, os.getpid()))
+            os.mkdir(tmp)
+            shutil.copy2(output, os.path.join(tmp, name))
+            # Read-only, shared by the output directories of other runs
+            os.chmod(os.path.join(tmp, name), 0o444)
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                # Published by another process in the meantime
+                shutil.rmtree(tmp, ignore_errors=True)
+        self.evict(keep=key)
+        return os.path.join(entry, name)
+
+    def entries(self):
+        """Returns (mtime, size, key) of each entry in the cache."""
+        entries = []
+        if not os.path.isdir(self.path):
+            return entries
+        for prefix in os.listdir(self.path):
+            parent = os.path.join(self.path, prefix)
+            if len(prefix) != 2 or not os.path.isdir(parent):
+                continue
+            for key in os.listdir(parent):
+                if key.startswith("."):
+                    continue
+                entry = os.path.join(parent, key)
+                try:
+                    size = sum(
+                        os.path.getsize(os.path.join(entry, f))
+                        for f in os.listdir(entry)
+                    )
+                    entries.append((os.stat(entry).st_mtime, size, key))
+                except OSError:
+                    continue
+        return entries
+
+    def evict(self, keep=None):
+        """Removes least recently used entries until the cache is under its
+        size cap, except entries used within the grace period. Eviction is
+        serialized across processes with a lock file.
+        @param keep <str>:
+            Key of an entry that is never evicted, i.e. the one just stored
+        @return evicted list[<str>]:
+            Keys of the evicted entries
+        """
+        evicted = []
+        recent = time.time() - self.grace_days * 24 * 60 * 60
+        lockfile = os.path.join(self.path, ".lock")
+        with open(lockfile, "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                entries = sorted(self.entries())
+                total = sum(size for _, size, _ in entries)
+                for mtime, size, key in entries:
+                    if total <= self.max_size or mtime > recent:
+                        # Sorted by mtime, all other entries are recent
+                        break
+                    if key == keep:
+                        continue
+                    shutil.rmtree(self.entry(key), ignore_errors=True)
+                    total -= size
+                    evicted.append(key)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+        return evicted
+
+    def stats(self):
+        """Returns a summary of cache hits and misses."""
+        return "Artifact cache {}: {} hit(s), {} miss(es)".format(
+            self.path, self.hits, self.misses
+        )
+
+
+def cached_write(cache, name, content, output):
+    """Copies a cached artifact with the given content to output, or writes
+    the content to output and adds it to the cache.
+    @param content <bytes>:
+        Contents of the artifact
+    @return hit <bool>:
+        True if the artifact was cached
+    """
+    key = artifact_key(name, contents=[content])
+    if cache.fetch(key, name, output):
+        return True
+    # Existing file, or a link of an older version of this script
+    remove(output)
+    with open(output, "wb") as fh:
+        fh.write(content)
+    cache.store(key, name, output)
+    return False
+
+
+def run(cache, name, inputs, output, command):
+    """Copies a cached artifact to output, or runs the command that builds
+    it and adds the output to the cache.
+    @param cache <ArtifactCache>:
+        Artifact cache
+    @param name <str>:
+        Name of the artifact
+    @param inputs list[<str>]:
+        Files the artifact is derived from, including the script that builds it
+    @param output <str>:
+        Path to the artifact, written by command
+    @param command list[<str>]:
+        Command that builds output from inputs
+    """
+    key = artifact_key(name, inputs)
+    if cache.fetch(key, name, output):
+        print("Re-using cached {} from {}".format(name, cache.entry(key)))
+        return
+    remove(output)
+    start = time.time()
+    subprocess.check_call(command)
+    cache.store(key, name, output)
+    print("Cached {} built in {:.1f}s".format(name, time.time() - start))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Content-addressed cache of derived reference artifacts"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparser_run = subparsers.add_parser(
+        "run", help="Link a cached artifact or build and cache it"
+    )
+    subparser_run.add_argument("--cache", default=default_path())
+    subparser_run.add_argument("--max-size", default=DEFAULT_MAX_SIZE)
+    subparser_run.add_argument("--grace-days", type=float, default=DEFAULT_GRACE_DAYS)
+    subparser_run.add_argument("--name", required=True)
+    subparser_run.add_argument("--inputs", nargs="+", required=True)
+    subparser_run.add_argument("--output", required=True)
+    subparser_run.add_argument("build", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    if args.command != "run":
+        parser.error("unknown command")
+    build = args.build[1:] if args.build[:1] == ["--"] else args.build
+    if not build:
+        parser.error("missing command that builds the artifact")
+    cache = ArtifactCache(args.cache, parse_size(args.max_size), args.grace_days)
+    run(cache, args.name, args.inputs, args.output, build)
+    print(cache.stats(), file=sys.stderr)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+from __future__ import print_function, division
+import contextlib, os, sys, io, json, threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+# On-disk cache of input file checksums and metadata, shared by the
+# workflow scripts and the xavier command-line interface. Each line of
+# the cache is a JSON record keyed by the realpath of a file, and a
+# record is only trusted if the inode, size, and mtime of the file have
+# not changed since it was written. Records are appended, the last one
+# written for a path wins, see ChecksumCache.compact().
+# Example
+# $ python checksum_cache.py /path/to/checksums.jsonl input.R1.fastq.gz
+# {"path": "/data/input.R1.fastq.gz", "inode": 1234, "size": 9876, ...}
+
+# Environment variable to override the default
+# location of the cache, e.g. a location that
+# is shared across pipeline output directories
+ENVIRONMENT_VARIABLE = "XAVIER_CHECKSUM_CACHE"
+
+
+def default_path(workdir):
+    """Returns the location of the checksum cache for a pipeline output
+    directory. The location can be overridden with the XAVIER_CHECKSUM_CACHE
+    environment variable to share one cache across output directories.
+    @param workdir <str>:
+        Pipeline output directory
+    @return path <str>:
+        Absolute path to the checksum cache
+    """
+    path = os.environ.get(ENVIRONMENT_VARIABLE, "")
+    if not path:
+        path = os.path.join(workdir, ".xavier", "checksums.jsonl")
+    return os.path.abspath(path)
+
+
+def fingerprint(filename):
+    """Returns the key and stat fingerprint used to validate cached records.
+    @param filename <str>:
+        File on local filesystem, symlinks are resolved
+    @return key, stat <tuple(str, dict)>:
+        Realpath of the file, and its inode, size, and mtime in microseconds
+    """
+    path = os.path.realpath(filename)
+    st = os.stat(path)
+    # Microseconds, python/2.7 does not have st_mtime_ns and its
+    # float st_mtime cannot represent nanoseconds exactly
+    mtime = getattr(st, "st_mtime_ns", None)
+    if mtime is None:
+        mtime = int(round(st.st_mtime * 1e6))
+    else:
+        mtime = int(round(mtime / 1000.0))
+    return path, {"inode": st.st_ino, "size": st.st_size, "mtime_us": mtime}
+
+
+class ChecksumCache(object):
+    """Persistent cache of checksums and metadata of input files. Lookups
+    are counted as hits or misses, see ChecksumCache.stats().
+    @param path <str>:
+        Path to JSON-lines cache file, created on first write
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.hits = 0
+        self.misses = 0
+        # Lookups may run in a thread pool
+        self._lock = threading.Lock()
+        self._records = self._load()
+
+    def _load(self):
+        records = {}
+        try:
+            with io.open(self.path, "r", encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        record = json.loads(line)
+                        records[record["path"]] = record
+                    except (ValueError, KeyError, TypeError):
+                        # Skip truncated or malformed
+                        # lines from interrupted writes
+                        continue
+        except (IOError, OSError):
+            pass
+        return records
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Holds an exclusive lock on the cache across processes. A separate
+        lock file is used since compact() replaces the cache file itself.
+        """
+        parent = os.path.dirname(self.path)
+        if not os.path.isdir(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                # Created by a concurrent job
+                pass
+        with open(self.path + ".lock", "a") as fh:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _lines(records):
+        lines = "".join(json.dumps(r, sort_keys=True) + "\n" for r in records)
+        if isinstance(lines, bytes):
+            # python/2.7 json.dumps returns bytes
+            lines = lines.decode("utf-8")
+        return lines
+
+    def _write(self, records):
+        with self._locked():
+            with io.open(self.path, "a", encoding="utf-8") as fh:
+                fh.write(self._lines(records))
+                fh.flush()
+
+    def get(self, filename, field="md5"):
+        """Returns a cached value for a file if the file has not changed.
+        @param filename <str>:
+            File on local filesystem
+        @param field <str>:
+            Name of the cached value, i.e. md5
+        @return value <any>:
+            Cached value, or None on a cache miss
+        """
+        try:
+            key, stat = fingerprint(filename)
+        except OSError:
+            # Missing file or broken symlink
+            with self._lock:
+                self.misses += 1
+            return None
+        record = self._records.get(key)
+        if (
+            record is not None
+            and field in record
+            and all(record.get(k) == v for k, v in stat.items())
+        ):
+            with self._lock:
+                self.hits += 1
+            return record[field]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, filename, **fields):
+        """Stores values for a file, i.e. put(filename, md5="..."). Values
+        cached for an unchanged file are kept, stale values are dropped.
+        @param filename <str>:
+            File on local filesystem
+        @param fields <dict>:
+            JSON serializable values to cache
+        """
+        key, stat = fingerprint(filename)
+        record = self._records.get(key, {})
+        if any(record.get(k) != v for k, v in stat.items()):
+            record = {}
+        record = dict(record, path=key, **stat)
+        record.update(fields)
+        self._records[key] = record
+        self._write([record])
+
+    def md5sum(self, filename, blocksize=65536):
+        """Gets md5 checksum of a file, computed only on a cache miss.
+        @param filename <str>:
+            Input file on local filesystem to find md5 checksum
+        @param blocksize <int>:
+            Blocksize of reading N chunks of data to reduce memory profile
+        @return md5 <str>:
+            MD5 checksum of the file's contents
+        """
+        md5 = self.get(filename)
+        if md5 is None:
+            import hashlib
+
+            hasher = hashlib.md5()
+            with open(filename, "rb") as fh:
+                buf = fh.read(blocksize)
+                while len(buf) > 0:
+                    hasher.update(buf)
+                    buf = fh.read(blocksize)
+            md5 = hasher.hexdigest()
+            self.put(filename, md5=md5)
+        return md5
+
+    def compact(self):
+        """Rewrites the cache with one record per path, dropping records
+        of files that no longer exist or have changed since they were cached.
+        The cache is re-read under the lock, so records appended by other
+        processes are kept, and replaced atomically, so readers never see a
+        partial file. The cache file is created if it does not exist.
+        """
+        with self._locked():
+            records = []
+            for key, record in sorted(self._load().items()):
+                try:
+                    _, stat = fingerprint(key)
+                except OSError:
+                    continue
+                if all(record.get(k) == v for k, v in stat.items()):
+                    records.append(record)
+            tmp = "{}.{}.tmp".format(self.path, os.getpid())
+            with io.open(tmp, "w", encoding="utf-8") as fh:
+                fh.write(self._lines(records))
+                fh.flush()
+                os.fsync(fh.fileno())
+            getattr(os, "replace", os.rename)(tmp, self.path)
+        self._records = dict((r["path"], r) for r in records)
+
+    def stats(self):
+        """Returns a log message with the number of cache hits and misses."""
+        return "Checksum cache {}: {} hit(s), {} miss(es)".format(
+            self.path, self.hits, self.misses
+        )
+
+
+if __name__ == "__main__":
+    # Prints cached records of the given files
+    usage = "Usage: python {} checksums.jsonl file [file ...]".format(sys.argv[0])
+    if "-h" in sys.argv or "--help" in sys.argv:
+        print(usage)
+        sys.exit(0)
+    elif len(sys.argv) < 3:
+        print(usage)
+        sys.exit(1)
+    cache = ChecksumCache(sys.argv[1])
+    for filename in sys.argv[2:]:
+        key, _ = fingerprint(filename)
+        if cache.get(filename, field="path") is not None:
+            print(json.dumps(cache._records[key], sort_keys=True))
+    print(cache.stats(), file=sys.stderr)
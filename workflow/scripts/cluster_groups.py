@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""Packs the jobs of short rules into grouped SLURM submissions, configured
+per rule in the cluster config, i.e. config/cluster.biowulf.json. A rule joins
+a group with its "group" key and gives the estimated runtime of one of its
+jobs with its "runtime" key. The entry of the group sets the resources of a
+grouped submission, i.e. "threads", "mem", and "time", and "pack" the runtime
+to fill each submission with:
+  "samtools_flagstats": {"group": "qc_sample", "runtime": "0:05:00"},
+  "qc_sample": {"threads": "16", "mem": "64G", "time": "4:00:00", "pack": "0:40:00"}
+Each submission runs pack / runtime jobs of the group, using the runtime of
+its slowest rule. Snakemake runs the jobs of a submission in parallel, so the
+group requests that many times the threads and memory of its largest rule,
+see check(). Jobs of rules in the same group that depend on each other
+are always submitted together, so the rules of a group should not depend on
+each other for the number of jobs per submission to hold.
+The args sub-command prints the --groups and --group-components options of
+snakemake. The simulate sub-command predicts the number of SLURM submissions,
+and the time they spend in the queue, with and without the groups from the
+number of jobs per rule of a dry-run, i.e. xavier run --runmode dryrun.
+Both warn about groups that request fewer threads or less memory than their
+jobs need.
+USAGE:
+  $ python cluster_groups.py args cluster.json
+  $ python cluster_groups.py simulate -c cluster.json -d dryrun.<timestamp>.log
+"""
+
+from __future__ import print_function, division
+import argparse
+import io
+import json
+import math
+import re
+import sys
+
+# Submissions shorter than this many minutes
+# are the short jobs that flood the scheduler
+SHORT_MINUTES = 5
+
+# Local rules of the pipeline, see localrules
+# in workflow/Snakefile and workflow/rules
+DEFAULT_LOCAL = [
+    "all", "nidap", "reformat_targets_bed", "collect_cohort_mafs",
+    "somalier_extract", "somalier_analysis",
+]  # fmt: skip
+
+
+def parse_time(value):
+    """Converts a SLURM time limit to minutes, i.e. 30, 4:00:00, or 2-00:00:00.
+    @param value <str>:
+        Time in minutes, [HH:]MM:SS, or D-HH[:MM[:SS]]
+    @return minutes <float>:
+        Time in minutes
+    """
+    value = str(value).strip()
+    days = 0
+    if "-" in value:
+        days, value = value.split("-", 1)
+        fields = [int(f) for f in value.split(":")]
+        fields += [0] * (3 - len(fields))
+        hours, minutes, seconds = fields
+    else:
+        fields = [int(f) for f in value.split(":")]
+        if len(fields) == 1:
+            return float(fields[0])
+        if len(fields) == 2:
+            fields = [0] + fields
+        hours, minutes, seconds = fields
+    return int(days) * 24 * 60 + hours * 60 + minutes + seconds / 60.0
+
+
+def parse_mem(value):
+    """Converts a memory amount of sacct --units=G, i.e. 12.5G, 32Gn, or 500M,
+    to gigabytes.
+    @param value <str>:
+        Memory with an optional K, M, G, or T suffix, default G
+    @return gigabytes <float>:
+        Memory in gigabytes, None if it was not recorded
+    """
+    match = re.match(r"^([0-9.]+)([KMGT]?)[nc]?$", str(value).strip(), re.I)
+    if not match:
+        return None
+    scale = {"K": 1.0 / 1024**2, "M": 1.0 / 1024, "G": 1.0, "T": 1024.0}
+    return float(match.group(1)) * scale[(match.group(2) or "G").upper()]
+
+
+def load(path):
+    """Reads a cluster config."""
+    with io.open(path, "r") as fh:
+        return json.load(fh)
+
+
+def groups(cluster):
+    """Returns the groups of a cluster config.
+    @param cluster dict[<str>, dict]:
+        Cluster config
+    @return groups dict[<str>, dict]:
+        Rules, runtime of a job in minutes, number of jobs per submission, and
+        threads and gigabytes of memory those jobs need in parallel, of each
+        group; rules without threads or mem use the __default__ entry
+    """
+    default = cluster.get("__default__", {})
+    packed = {}
+    for rule, entry in sorted(cluster.items()):
+        group = entry.get("group")
+        if not group:
+            continue
+        if group not in cluster:
+            raise ValueError(
+                "Group {} of rule {} has no entry in the cluster config".format(
+                    group, rule
+                )
+            )
+        if "runtime" not in entry:
+            raise ValueError("Rule {} of group {} has no runtime".format(rule, group))
+        info = packed.setdefault(
+            group, {"rules": [], "runtime": 0.0, "threads": 0, "mem": 0.0}
+        )
+        info["rules"].append(rule)
+        info["runtime"] = max(info["runtime"], parse_time(entry["runtime"]))
+        threads = int(entry.get("threads", default.get("threads", 1)))
+        mem = parse_mem(entry.get("mem", default.get("mem", "0"))) or 0.0
+        info["threads"] = max(info["threads"], threads)
+        info["mem"] = max(info["mem"], mem)
+    for group, info in packed.items():
+        pack = parse_time(cluster[group].get("pack", cluster[group].get("time", 60)))
+        info["components"] = max(1, int(pack // max(info["runtime"], 1)))
+        info["threads"] *= info["components"]
+        info["mem"] *= info["components"]
+    return packed
+
+
+def check(cluster):
+    """Checks that each group requests the threads and memory of the jobs
+    of a submission, which snakemake runs in parallel.
+    @param cluster dict[<str>, dict]:
+        Cluster config
+    @return warnings list[<str>]:
+        Groups requesting fewer threads or less memory than their jobs need
+    """
+    default = cluster.get("__default__", {})
+    warnings = []
+    for group, info in sorted(groups(cluster).items()):
+        threads = int(cluster[group].get("threads", default.get("threads", 1)))
+        mem = parse_mem(cluster[group].get("mem", default.get("mem", "0"))) or 0.0
+        if threads < info["threads"] or mem < info["mem"]:
+            warnings.append(
+                "Group {} requests {} threads and {:g}G, its {} parallel jobs "
+                "need {} threads and {:g}G".format(
+                    group, threads, mem, info["components"], info["threads"], info["mem"]
+                )
+            )  # fmt: skip
+    return warnings
+
+
+def snakemake_args(cluster):
+    """Returns the snakemake options that group the rules of a cluster config.
+    @param cluster dict[<str>, dict]:
+        Cluster config
+    @return args list[<str>]:
+        --groups and --group-components options, empty without groups
+    """
+    packed = groups(cluster)
+    if not packed:
+        return []
+    args = ["--groups"]
+    for group, info in sorted(packed.items()):
+        args += ["{}={}".format(rule, group) for rule in info["rules"]]
+    args += ["--group-components"]
+    args += [
+        "{}={}".format(group, info["components"])
+        for group, info in sorted(packed.items())
+    ]
+    return args
+
+
+def job_stats(path):
+    """Reads the number of jobs per rule of a snakemake dry-run log, from its
+    Job stats table.
+    @param path <str>:
+        Path to the output of snakemake --dry-run
+    @return jobs dict[<str>, <int>]:
+        Number of jobs of each rule
+    """
+    jobs = {}
+    in_table = False
+    with io.open(path, "r") as fh:
+        for line in fh:
+            line = line.strip()
+            if line.startswith("Job stats:"):
+                # Only the last table, a log may have several
+                jobs, in_table = {}, True
+                continue
+            if not in_table:
+                continue
+            fields = line.split()
+            if len(fields) == 2 and fields[1].isdigit():
+                if fields[0] == "total":
+                    in_table = False
+                else:
+                    jobs[fields[0]] = int(fields[1])
+            elif line and not re.match(r"^(job\s+count|[-\s]+)$", line):
+                in_table = False
+    if not jobs:
+        raise ValueError("No Job stats table in {}".format(path))
+    return jobs
+
+
+def simulate(cluster, jobs, queue_wait=10.0, local=[]):
+    """Predicts the SLURM submissions of a run with and without the groups
+    of a cluster config.
+    @param cluster dict[<str>, dict]:
+        Cluster config
+    @param jobs dict[<str>, <int>]:
+        Number of jobs of each rule, see job_stats()
+    @param queue_wait <float>:
+        Minutes each submission waits in the queue before it starts
+    @param local list[<str>]:
+        Rules that run in the master job instead of being submitted
+    @return rows list[dict]:
+        Jobs, submissions, short submissions, and queue hours with and
+        without groups, of each rule or group; the last row is the total
+    """
+    packed = groups(cluster)
+    grouped = dict((rule, g) for g, info in packed.items() for rule in info["rules"])
+    rows = {}
+    for rule, njobs in sorted(jobs.items()):
+        if rule in local:
+            continue
+        entry = cluster.get(rule, {})
+        runtime = parse_time(entry["runtime"]) if "runtime" in entry else None
+        short = runtime is not None and runtime < SHORT_MINUTES
+        name = grouped.get(rule, rule)
+        row = rows.setdefault(
+            name,
+            {"name": name, "jobs": 0, "submissions": 0, "short": 0, "grouped": 0,
+             "grouped_short": 0},
+        )  # fmt: skip
+        row["jobs"] += njobs
+        row["submissions"] += njobs
+        row["short"] += njobs if short else 0
+        if rule not in grouped:
+            row["grouped"] += njobs
+            row["grouped_short"] += njobs if short else 0
+    for group, info in packed.items():
+        if group not in rows:
+            continue
+        row = rows[group]
+        row["grouped"] = int(math.ceil(row["jobs"] / info["components"]))
+        # Jobs of the last submission of a group
+        rest = row["jobs"] - (row["grouped"] - 1) * info["components"]
+        row["grouped_short"] = sum(
+            1
+            for n in [info["components"]] * (row["grouped"] - 1) + [rest]
+            if n * info["runtime"] < SHORT_MINUTES
+        )
+    total = {"name": "total", "jobs": 0, "submissions": 0, "short": 0, "grouped": 0,
+             "grouped_short": 0}  # fmt: skip
+    rows = [rows[name] for name in sorted(rows)]
+    for row in rows:
+        for key in ("jobs", "submissions", "short", "grouped", "grouped_short"):
+            total[key] += row[key]
+    for row in rows + [total]:
+        row["queue_hours"] = row["submissions"] * queue_wait / 60.0
+        row["grouped_queue_hours"] = row["grouped"] * queue_wait / 60.0
+    return rows + [total]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Packs the jobs of short rules into grouped SLURM submissions"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparser_args = subparsers.add_parser(
+        "args", help="Prints the snakemake options of the groups"
+    )
+    subparser_args.add_argument("cluster")
+    subparser_sim = subparsers.add_parser(
+        "simulate", help="Predicts the submissions of a run with and without groups"
+    )
+    subparser_sim.add_argument("-c", "--cluster", required=True)
+    subparser_sim.add_argument("-d", "--dryrun", required=True)
+    subparser_sim.add_argument("-q", "--queue-wait", default="10")
+    subparser_sim.add_argument("-l", "--local", nargs="+", default=DEFAULT_LOCAL)
+    args = parser.parse_args()
+    if args.command not in ("args", "simulate"):
+        parser.error("unknown command")
+
+    cluster = load(args.cluster)
+    for warning in check(cluster):
+        print("Warning: {}".format(warning), file=sys.stderr)
+    if args.command == "args":
+        print(" ".join(snakemake_args(cluster)))
+        return
+    rows = simulate(
+        cluster, job_stats(args.dryrun), parse_time(args.queue_wait), args.local
+    )
+    columns = [
+        "name", "jobs", "submissions", "short", "queue_hours",
+        "grouped", "grouped_short", "grouped_queue_hours",
+    ]  # fmt: skip
+    print("\t".join(columns))
+    for row in rows:
+        print(
+            "\t".join(
+                "{:.1f}".format(row[c]) if isinstance(row[c], float) else str(row[c])
+                for c in columns
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 # -*- coding: UTF-8 -*-
 
 from __future__ import print_function, division
-import sys, gzip
+import os, sys, zlib, hashlib, argparse, subprocess, threading
 
 
 # USAGE
@@ -10,6 +10,15 @@ import sys, gzip
 # sys.argv[2] = sample_name (name without PATH and .R?.fastq.gz extension)
 # Example
 # $ python get_flowcell_lanes.py input.R1.fastq.gz input > flowcell_lanes.txt
+# The FastQ file is read exactly once: the compressed bytes are
+# md5 hashed and inflated from the same buffer, see scan().
+# $ python get_flowcell_lanes.py --decompressor pigz input.R1.fastq.gz input
+# Flowcells and lanes can also be sampled from the start of the file (and
+# across BGZF blocks), the number of reads is then an estimate, see sample().
+# $ python get_flowcell_lanes.py --fast --sample 500000 input.R1.fastq.gz input
+# Results of an exact scan are cached by inode, size, and mtime, so reruns
+# over unchanged FastQ files skip reading the file, see checksum_cache.py.
+# $ python get_flowcell_lanes.py --checksum-cache .xavier/checksums.jsonl input.R1.fastq.gz input
 
 # Input 1 (Normal FastQ from Casava > 1.8)
 # @J00170:88:ANYVJBBXX:8:1101:1600:1244 1:N:0:ACTTGA
@@ -30,34 +39,6 @@ import sys, gzip
 # CC@FFFFFHHHHHJJJJJJJJJJJJJJJJJJJJJJJJJJJJJJJHIJJJJI
 
 
-def usage(message="", exitcode=0):
-    """Displays help and usage information. If provided invalid usage
-    returns non-zero exit-code. Additional message can be displayed with
-    the 'message' parameter.
-    """
-    print(
-        "Usage: python {} sampleName.R1.fastq.gz  sampleName > sampleName.flowcell_lanes.txt".format(
-            sys.argv[0]
-        )
-    )
-    if message:
-        print(message)
-    sys.exit(exitcode)
-
-
-def reader(fname):
-    """Returns correct file object handler or reader for gzipped
-    or non-gzipped FastQ files based on the file extension. Assumes
-    gzipped files endwith the '.gz' extension.
-    """
-    if fname.endswith(".gz"):
-        # Opens up file with gzip handler
-        return gzip.open
-    else:
-        # Opens up file normal, uncompressed handler
-        return open
-
-
 def get_flowcell_lane(sequence_identifier):
     """Returns flowcell and lane information for different fastq formats.
     FastQ files generated with older versions of Casava or downloaded from
@@ -97,7 +78,7 @@ def get_flowcell_lane(sequence_identifier):
         return id_list[2], id_list[3]
 
 
-def md5sum(filename, blocksize=65536):
+def md5sum(filename, blocksize=65536, cache=None):
     """Gets md5checksum of a file in memory-safe manner.
     The file is read in blocks defined by the blocksize parameter. This is a safer
     option to reading the entire file into memory if the file is very large.
@@ -105,10 +86,13 @@ def md5sum(filename, blocksize=65536):
         Input file on local filesystem to find md5 checksum
     @param blocksize <int>:
         Blocksize of reading N chunks of data to reduce memory profile
+    @param cache <checksum_cache.ChecksumCache>:
+        Optional persistent cache, the file is only hashed on a cache miss
     @return hasher.hexdigest() <str>:
         MD5 checksum of the file's contents
     """
-    import hashlib
+    if cache is not None:
+        return cache.md5sum(filename, blocksize)
 
     hasher = hashlib.md5()
     with open(filename, "rb") as fh:
@@ -120,51 +104,431 @@ def md5sum(filename, blocksize=65536):
     return hasher.hexdigest()
 
 
-if __name__ == "__main__":
-    # Check Usage
-    if "-h" in sys.argv or "--help" in sys.argv or "-help" in sys.argv:
-        usage(exitcode=0)
-    elif len(sys.argv) != 3:
-        usage(
-            message="Error: failed to provide all required positional arguments!",
-            exitcode=1,
+# Decompressors that can inflate the raw gzip stream, the
+# first importable or installed option is used by 'auto'
+DECOMPRESSORS = ["auto", "isal", "zlib", "igzip", "pigz"]
+
+
+def _decompressobj(decompressor):
+    """Returns a zlib-compatible decompression object for a gzip stream.
+    python-isal provides a drop-in replacement for zlib that is backed
+    by Intel's ISA-L igzip, which inflates 2-3x faster than zlib.
+    @param decompressor <str>:
+        Name of the in-process decompressor: auto, isal, or zlib
+    @return decompressobj <zlib.Decompress>:
+        Decompression object, wbits set to accept a gzip header
+    """
+    if decompressor in ("auto", "isal"):
+        try:
+            from isal import isal_zlib
+
+            return isal_zlib.decompressobj(16 + isal_zlib.MAX_WBITS)
+        except ImportError:
+            if decompressor == "isal":
+                sys.exit("Error: --decompressor isal requires python-isal!")
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+def _tee(fh, hasher, blocksize):
+    """Generator that reads raw blocks from an open binary file handle and
+    updates the checksum with each block before yielding it downstream.
+    """
+    buf = fh.read(blocksize)
+    while buf:
+        hasher.update(buf)
+        yield buf
+        buf = fh.read(blocksize)
+
+
+def _inflate(blocks, decompressor="auto"):
+    """Generator that inflates a stream of raw gzip blocks. Handles
+    multi-member gzip files, like BGZF or concatenated FastQ files,
+    by starting a new decompression object at each member boundary.
+    """
+    inflater = _decompressobj(decompressor)
+    for block in blocks:
+        # One decompressed chunk per raw block, even
+        # if the block spans several gzip members
+        chunk = []
+        while block:
+            chunk.append(inflater.decompress(block))
+            # Start of next gzip member
+            block = inflater.unused_data
+            if block:
+                inflater = _decompressobj(decompressor)
+        if len(chunk) > 1:
+            chunk = [b"".join(chunk)]
+        if chunk[0]:
+            yield chunk[0]
+    chunk = inflater.flush()
+    if chunk:
+        yield chunk
+
+
+def _inflate_external(blocks, command, blocksize):
+    """Generator that inflates a stream of raw gzip blocks with an external
+    decompressor, like pigz or igzip. Raw blocks are fed to the process's
+    standard input from a separate thread, so the file is still only read
+    and hashed once.
+    """
+    proc = subprocess.Popen(
+        [command, "-d", "-c"], stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    )
+
+    def feed():
+        try:
+            for block in blocks:
+                proc.stdin.write(block)
+        finally:
+            proc.stdin.close()
+
+    feeder = threading.Thread(target=feed)
+    feeder.daemon = True
+    feeder.start()
+    chunk = proc.stdout.read(blocksize)
+    while chunk:
+        yield chunk
+        chunk = proc.stdout.read(blocksize)
+    feeder.join()
+    if proc.wait() != 0:
+        sys.exit("Error: {} failed to decompress the input file!".format(command))
+
+
+def _chunks(fh, hasher, decompressor="auto", blocksize=4194304):
+    """Generator that yields decompressed chunks of an open FastQ file.
+    Each raw block is read once, added to the checksum, and then inflated.
+    Uncompressed FastQ files are passed through as is.
+    """
+    blocks = _tee(fh, hasher, blocksize)
+    if not fh.name.endswith(".gz"):
+        for block in blocks:
+            yield block
+    elif decompressor in ("igzip", "pigz"):
+        for chunk in _inflate_external(blocks, decompressor, blocksize):
+            yield chunk
+    else:
+        for chunk in _inflate(blocks, decompressor):
+            yield chunk
+
+
+def _decode(value):
+    """Returns a native string from a bytes object."""
+    if isinstance(value, str):
+        return value
+    return value.decode("utf-8", "replace")
+
+
+def _parse(headers, pairs):
+    """Adds the (flowcell, lane) of each sequence identifier to a set.
+    Casava >= 1.8 identifiers are parsed with a bounded split, other
+    formats fall back to get_flowcell_lane().
+    """
+    for header in headers:
+        fields = header.split(b":", 7)
+        if len(fields) >= 7:
+            # Casava >= 1.8, normal FastQ format
+            pairs.add((fields[2], fields[3]))
+        else:
+            fc, lane = get_flowcell_lane(_decode(header))
+            pairs.add((fc.lstrip("@"), lane))
+
+
+def _consume(chunks, pairs, max_reads=None):
+    """Splits decompressed chunks into lines in bulk and parses every 4th line,
+    the sequence identifier. Stops early once max_reads records have been seen.
+    @return (nlines, exhausted) <tuple(int, bool)>:
+        Number of lines seen and whether the end of the file was reached
+    """
+    nlines = 0
+    offset = 0  # index of the next sequence identifier in a chunk
+    carry = b""  # incomplete line from the previous chunk
+    for chunk in chunks:
+        lines = (carry + chunk).split(b"\n")
+        carry = lines.pop()
+        _parse(lines[offset::4], pairs)
+        nlines += len(lines)
+        offset = (offset - len(lines)) % 4
+        if max_reads and nlines >= 4 * max_reads:
+            return nlines, False
+
+    if carry:
+        # File does not end with a newline
+        if offset == 0:
+            _parse([carry], pairs)
+        nlines += 1
+
+    return nlines, True
+
+
+def _summary(pairs, reads, md5):
+    """Returns a dictionary of the unique flowcells, lanes, and flowcell_lanes."""
+    meta = {"flowcell": set(), "lane": set(), "flowcell_lane": set()}
+    for fc, lane in pairs:
+        fc, lane = _decode(fc).strip(), _decode(lane).strip()
+        meta["flowcell"].add(fc)
+        meta["lane"].add(lane)
+        meta["flowcell_lane"].add("{}_{}".format(fc, lane))
+    meta["reads"] = reads
+    meta["md5"] = md5
+
+    return meta
+
+
+def scan(filename, decompressor="auto", blocksize=4194304):
+    """Gets flowcell and lane information and the md5 checksum of a FastQ file
+    in a single pass over the file. Decompressed chunks are split into lines
+    in bulk, and only every 4th line (the sequence identifier) is parsed.
+    @param filename <str>:
+        Input FastQ file, gzipped or uncompressed
+    @param decompressor <str>:
+        Decompressor used to inflate gzipped files, see DECOMPRESSORS
+    @param blocksize <int>:
+        Number of raw bytes to read from the file at a time
+    @return meta <dict>:
+        Dictionary containing the number of reads, the set of flowcells,
+        lanes, flowcell_lanes, and the md5 checksum of the file
+    """
+    hasher = hashlib.md5()
+    pairs = set()  # unique (flowcell, lane) tuples
+    with open(filename, "rb") as fh:
+        nlines, _ = _consume(_chunks(fh, hasher, decompressor, blocksize), pairs)
+
+    return _summary(pairs, nlines // 4, hasher.hexdigest())
+
+
+def is_bgzf(filename):
+    """Checks if a file is BGZF compressed, i.e. its first gzip member
+    contains the 'BC' extra subfield with the size of the block.
+    """
+    with open(filename, "rb") as fh:
+        header = fh.read(18)
+    return (
+        len(header) == 18
+        and header[:4] == b"\x1f\x8b\x08\x04"
+        and header[12:14] == b"BC"
+    )
+
+
+def _bgzf_window(fh, offset, nblocks=4):
+    """Seeks to a raw offset in a BGZF file, finds the start of the next
+    BGZF block, and inflates the next nblocks blocks.
+    @return data <bytes>:
+        Decompressed data, may start and end with partial FastQ records
+    """
+    fh.seek(offset)
+    buf = fh.read(131072)
+    start = buf.find(b"\x1f\x8b\x08\x04")
+    while start != -1 and buf[start + 12 : start + 14] != b"BC":
+        start = buf.find(b"\x1f\x8b\x08\x04", start + 1)
+    if start == -1:
+        return b""
+
+    fh.seek(offset + start)
+    data = []
+    for _ in range(nblocks):
+        header = fh.read(18)
+        if len(header) < 18 or header[12:14] != b"BC":
+            break
+        # BSIZE is the total block size minus one
+        bsize = bytearray(header[16:18])
+        block = header + fh.read(bsize[0] + 256 * bsize[1] + 1 - 18)
+        try:
+            data.append(zlib.decompress(block, 16 + zlib.MAX_WBITS))
+        except zlib.error:
+            break
+
+    return b"".join(data)
+
+
+def _headers(data):
+    """Returns the complete sequence identifiers in a window of FastQ data.
+    The window is synced to the first line that starts with '@' and
+    whose record has a '+' separator line two lines below it.
+    """
+    lines = data.split(b"\n")[1:-1]  # drop partial first and last lines
+    for i in range(min(len(lines) - 2, 8)):
+        if lines[i].startswith(b"@") and lines[i + 2].startswith(b"+"):
+            return lines[i : len(lines) - 3 : 4]
+    return []
+
+
+def sample(filename, reads=1000000, windows=16, decompressor="auto"):
+    """Gets flowcell and lane information from a bounded prefix of a FastQ
+    file. If the file is BGZF compressed, additional windows evenly spaced
+    across the file are inflated to catch flowcells and lanes that only
+    appear later in the file. The total number of reads is estimated from
+    the compressed file size and the number of raw bytes per record in the
+    prefix. If the whole file fits in the prefix, results are exact.
+    @param filename <str>:
+        Input FastQ file, gzipped or uncompressed
+    @param reads <int>:
+        Number of reads to parse from the start of the file
+    @param windows <int>:
+        Number of evenly spaced windows to sample from a BGZF file
+    @param decompressor <str>:
+        In-process decompressor used to inflate gzipped files
+    @return meta <dict>:
+        Dictionary containing the number of reads, the set of flowcells,
+        lanes, flowcell_lanes, and the md5 checksum of the file (None if
+        the file was not read to the end)
+    """
+    if decompressor in ("igzip", "pigz"):
+        decompressor = "auto"
+    hasher = hashlib.md5()
+    pairs = set()
+    size = os.path.getsize(filename)
+    with open(filename, "rb") as fh:
+        nlines, exhausted = _consume(
+            _chunks(fh, hasher, decompressor, 262144), pairs, max_reads=reads
         )
+        if exhausted:
+            return _summary(pairs, nlines // 4, hasher.hexdigest())
+        consumed = fh.tell()
+
+        if fh.name.endswith(".gz") and is_bgzf(filename):
+            for i in range(1, windows):
+                offset = consumed + (size - consumed) * i // windows
+                _parse(_headers(_bgzf_window(fh, offset)), pairs)
+
+    estimate = int(round(nlines / 4.0 * size / consumed))
+    return _summary(pairs, estimate, None)
 
-    # Get file name and sample name prefix
-    filename = sys.argv[1]
-    sample = sys.argv[2]
-    # Get md5 checksum
-    md5 = md5sum(filename)
-
-    # Get Flowcell and Lane information
-    handle = reader(filename)
-    meta = {"flowcell": [], "lane": [], "flowcell_lane": []}
-    i = 0  # keeps track of line number
-    with handle(filename, "r") as file:
-        print(
-            "sample_name\ttotal_read_pairs\tflowcell_ids\tlanes\tflowcell_lanes\tmd5_checksum"
+
+def parsed_arguments():
+    """Parses user-provided command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Gets flowcell and lane information and the md5 checksum of a FastQ file."
+    )
+    parser.add_argument(
+        "filename", help="Input FastQ file, i.e. sampleName.R1.fastq.gz"
+    )
+    parser.add_argument("sample", help="Sample name, i.e. sampleName")
+    parser.add_argument(
+        "--decompressor",
+        choices=DECOMPRESSORS,
+        default="auto",
+        help="Decompressor used to inflate gzipped FastQ files. 'auto' uses python-isal "
+        "if it is installed, otherwise zlib. 'igzip' and 'pigz' run the external "
+        "tool on the same stream of raw bytes [Default: auto]",
+    )
+    parser.add_argument(
+        "--blocksize",
+        type=int,
+        default=4194304,
+        help="Number of raw bytes read from the FastQ file at a time [Default: 4 MiB]",
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--exact",
+        action="store_true",
+        help="Read the whole FastQ file to get exact read counts and an md5 "
+        "checksum. This is the default unless --fast or --sample is provided.",
+    )
+    mode.add_argument(
+        "--fast",
+        action="store_true",
+        help="Only read a bounded prefix of the FastQ file, plus evenly spaced "
+        "windows if the file is BGZF compressed. The total number of reads is "
+        "estimated and the md5 checksum is reported as NA.",
+    )
+    parser.add_argument(
+        "--sample",
+        dest="sample_reads",
+        type=int,
+        metavar="N",
+        default=None,
+        help="Number of reads to parse from the start of the file in --fast "
+        "mode, implies --fast [Default: 1000000]",
+    )
+    parser.add_argument(
+        "--windows",
+        type=int,
+        default=16,
+        help="Number of evenly spaced windows to sample from a BGZF "
+        "compressed file in --fast mode [Default: 16]",
+    )
+    parser.add_argument(
+        "--checksum-cache",
+        default="",
+        metavar="PATH",
+        help="Persistent cache of checksums and exact results keyed by "
+        "realpath, inode, size, and mtime, see checksum_cache.py. Unchanged "
+        "FastQ files are not read again [Default: no cache]",
+    )
+    args = parser.parse_args()
+    if args.sample_reads is not None and args.sample_reads < 1:
+        parser.error("--sample must be a positive number of reads")
+    args.fast = not args.exact and (args.fast or args.sample_reads is not None)
+
+    return args
+
+
+def cached(filename, cache):
+    """Returns the results of a previous exact scan of an unchanged file.
+    @param filename <str>:
+        Input FastQ file
+    @param cache <checksum_cache.ChecksumCache>:
+        Persistent checksum cache
+    @return meta <dict>:
+        Same as scan(), or None on a cache miss
+    """
+    record = cache.get(filename, field="fc_lane")
+    if record is None:
+        return None
+    meta = dict((k, set(record[k])) for k in ("flowcell", "lane", "flowcell_lane"))
+    meta["reads"] = record["reads"]
+    meta["md5"] = record["md5"]
+
+    return meta
+
+
+if __name__ == "__main__":
+    args = parsed_arguments()
+    cache, meta = None, None
+    if args.checksum_cache:
+        # Imported here, the script is also
+        # loaded as a module by the benchmarks
+        from checksum_cache import ChecksumCache
+
+        cache = ChecksumCache(args.checksum_cache)
+        meta = cached(args.filename, cache)
+
+    computed = False  # exact results from reading the file
+    if meta is None and args.fast:
+        meta = sample(
+            args.filename,
+            reads=args.sample_reads or 1000000,
+            windows=args.windows,
+            decompressor=args.decompressor,
         )
-        for line in file:
-            line = line.strip()
-            if i % 4 == 0:  # read id or sequence identifier
-                fc, lane = get_flowcell_lane(line)
-                fc = fc.lstrip("@")
-                fc_lane = "{}_{}".format(fc, lane)
-                if fc not in meta["flowcell"]:
-                    meta["flowcell"].append(fc)
-                if lane not in meta["lane"]:
-                    meta["lane"].append(lane)
-                if fc_lane not in meta["flowcell_lane"]:
-                    meta["flowcell_lane"].append(fc_lane)
-            i += 1
+        computed = meta["md5"] is not None
+        if cache is not None and not computed:
+            # Checksum from an earlier run
+            meta["md5"] = cache.get(args.filename)
+    elif meta is None:
+        meta = scan(args.filename, args.decompressor, args.blocksize)
+        computed = True
 
+    if cache is not None:
+        if computed:
+            record = dict(
+                (k, sorted(meta[k])) for k in ("flowcell", "lane", "flowcell_lane")
+            )
+            record["reads"] = meta["reads"]
+            record["md5"] = meta["md5"]
+            cache.put(args.filename, md5=meta["md5"], fc_lane=record)
+        print(cache.stats(), file=sys.stderr)
+
+    print(
+        "sample_name\ttotal_read_pairs\tflowcell_ids\tlanes\tflowcell_lanes\tmd5_checksum"
+    )
     print(
         "{}\t{}\t{}\t{}\t{}\t{}".format(
-            sample,
-            int(i / 4),
+            args.sample,
+            meta["reads"],
             ",".join(sorted(meta["flowcell"])),
             ",".join(sorted(meta["lane"])),
             ",".join(sorted(meta["flowcell_lane"])),
-            md5,
+            meta["md5"] or "NA",
         )
     )
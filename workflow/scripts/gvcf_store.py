@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""Helpers of the incremental germline cohort, GVCF_STORE in config.json.
+The single-sample gVCFs of each scatter unit are kept in a store shared by the
+waves of a project, i.e. <store>/<plan>/gVCFs/<sample>.<unit>.g.vcf.gz, so a
+sample's HaplotypeCaller jobs run once. With GERMLINE_ENGINE genomicsdb, the
+GenomicsDB workspace of each unit is kept in the store too, and only samples
+that are not yet in a workspace are imported into it. A workspace is rebuilt
+from all samples of the sample name map if its last import did not complete,
+if it holds samples that are no longer in the map, or if the gVCF of one of
+its samples was re-written since; outside a store, it is always rebuilt.
+USAGE:
+  $ python gvcf_store.py new-samples -m chr1.sample_map -w genomicsdb/chr1 \
+      -o chr1.new.sample_map [--rebuild]
+"""
+
+from __future__ import print_function
+import argparse
+import io
+import json
+import os
+import sys
+
+# Suffix of the index of a unit's gVCF,
+# written once the gVCF is complete
+_INDEX = ".{}.g.vcf.gz.tbi"
+
+# Written next to a workspace once
+# an import into it has completed
+COMPLETE = "{}.complete"
+
+
+def stored_samples(gvcf_dir, units):
+    """Finds the samples with a complete gVCF of every scatter unit in a store.
+    @param gvcf_dir <str>:
+        Directory of the gVCFs in the store
+    @param units list[<str>]:
+        Names of the scatter units, see plan_scatter.py
+    @return samples list[<str>]:
+        Sorted names of the samples
+    """
+    if not units or not os.path.isdir(gvcf_dir):
+        return []
+    files = set(os.listdir(gvcf_dir))
+    suffix = _INDEX.format(units[0])
+    samples = []
+    for filename in files:
+        if not filename.endswith(suffix):
+            continue
+        sample = filename[: -len(suffix)]
+        if all(sample + _INDEX.format(unit) in files for unit in units):
+            samples.append(sample)
+    return sorted(samples)
+
+
+def workspace_samples(workspace):
+    """Names of the samples imported into a GenomicsDB workspace.
+    @param workspace <str>:
+        Path to the GenomicsDB workspace
+    @return samples set(<str>):
+        Names of the samples, empty if the workspace does not exist
+    """
+    callset = os.path.join(workspace, "callset.json")
+    if not os.path.isfile(callset):
+        return set()
+    with io.open(callset, "r") as fh:
+        callsets = json.load(fh).get("callsets", [])
+    if isinstance(callsets, dict):
+        # Older workspaces are keyed by sample name
+        return set(callsets)
+    return set(c["sample_name"] for c in callsets)
+
+
+def new_samples(sample_map, workspace):
+    """Lines of a GenomicsDBImport sample name map of the samples that are
+    not yet in a workspace.
+    @param sample_map <str>:
+        Path to the sample name map of the whole cohort
+    @param workspace <str>:
+        Path to the GenomicsDB workspace
+    @return lines list[<str>]:
+        Lines of the sample name map of the new samples
+    """
+    imported = workspace_samples(workspace)
+    lines = []
+    with io.open(sample_map, "r") as fh:
+        for line in fh:
+            if line.strip() and line.split("\t", 1)[0] not in imported:
+                lines.append(line)
+    return lines
+
+
+def import_plan(sample_map, workspace, rebuild=False):
+    """Decides how the samples of a sample name map are imported into a
+    GenomicsDB workspace, see module docstring.
+    @param sample_map <str>:
+        Path to the sample name map of the whole cohort
+    @param workspace <str>:
+        Path to the GenomicsDB workspace
+    @param rebuild <bool>:
+        Always rebuild the workspace, i.e. outside of a store
+    @return action <str>, lines list[<str>]:
+        create a new workspace, update the workspace, or none, and the lines
+        of the sample name map of the samples to import
+    """
+    with io.open(sample_map, "r") as fh:
+        lines = [line for line in fh if line.strip()]
+    complete = COMPLETE.format(workspace)
+    if rebuild or not os.path.isfile(complete):
+        return "create", lines
+    gvcfs = dict(line.rstrip("\r\n").split("\t", 1) for line in lines)
+    imported = workspace_samples(workspace)
+    if not imported or imported - set(gvcfs):
+        # Removed from the cohort
+        return "create", lines
+    try:
+        if any(
+            os.path.getmtime(gvcfs[sample]) > os.path.getmtime(complete)
+            for sample in imported
+        ):
+            # Called again since it was imported
+            return "create", lines
+    except OSError:
+        return "create", lines
+    lines = new_samples(sample_map, workspace)
+    return ("update" if lines else "none"), lines
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Helpers of the incremental germline cohort"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparser_new = subparsers.add_parser(
+        "new-samples", help="Sample name map of the samples not in a workspace"
+    )
+    subparser_new.add_argument("-m", "--sample-map", required=True)
+    subparser_new.add_argument("-w", "--workspace", required=True)
+    subparser_new.add_argument("-o", "--output", required=True)
+    subparser_new.add_argument(
+        "--rebuild", action="store_true", help="Always rebuild the workspace"
+    )
+    args = parser.parse_args()
+    if args.command != "new-samples":
+        parser.error("unknown command")
+    action, lines = import_plan(args.sample_map, args.workspace, args.rebuild)
+    with io.open(args.output, "w") as fh:
+        fh.writelines(lines)
+    print(
+        "{} sample(s) to import into {}: {}".format(len(lines), args.workspace, action),
+        file=sys.stderr,
+    )
+    # Read by genomicsdb_import
+    print(action)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""Merges the coordinate-sorted VCF files of each somatic caller into one VCF
+file, like GATK3 CombineVariants with --filteredrecordsmergetype
+KEEP_IF_ANY_UNFILTERED, --genotypemergeoption PRIORITIZE, and
+--rod_priority_list did. The files are read in a single streaming pass, so
+memory is bounded by the records at one position instead of the whole files.
+Records of the same type, i.e. SNP, MNP, INDEL, SYMBOLIC, or MIXED, starting at
+the same position are merged into one record:
+  - ALT: alleles of the records in priority order, indels are extended to the
+    longest reference allele
+  - QUAL: highest quality, ID: union of the IDs
+  - FILTER: PASS if any record is unfiltered, or the union of the filters
+  - INFO: fields with the same value in every record, AC/AF/AN recomputed
+    from the genotypes, and set=<callers>, where a filtered caller is prefixed
+    with filterIn, Intersection if all callers called it unfiltered, or
+    FilteredInAll if every record is filtered
+  - FORMAT: genotype of each sample from the caller with the highest priority
+USAGE:
+  $ python merge_callers.py -r genome.fa -p mutect2,strelka -o merged.vcf \
+      --variant mutect2 mutect2.vcf --variant strelka strelka.vcf
+"""
+
+from __future__ import print_function, unicode_literals
+import argparse
+import gzip
+import heapq
+import io
+import itertools
+import sys
+
+# Order of the merged records of each type at a position,
+# same as htsjdk's VariantContext.Type
+TYPES = ("NO_VARIATION", "SNP", "MNP", "INDEL", "SYMBOLIC", "MIXED")
+
+INTERSECTION = "Intersection"
+FILTERED_IN_ALL = "FilteredInAll"
+FILTER_PREFIX = "filterIn"
+
+HEADER_LINES = (
+    '##INFO=<ID=AC,Number=A,Type=Integer,Description="Allele count in genotypes, for each ALT allele, in the same order as listed">',
+    '##INFO=<ID=AF,Number=A,Type=Float,Description="Allele Frequency, for each ALT allele, in the same order as listed">',
+    '##INFO=<ID=AN,Number=1,Type=Integer,Description="Total number of alleles in called genotypes">',
+    '##INFO=<ID=set,Number=1,Type=String,Description="Source VCF for the merged record in CombineVariants">',
+)
+
+
+class Record(object):
+    """A record of a caller's VCF file, only the fields that are merged are
+    parsed; genotypes are kept as dicts of FORMAT keys to values.
+    """
+
+    __slots__ = (
+        "chrom", "pos", "id", "ref", "alts", "qual", "filter", "info",
+        "genotypes", "source",
+    )  # fmt: skip
+
+    def __init__(self, line, samples, source):
+        fields = line.rstrip("\r\n").split("\t")
+        self.chrom = fields[0]
+        self.pos = int(fields[1])
+        self.id = fields[2]
+        self.ref = fields[3].upper()
+        self.alts = [] if fields[4] == "." else fields[4].split(",")
+        self.qual = fields[5]
+        self.filter = fields[6]
+        self.info = []
+        if fields[7] != ".":
+            for field in fields[7].split(";"):
+                key, _, value = field.partition("=")
+                self.info.append((key, value if _ else True))
+        self.genotypes = {}
+        if len(fields) > 9:
+            keys = fields[8].split(":")
+            for sample, value in zip(samples, fields[9:]):
+                self.genotypes[sample] = dict(zip(keys, value.split(":")))
+        self.source = source
+
+    def filtered(self):
+        return self.filter not in (".", "PASS")
+
+    def type(self):
+        """Type of the record, see TYPES."""
+        if not self.alts:
+            return "NO_VARIATION"
+        types = set(allele_type(self.ref, alt) for alt in self.alts)
+        return types.pop() if len(types) == 1 else "MIXED"
+
+
+def allele_type(ref, alt):
+    """Type of a biallelic variant, see TYPES."""
+    if alt.startswith("<") or "[" in alt or "]" in alt or alt in ("*", "."):
+        return "SYMBOLIC"
+    if len(ref) == len(alt):
+        return "SNP" if len(ref) == 1 else "MNP"
+    return "INDEL"
+
+
+def open_text(path):
+    """Opens a plain or gzipped VCF file."""
+    with io.open(path, "rb") as fh:
+        gzipped = fh.read(2) == b"\x1f\x8b"
+    if gzipped:
+        return io.TextIOWrapper(gzip.open(path, "rb"))
+    return io.open(path, "r")
+
+
+def read_vcf(path, source):
+    """Reads the header of a VCF file.
+    @param path <str>:
+        Path to the VCF file
+    @param source <str>:
+        Name of the caller, annotated in set=
+    @return (lines list[<str>], samples list[<str>], records <generator>):
+        Meta-information lines, sample names, and the records of the file
+    """
+    fh = open_text(path)
+    lines = []
+    for line in fh:
+        if line.startswith("##"):
+            lines.append(line.rstrip("\r\n"))
+        elif line.startswith("#"):
+            samples = line.rstrip("\r\n").split("\t")[9:]
+            break
+    else:
+        samples = []
+
+    def records():
+        with fh:
+            for line in fh:
+                if line.strip():
+                    yield Record(line, samples, source)
+
+    return lines, samples, records()
+
+
+def merge_headers(headers):
+    """Union of the meta-information lines of the VCF files. Structured lines,
+    i.e. INFO, FORMAT, FILTER, ALT, and contig, are de-duplicated by ID, the
+    first file in priority order wins.
+    """
+    merged = {}
+    for line in itertools.chain(itertools.chain.from_iterable(headers), HEADER_LINES):
+        if line.startswith("##fileformat="):
+            continue
+        key = line
+        kind = line[2:].split("=", 1)[0]
+        if kind in ("INFO", "FORMAT", "FILTER", "ALT", "contig") and "ID=" in line:
+            key = (kind, line.split("ID=", 1)[1].split(",", 1)[0].rstrip(">"))
+        merged.setdefault(key, line)
+    return ["##fileformat=VCFv4.2"] + sorted(merged.values())
+
+
+def format_float(value):
+    """Formats AF like htsjdk's VCFEncoder."""
+    if value < 1:
+        if value < 0.01:
+            if abs(value) >= 1e-20:
+                return "{:.3e}".format(value)
+            return "0.00"
+        return "{:.3f}".format(value)
+    return "{:.2f}".format(value)
+
+
+def format_qual(value):
+    """Formats QUAL like htsjdk's VCFEncoder."""
+    qual = "{:.2f}".format(value)
+    return qual[:-3] if qual.endswith(".00") else qual
+
+
+def merge_records(records, ncallers):
+    """Merges the records of the same type at a position.
+    @param records list[<Record>]:
+        Records in priority order of their callers
+    @param ncallers <int>:
+        Number of callers in the priority list
+    @return fields list[<str>]:
+        Fields of the merged record, without the samples
+    @return genotypes dict[<str>, dict[<str>, <str>]]:
+        Genotype of each sample, with GT indices of the merged alleles
+    """
+    ref = max((r.ref for r in records), key=len)
+    alleles = [ref]
+    ids = []
+    quals = []
+    filters = set()
+    nfiltered = 0
+    filters_applied = False
+    info = {}
+    inconsistent = set()
+    genotypes = {}
+    for record in records:
+        suffix = ref[len(record.ref) :]
+        indices = [0]
+        for alt in record.alts:
+            if suffix and allele_type(record.ref, alt) != "SYMBOLIC":
+                alt += suffix
+            if alt not in alleles:
+                alleles.append(alt)
+            indices.append(alleles.index(alt))
+        if record.id != ".":
+            for rsid in record.id.split(";"):
+                if rsid not in ids:
+                    ids.append(rsid)
+        if record.qual != ".":
+            quals.append(float(record.qual))
+        if record.filter != ".":
+            filters_applied = True
+        if record.filtered():
+            nfiltered += 1
+            filters.update(record.filter.split(";"))
+        for key, value in record.info:
+            # Only fields with the same value in every record
+            if key in inconsistent:
+                continue
+            bound = info.get(key)
+            if bound is not None and bound != "." and bound != value:
+                inconsistent.add(key)
+                del info[key]
+            elif bound is None or bound == ".":
+                info[key] = value
+        for sample, genotype in record.genotypes.items():
+            if sample in genotypes:
+                continue
+            genotype = dict(genotype)
+            if "GT" in genotype and indices != list(range(len(indices))):
+                gt = genotype["GT"]
+                genotype["GT"] = "".join(
+                    str(indices[int(token)]) if token.isdigit() else token
+                    for token in _split_gt(gt)
+                )
+            genotypes[sample] = genotype
+
+    if nfiltered != len(records):
+        # KEEP_IF_ANY_UNFILTERED
+        filters = set()
+    sources = []
+    for record in records:
+        if record.alts:
+            source = (FILTER_PREFIX if record.filtered() else "") + record.source
+            if source not in sources:
+                sources.append(source)
+    variant_sources = set(r.source for r in records if r.alts)
+    if nfiltered == 0 and len(variant_sources) == ncallers:
+        info["set"] = INTERSECTION
+    elif nfiltered == len(records):
+        info["set"] = FILTERED_IN_ALL
+    elif not variant_sources:
+        info["set"] = "ReferenceInAll"
+    else:
+        info["set"] = "-".join(sources)
+    info.update(chromosome_counts(genotypes, len(alleles) - 1))
+
+    fields = [
+        records[0].chrom,
+        str(records[0].pos),
+        ",".join(ids) if ids else ".",
+        ref,
+        ",".join(alleles[1:]) if len(alleles) > 1 else ".",
+        format_qual(max(quals)) if quals else ".",
+        ";".join(sorted(filters)) if filters else ("PASS" if filters_applied else "."),
+        ";".join(
+            key if value is True else "{}={}".format(key, value)
+            for key, value in sorted(info.items())
+        ),
+    ]
+    return fields, genotypes
+
+
+def _split_gt(gt):
+    """Splits a GT value into allele indices and separators."""
+    token = ""
+    for char in gt:
+        if char in "/|":
+            yield token
+            yield char
+            token = ""
+        else:
+            token += char
+    yield token
+
+
+def chromosome_counts(genotypes, nalts):
+    """AC, AF, and AN of the called genotypes, like htsjdk's
+    VariantContextUtils.calculateChromosomeCounts().
+    """
+    if not genotypes:
+        return {}
+    an = 0
+    ac = [0] * nalts
+    for genotype in genotypes.values():
+        for token in _split_gt(genotype.get("GT", ".")):
+            if token.isdigit():
+                an += 1
+                if int(token) > 0:
+                    ac[int(token) - 1] += 1
+    counts = {"AN": str(an)}
+    if nalts:
+        counts["AC"] = ",".join(str(c) for c in ac)
+        counts["AF"] = ",".join(format_float(float(c) / an if an else 0.0) for c in ac)
+    return counts
+
+
+def format_genotypes(genotypes, samples):
+    """FORMAT and sample fields, GT first, then the other keys sorted,
+    trailing missing values are trimmed.
+    """
+    keys = set()
+    for genotype in genotypes.values():
+        keys.update(genotype)
+    has_gt = "GT" in keys
+    keys.discard("GT")
+    keys = (["GT"] if has_gt else []) + sorted(keys)
+    if not keys:
+        return []
+    fields = [":".join(keys)]
+    for sample in samples:
+        genotype = genotypes.get(sample)
+        if genotype is None:
+            fields.append("./." if has_gt else ".")
+            continue
+        values = [genotype.get(key, ".") for key in keys]
+        while len(values) > 1 and values[-1] == ".":
+            values.pop()
+        fields.append(":".join(values))
+    return fields
+
+
+def merge(variants, priority, contigs, output):
+    """Merges the VCF files of each caller.
+    @param variants list[(<str>, <str>)]:
+        Name of each caller and the path to its coordinate-sorted VCF file
+    @param priority list[<str>]:
+        Names of the callers, highest priority first
+    @param contigs list[<str>]:
+        Contigs in the order of the sorted VCF files, i.e. of the reference
+    @param output <file>:
+        File handle the merged VCF is written to
+    @return nrecords <int>:
+        Number of merged records
+    """
+    missing = [name for name, _ in variants if name not in priority]
+    if missing:
+        raise ValueError(
+            "Callers {} are not in the priority list {}".format(
+                ",".join(missing), ",".join(priority)
+            )
+        )
+    rank = dict((name, i) for i, name in enumerate(priority))
+    variants = sorted(variants, key=lambda v: rank[v[0]])
+    order = dict((contig, i) for i, contig in enumerate(contigs))
+
+    headers, samples, streams = [], set(), []
+    for name, path in variants:
+        lines, names, records = read_vcf(path, name)
+        headers.append(lines)
+        samples.update(names)
+        streams.append(records)
+    samples = sorted(samples)
+
+    def keyed(i, records):
+        # Ties are broken by the caller's priority
+        # and the order of the records in its file
+        previous = (-1, 0)
+        for n, record in enumerate(records):
+            if record.chrom not in order:
+                raise ValueError(
+                    "Contig {} of {} is not in the reference".format(
+                        record.chrom, variants[i][1]
+                    )
+                )
+            key = (order[record.chrom], record.pos)
+            if key < previous:
+                raise ValueError(
+                    "{} is not sorted at {}:{}".format(
+                        variants[i][1], record.chrom, record.pos
+                    )
+                )
+            previous = key
+            yield key + (i, n), record
+
+    for line in merge_headers(headers):
+        output.write(line + "\n")
+    output.write(
+        "\t".join(
+            ["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO"]
+            + (["FORMAT"] + samples if samples else [])
+        )
+        + "\n"
+    )
+    nrecords = 0
+    stream = heapq.merge(*[keyed(i, records) for i, records in enumerate(streams)])
+    for _, group in itertools.groupby(stream, key=lambda item: item[0][:2]):
+        records = [record for _, record in group]
+        by_type = {}
+        for record in records:
+            by_type.setdefault(record.type(), []).append(record)
+        # Records without ALT alleles are merged into the first type
+        if "NO_VARIATION" in by_type and len(by_type) > 1:
+            refs = by_type.pop("NO_VARIATION")
+            by_type[next(t for t in TYPES if t in by_type)].extend(refs)
+        for variant_type in TYPES:
+            if variant_type not in by_type:
+                continue
+            group_records = sorted(by_type[variant_type], key=lambda r: rank[r.source])
+            fields, genotypes = merge_records(group_records, len(priority))
+            output.write(
+                "\t".join(fields + format_genotypes(genotypes, samples)) + "\n"
+            )
+            nrecords += 1
+    return nrecords
+
+
+def read_contigs(reference):
+    """Contigs of the reference genome, from its FASTA index."""
+    with io.open(reference + ".fai", "r") as fh:
+        return [line.split("\t", 1)[0] for line in fh if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Merges the VCF files of each somatic caller"
+    )
+    parser.add_argument(
+        "-r", "--reference", required=True, help="Reference genome, indexed"
+    )
+    parser.add_argument(
+        "-p", "--priority", required=True, help="Callers, highest priority first"
+    )
+    parser.add_argument("-o", "--output", required=True, help="Merged VCF file")
+    parser.add_argument(
+        "--variant",
+        nargs=2,
+        action="append",
+        required=True,
+        metavar=("NAME", "VCF"),
+        help="Caller name and its coordinate-sorted VCF file",
+    )
+    args = parser.parse_args()
+    with io.open(args.output, "w") as output:
+        nrecords = merge(
+            [tuple(v) for v in args.variant],
+            args.priority.split(","),
+            read_contigs(args.reference),
+            output,
+        )
+    print("Merged {} records into {}".format(nrecords, args.output), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""Normalizes a "covered" targets BED file for exome-seq in one process.
+Qualimap requires a 6-field BED file, and FREEC errors out if the BED file
+contains regions with the same chromosome and start site:
+  Error: your BED file with coordinates of targeted regions may contain duplicates
+See https://github.com/BoevaLab/FREEC/issues/43. In a single pass over the
+input BED file, this script:
+  (1) Skips comment, track, and browser lines
+  (2) Removes consecutive regions with the same start site (the first one is kept)
+  (3) Collapses regions with identical chrom/start/end, joining their names
+Then, in memory, it sorts the regions by chrom, start, and end, increments
+repeated chrom/start sites by one for FREEC, and sorts the regions again.
+The output is identical to the previous chain of reformat_bed.py and
+correct_target_bed.py, i.e. sort -k1,1 -k2,2n -k3,3n in the C locale.
+USAGE:
+  $ python normalize_bed.py -i targets.bed -o exome_targets.bed
+"""
+
+from __future__ import print_function
+import argparse
+import gc
+import io
+import re
+import sys
+from collections import OrderedDict
+
+# Leading number of a field, as parsed by sort -n and awk; not raw
+# strings, python/2.7 only reads br"" which black rewrites to rb""
+_SORT_NUMBER = re.compile(b"^\\s*(-?(?:\\d+\\.?\\d*|\\.\\d+))")
+_AWK_NUMBER = re.compile(b"^\\s*([-+]?(?:\\d+\\.?\\d*|\\.\\d+)(?:[eE][-+]?\\d+)?)")
+
+_COMMENTS = (b"#", b"track", b"browser")
+
+# Dictionaries keep their insertion order in python>=3.7
+_ordered = dict if sys.version_info >= (3, 7) else OrderedDict
+
+
+def sort_number(field):
+    """Numeric value of a field for sort -n, non-numeric fields are zero."""
+    if field.isdigit():
+        return int(field)
+    match = _SORT_NUMBER.match(field)
+    if not match:
+        return 0
+    number = match.group(1)
+    return float(number) if b"." in number else int(number)
+
+
+def awk_number(field):
+    """Numeric value of a field in awk arithmetic."""
+    if field.isdigit():
+        return int(field)
+    match = _AWK_NUMBER.match(field)
+    if not match:
+        return 0
+    number = match.group(1)
+    try:
+        return int(number)
+    except ValueError:
+        return float(number)
+
+
+def awk_format(number):
+    """Formats a number like awk's print: integers as integers, otherwise %.6g."""
+    if number == int(number):
+        return ("%d" % number).encode("ascii")
+    return ("%.6g" % number).encode("ascii")
+
+
+def record(chrom, start, tail):
+    """Sortable record of an output line, compared like sort -k1,1 -k2,2n -k3,3n
+    in the C locale. Ties are broken by comparing whole lines, like sort's
+    last-resort comparison. The start site and the remaining fields are kept
+    so the start can be changed without parsing the line again.
+    """
+    end = tail[: tail.index(b"\t")]
+    line = chrom + b"\t" + start + b"\t" + tail
+    return (chrom, sort_number(start), sort_number(end), line, start, tail)
+
+
+def collapse(lines):
+    """Parses a targets BED file in a single pass, see steps (1) to (3) above.
+    @param lines <iterable[bytes]>:
+        Lines of the input BED file
+    @return regions <dict[tuple, list[bytes]]>, skipped <int>:
+        Names of each chrom/start/end region in order of first appearance,
+        and the number of regions skipped because they repeated the previous
+        start site
+    """
+    regions = _ordered()
+    skipped = 0
+    last_start = b"-1"  # Position of the last start site
+    for line in lines:
+        if line.startswith(_COMMENTS):
+            continue
+        cols = line.strip().split(b"\t")
+        if len(cols) < 3:
+            sys.exit(
+                "Targets BED file must contain at least three columns: chr, start, end"
+            )
+        start = cols[1]
+        if start == last_start:
+            skipped += 1
+            continue
+        last_start = start
+        region = (cols[0], start, cols[2])
+        names = regions.get(region)
+        if names is None:
+            regions[region] = [cols[3] if len(cols) > 3 else b"."]
+        else:
+            names.append(cols[3] if len(cols) > 3 else b".")
+    return regions, skipped
+
+
+def deduplicate_starts(records):
+    """Increments repeated chrom/start sites of sorted records so FREEC does
+    not treat them as duplicates, i.e. the n-th region starting at the same
+    position is moved n - 1 bases. Records are replaced in place.
+    @return shifted <int>:
+        Number of regions whose start site was incremented
+    """
+    seen = {}
+    shifted = 0
+    for i, (chrom, _, _, _, start, tail) in enumerate(records):
+        site = (chrom, start)
+        count = seen.get(site, 0) + 1
+        seen[site] = count
+        if count != 1:
+            start = awk_format(awk_number(start) + count - 1)
+            records[i] = record(chrom, start, tail)
+            shifted += 1
+    return shifted
+
+
+def normalize(lines):
+    """Normalizes the lines of a targets BED file, see module docstring.
+    @param lines <iterable[bytes]>:
+        Lines of the input BED file
+    @return lines <list[bytes]>, stats <dict>:
+        Sorted 6-field output lines without newlines, and the number of
+        output, skipped, and shifted regions
+    """
+    # Millions of small containers are created and none
+    # of them are cyclic, pause the garbage collector
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        regions, skipped = collapse(lines)
+        records = [
+            record(
+                chrom,
+                start,
+                b"\t".join(
+                    [end, b",".join(names), b",".join([b"0"] * len(names)), b"."]
+                ),
+            )
+            for (chrom, start, end), names in regions.items()
+        ]
+        del regions
+        records.sort()
+        shifted = deduplicate_starts(records)
+        if shifted:
+            # Nearly sorted, only the shifted records move
+            records.sort()
+    finally:
+        if enabled:
+            gc.enable()
+    stats = {"regions": len(records), "skipped": skipped, "shifted": shifted}
+    return [r[3] for r in records], stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-i", "--input_bed", required=True, help="Input BED file to be normalized"
+    )
+    parser.add_argument(
+        "-o",
+        "--output_bed",
+        help="Normalized 6-field output BED file",
+        default="exome_targets.bed",
+    )
+    args = parser.parse_args()
+
+    with io.open(args.input_bed, "rb") as fh:
+        lines, stats = normalize(fh)
+    with io.open(args.output_bed, "wb") as fh:
+        for line in lines:
+            fh.write(line + b"\n")
+    print(
+        "Wrote {regions} regions: skipped {skipped} repeated start sites, "
+        "shifted {shifted} duplicate chrom/start sites.".format(**stats),
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 # -*- coding: UTF-8 -*-
 
 from __future__ import print_function, division
-import sys, gzip
+import os, sys, gzip
 
 
 # USAGE
@@ -10,6 +10,8 @@ import sys, gzip
 # sys.argv[2] = sample_name (name without PATH and .R?.fastq.gz extension)
 # Example
 # $ python get_flowcell_lanes.py input.R1.fastq.gz input > flowcell_lanes.txt
+# Checksums are only cached across runs if a cache file is provided
+# $ python parse_tn_mode.py --checksum-cache .xavier/checksums.jsonl input.R1.fastq.gz input
 
 
 def usage(message="", exitcode=0):
@@ -119,7 +121,7 @@ def read_pairsfile(tn_mode="auto", pairs_filepath="", sample_names=[]):
     return out_dict
 
 
-def md5sum(filename, blocksize=65536):
+def md5sum(filename, blocksize=65536, cache=None):
     """Gets md5checksum of a file in memory-safe manner.
     The file is read in blocks defined by the blocksize parameter. This is a safer
     option to reading the entire file into memory if the file is very large.
@@ -127,9 +129,14 @@ def md5sum(filename, blocksize=65536):
         Input file on local filesystem to find md5 checksum
     @param blocksize <int>:
         Blocksize of reading N chunks of data to reduce memory profile
+    @param cache <checksum_cache.ChecksumCache>:
+        Optional persistent cache, the file is only hashed on a cache miss
     @return hasher.hexdigest() <str>:
         MD5 checksum of the file's contents
     """
+    if cache is not None:
+        return cache.md5sum(filename, blocksize)
+
     import hashlib
 
     hasher = hashlib.md5()
@@ -143,6 +150,14 @@ def md5sum(filename, blocksize=65536):
 
 
 if __name__ == "__main__":
+    # Optional persistent cache of checksums,
+    # files are only hashed once across runs
+    cache_path = ""
+    if "--checksum-cache" in sys.argv[:-1]:
+        i = sys.argv.index("--checksum-cache")
+        cache_path = sys.argv[i + 1]
+        del sys.argv[i : i + 2]
+
     # Check Usage
     if "-h" in sys.argv or "--help" in sys.argv or "-help" in sys.argv:
         usage(exitcode=0)
@@ -155,8 +170,13 @@ if __name__ == "__main__":
     # Get file name and sample name prefix
     filename = sys.argv[1]
     sample = sys.argv[2]
-    # Get md5 checksum
-    md5 = md5sum(filename)
+    # Get md5 checksum, see checksum_cache.py
+    cache = None
+    if cache_path:
+        from checksum_cache import ChecksumCache
+
+        cache = ChecksumCache(cache_path)
+    md5 = md5sum(filename, cache=cache)
 
     # Get Flowcell and Lane information
     handle = reader(filename)
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""Plans the scatter of the somatic callers and HaplotypeCaller over shards of
+the exome targets BED file with a similar number of targeted base-pairs,
+instead of one job per chromosome where chr1 jobs run 5-10x longer than chr21.
+Targets are padded on both sides, merged where they overlap or touch, ordered
+like the reference's chromosomes, and cut into contiguous shards; a target
+longer than a shard is split. The padding is applied before the shards are
+planned, clipped to the chromosome lengths of the reference's .fai index, so
+shards never overlap, no variant is called twice, and tools must not pad the
+shards again. Each shard is written to <outdir>/<name>.bed, which GATK,
+MuTect, VarDict, samtools, and strelka all accept, and the plan is recorded
+in <outdir>/scatter.json. The shards are only re-planned when the targets,
+the number of shards, the padding, or the chromosomes change, and unchanged
+shard files are not re-written.
+With zero shards, the targets of each chromosome are written to
+<outdir>/<chrom>.bed as they are, for callers that read the whole BAM file
+but scatter per chromosome.
+USAGE:
+  $ python plan_scatter.py -i targets.bed -o scatter/ -n 24 --chroms chr1 chr2 \
+      --padding 100 --fai genome.fa.fai
+"""
+
+from __future__ import print_function, division
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+
+_COMMENTS = (b"#", b"track", b"browser")
+
+# Plan of the last run, see plan_targets()
+MANIFEST = "scatter.json"
+
+# Base-pairs added to both sides of each target
+# of a shard, like GATK's --interval-padding
+DEFAULT_PADDING = 100
+
+
+def read_lengths(fai):
+    """Reads the chromosome lengths of a FASTA index.
+    @param fai <str>:
+        Path to the .fai index of the reference genome
+    @return lengths dict[<str>, <int>]:
+        Length of each chromosome
+    """
+    lengths = {}
+    with io.open(fai, "r") as fh:
+        for line in fh:
+            cols = line.split("\t")
+            if len(cols) >= 2:
+                lengths[cols[0]] = int(cols[1])
+    return lengths
+
+
+def read_targets(lines, chroms=None, padding=0, lengths=None):
+    """Parses a targets BED file into merged, sorted intervals.
+    @param lines <iterable[bytes]>:
+        Lines of the targets BED file
+    @param chroms list[<str>]:
+        Chromosomes to keep, in the order of the reference; by default, all
+        chromosomes in order of first appearance
+    @param padding <int>:
+        Base-pairs added to both sides of each target before they are merged
+    @param lengths dict[<str>, <int>]:
+        Chromosome lengths the padded targets are clipped to, see read_lengths()
+    @return intervals list[tuple(<str>, <int>, <int>)]:
+        Non-overlapping 0-based, half-open (chrom, start, end) intervals
+    """
+    order = {}
+    if chroms:
+        order = dict((chrom.encode("utf-8"), i) for i, chrom in enumerate(chroms))
+    regions = {}
+    for line in lines:
+        if line.startswith(_COMMENTS) or not line.strip():
+            continue
+        cols = line.split(b"\t", 3)
+        if len(cols) < 3:
+            sys.exit(
+                "Targets BED file must contain at least three columns: chr, start, end"
+            )
+        chrom = cols[0].strip()
+        if chrom not in order:
+            if chroms:
+                # Not scattered over, like a chrom not in the chroms list
+                continue
+            order[chrom] = len(order)
+        regions.setdefault(chrom, []).append((int(cols[1]), int(cols[2])))
+
+    intervals = []
+    for chrom in sorted(regions, key=order.get):
+        name = chrom.decode("utf-8")
+        length = (lengths or {}).get(name)
+        last = None
+        for start, end in sorted(regions[chrom]):
+            start, end = max(0, start - padding), end + padding
+            if length is not None:
+                end = min(end, length)
+            if last is not None and start <= last[2]:
+                last[2] = max(last[2], end)
+                continue
+            if last is not None:
+                intervals.append(tuple(last))
+            last = [name, start, end]
+        if last is not None:
+            intervals.append(tuple(last))
+    return intervals
+
+
+def plan(intervals, shards):
+    """Cuts intervals into contiguous shards with a similar number of bases.
+    A shard ends before the interval whose midpoint crosses the shard's share
+    of the total, and intervals longer than a share are split into pieces.
+    @param intervals list[tuple(<str>, <int>, <int>)]:
+        Sorted, non-overlapping intervals, see read_targets()
+    @param shards <int>:
+        Maximum number of shards, fewer if there are not enough intervals
+    @return plan list[list[tuple(<str>, <int>, <int>)]]:
+        Intervals of each shard
+    """
+    total = sum(end - start for _, start, end in intervals)
+    if not total:
+        return []
+    share = total / shards
+    planned = [[]]
+    filled = 0
+    for chrom, start, end in intervals:
+        # Pieces no longer than a share
+        pieces = max(1, int(-(-(end - start) // share)))
+        step = (end - start) / pieces
+        for i in range(pieces):
+            left = start + int(round(i * step))
+            right = end if i == pieces - 1 else start + int(round((i + 1) * step))
+            size = right - left
+            if (
+                planned[-1]
+                and len(planned) < shards
+                and filled + size / 2 > len(planned) * share
+            ):
+                planned.append([])
+            planned[-1].append((chrom, left, right))
+            filled += size
+    return planned
+
+
+def by_chrom(lines, chroms):
+    """Groups the lines of a targets BED file by chromosome, unchanged.
+    @param lines <iterable[bytes]>:
+        Lines of the targets BED file
+    @param chroms list[<str>]:
+        Chromosomes to keep
+    @return groups list[list[bytes]]:
+        Lines of each chromosome, in the order of chroms
+    """
+    groups = dict((chrom.encode("utf-8"), []) for chrom in chroms)
+    for line in lines:
+        if line.startswith(_COMMENTS) or not line.strip():
+            continue
+        group = groups.get(line.split(b"\t", 1)[0].strip())
+        if group is not None:
+            group.append(line.rstrip(b"\r\n") + b"\n")
+    return [groups[chrom.encode("utf-8")] for chrom in chroms]
+
+
+def shard_names(count):
+    """Names of the shards of a plan, i.e. 0001-of-0024."""
+    return ["{:04d}-of-{:04d}".format(i + 1, count) for i in range(count)]
+
+
+def _write_if_changed(filename, content):
+    """Writes content to a file, unless it is unchanged, so its mtime is kept."""
+    if os.path.isfile(filename):
+        with io.open(filename, "rb") as fh:
+            if fh.read() == content:
+                return False
+    tmp = "{}.{}.tmp".format(filename, os.getpid())
+    with io.open(tmp, "wb") as fh:
+        fh.write(content)
+    os.rename(tmp, filename)
+    return True
+
+
+def plan_targets(targets, outdir, shards, chroms=None, padding=0, lengths=None):
+    """Plans and writes the shards of a targets BED file, re-using the plan in
+    outdir when the targets, the number of shards, the padding, and the chroms
+    are unchanged.
+    @param targets <str>:
+        Path to the targets BED file
+    @param outdir <str>:
+        Directory of the shard BED files, created if it does not exist
+    @param shards <int>:
+        Number of shards, or 0 for the unchanged targets of each chromosome
+    @param chroms list[<str>]:
+        Chromosomes to scatter over, see read_targets()
+    @param padding <int>:
+        Base-pairs added to both sides of the targets of the shards, the
+        targets of each chromosome are written unpadded with zero shards
+    @param lengths dict[<str>, <int>]:
+        Chromosome lengths the padded targets are clipped to
+    @return names list[<str>]:
+        Name of each shard or chromosome, written to <outdir>/<name>.bed
+    """
+    with io.open(targets, "rb") as fh:
+        content = fh.read()
+    hasher = hashlib.sha256(content)
+    padding = int(padding) if shards else 0
+    params = [int(shards), chroms or []]
+    if padding:
+        # Unpadded plans keep their key, i.e. of a GVCF_STORE
+        params += [padding, sorted((lengths or {}).items())]
+    hasher.update(json.dumps(params).encode("utf-8"))
+    key = hasher.hexdigest()
+
+    manifest = os.path.join(outdir, MANIFEST)
+    try:
+        with io.open(manifest, "r") as fh:
+            previous = json.load(fh)
+        if previous["key"] == key and all(
+            os.path.isfile(os.path.join(outdir, s["name"] + ".bed"))
+            for s in previous["shards"]
+        ):
+            return [s["name"] for s in previous["shards"]]
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+
+    if shards:
+        planned = plan(
+            read_targets(content.splitlines(), chroms, padding, lengths), int(shards)
+        )
+        if not planned:
+            sys.exit(
+                "Targets BED file {} contains no intervals to scatter".format(targets)
+            )
+        names = shard_names(len(planned))
+        beds = [
+            ["{}\t{}\t{}\n".format(*interval).encode("utf-8") for interval in intervals]
+            for intervals in planned
+        ]
+    else:
+        names = list(chroms)
+        beds = by_chrom(content.splitlines(True), chroms)
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    summary = []
+    for i, (name, lines) in enumerate(zip(names, beds)):
+        _write_if_changed(os.path.join(outdir, name + ".bed"), b"".join(lines))
+        summary.append({"name": name, "intervals": len(lines)})
+        if shards:
+            summary[-1]["bp"] = sum(end - start for _, start, end in planned[i])
+    _write_if_changed(
+        manifest,
+        json.dumps(
+            {"key": key, "targets": targets, "padding": padding, "shards": summary},
+            indent=4,
+        ).encode("utf-8"),
+    )
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-i", "--input_bed", required=True, help="Targets BED file")
+    parser.add_argument(
+        "-o", "--outdir", required=True, help="Output directory of the shard BED files"
+    )
+    parser.add_argument(
+        "-n",
+        "--shards",
+        type=int,
+        required=True,
+        help="Number of shards, or 0 to write the targets of each chromosome",
+    )
+    parser.add_argument(
+        "--chroms", nargs="+", default=None, help="Chromosomes to scatter over"
+    )
+    parser.add_argument(
+        "--padding",
+        type=int,
+        default=DEFAULT_PADDING,
+        help="Base-pairs added to both sides of the targets of the shards",
+    )
+    parser.add_argument(
+        "--fai", default=None, help="FASTA index the padded targets are clipped to"
+    )
+    args = parser.parse_args()
+    if args.shards < 0 or not (args.shards or args.chroms):
+        parser.error("--shards must be a positive integer, or 0 with --chroms")
+    names = plan_targets(
+        args.input_bed,
+        args.outdir,
+        args.shards,
+        args.chroms,
+        args.padding,
+        read_lengths(args.fai) if args.fai else None,
+    )
+    with io.open(os.path.join(args.outdir, MANIFEST), "r") as fh:
+        shards = json.load(fh)["shards"]
+    for shard in shards:
+        print("{name}\t{intervals}".format(**shard))
+    print("Wrote {} shards to {}".format(len(names), args.outdir), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
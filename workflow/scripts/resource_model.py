@@ -0,0 +1,484 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""Learns the memory and time of each rule from the cluster stats of past runs,
+i.e. the output of xavier stats or resources/gather_cluster_stats, and tunes
+the cluster config of a new run, i.e. config/cluster.biowulf.json, with them.
+The jobs of each run are matched to their rule and sample through its
+logfiles/snakemake.log, and the size of a sample is the size of its input
+FastQ or BAM files in the output directory of the run. Per rule, the peak
+memory (MaxRSS) and the elapsed time of completed jobs are fit as a linear
+function of the size of the sample, or of the cohort for rules without a
+sample, and scaled by the largest ratio of an observed value to the fit so no
+past job would have exceeded it, and by a safety margin. Rules that ran out
+of memory or time are never tuned below their current entry, and threads are
+left unchanged.
+The fit sub-command writes the model of one or more runs to a JSON file. The
+tune sub-command writes the cluster config of a new run, predicted for the
+largest sample and the size of the cohort in its output directory, see
+xavier run --resource-model.
+USAGE:
+  $ python resource_model.py fit -s run*/logfiles/cluster_stats.tsv -o model.json
+  $ python resource_model.py tune -m model.json -c cluster.json -w output -o cluster.json
+"""
+
+from __future__ import print_function, division
+import argparse
+import glob
+import io
+import json
+import math
+import os
+import re
+import sys
+from collections import OrderedDict
+
+try:
+    from .cluster_groups import groups, parse_mem, parse_time
+except (ImportError, ValueError):
+    from cluster_groups import groups, parse_mem, parse_time
+
+# Safety margin over the largest
+# job of the history of a rule
+MARGIN = 1.25
+# Rules with fewer completed jobs
+# keep their current entry
+MIN_JOBS = 3
+# Time limits are rounded up
+# to this many minutes
+TIME_STEP = 15
+MIN_MEM_GB = 2
+
+# Wildcards of the rules naming a sample
+SAMPLE_WILDCARDS = ("samples", "name", "sample")
+
+
+def format_time(minutes):
+    """Converts minutes to a SLURM time limit, i.e. 4:00:00 or 2-00:00:00."""
+    minutes = int(math.ceil(minutes))
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return "{}-{:02d}:{:02d}:00".format(days, hours, minutes)
+    return "{}:{:02d}:00".format(hours, minutes)
+
+
+def read_stats(path):
+    """Reads the output of xavier stats, or resources/gather_cluster_stats.
+    @param path <str>:
+        TSV file, one job per line
+    @return jobs list[dict]:
+        External jobid, state, job name, elapsed minutes, MaxRSS in
+        gigabytes, and working directory of each accounted job, and its
+        rule and wildcards for xavier stats
+    """
+    jobs = []
+    with io.open(path, "r") as fh:
+        header = fh.readline().rstrip("\n").split("\t")
+        if header[0] == "jobid":
+            for line in fh:
+                row = dict(zip(header, line.rstrip("\n").split("\t")))
+                if not row.get("elapsed_s"):
+                    continue
+                jobs.append(
+                    {
+                        "jobid": row["jobid"],
+                        "state": row["state"],
+                        "name": row["job_name"],
+                        "minutes": float(row["elapsed_s"]) / 60.0,
+                        "mem": parse_mem(row["max_rss_gb"]),
+                        "workdir": row["workdir"],
+                        "rule": row["rule"],
+                        "wildcards": dict(
+                            w.split("=", 1)
+                            for w in row["wildcards"].split(",")
+                            if "=" in w
+                        ),
+                    }
+                )
+            return jobs
+        fh.seek(0)
+        for line in fh:
+            fields = line.rstrip("\n").split("\t")
+            if line.startswith("#") or len(fields) < 10:
+                continue
+            if fields[0] == "JOBNOTACCOUNTABLE":
+                continue
+            jobid, state, name = (fields[2].split(";") + ["", ""])[:3]
+            times = fields[4].split(";")
+            mem = (fields[6].split(";") + [""])[:2]
+            try:
+                elapsed = parse_time(times[1])
+            except (IndexError, ValueError):
+                continue
+            jobs.append(
+                {
+                    "jobid": jobid,
+                    "state": (state.split() or [""])[0],
+                    "name": name,
+                    "minutes": elapsed,
+                    "mem": parse_mem(mem[1]),
+                    "workdir": fields[9],
+                }
+            )
+    return jobs
+
+
+def snakemake_jobs(path):
+    """Reads the jobs submitted to the cluster from a snakemake log.
+    @param path <str>:
+        Path to logfiles/snakemake.log
+    @return jobs dict[<str>, dict]:
+        Rule, wildcards, and input files of each external jobid; the rule of
+        a group job is its group, with the wildcards all its jobs share and
+        the input files of its jobs
+    """
+    jobs = {}
+    block = {}
+    group = None
+    with io.open(path, "r", errors="replace") as fh:
+        for line in fh:
+            stripped = line.strip()
+            match = re.match(
+                r"^group job (\S+) \(jobs in lexicogr\. order\):$", stripped
+            )
+            if match:
+                # Followed by the indented blocks of the jobs of the group
+                group = {"rule": match.group(1), "jobs": []}
+                block = {}
+                continue
+            match = re.match(r"^(?:local)?(?:rule|checkpoint) (\S+):$", stripped)
+            if match:
+                block = {"rule": match.group(1), "wildcards": {}, "input": []}
+                if group is not None and line[:1].isspace():
+                    group["jobs"].append(block)
+                else:
+                    group = None
+                continue
+            key, _, value = stripped.partition(": ")
+            if key == "input" and block:
+                block["input"] = [f for f in value.split(", ") if f]
+            elif key == "wildcards" and block:
+                block["wildcards"] = dict(
+                    w.split("=", 1) for w in value.split(", ") if "=" in w
+                )
+            elif key == "jobid" and block:
+                block["jobid"] = value
+            match = re.match(
+                r"^Submitted (group )?job (\S+) with external jobid '([^']*)'", stripped
+            )
+            if match:
+                # Submitted batch job <id>, or <id>[;cluster] of sbatch --parsable
+                external = (match.group(3).split() or [""])[-1].split(";")[0]
+                if match.group(1) and group is not None and group["jobs"]:
+                    members = group["jobs"]
+                    jobs[external] = {
+                        "rule": group["rule"],
+                        "wildcards": dict(
+                            (k, v)
+                            for k, v in members[0]["wildcards"].items()
+                            if all(m["wildcards"].get(k) == v for m in members)
+                        ),
+                        "input": [f for m in members for f in m["input"]],
+                        "group": True,
+                    }
+                elif match.group(1) or block.get("jobid") != match.group(2):
+                    jobs[external] = {"rule": None, "wildcards": {}, "input": []}
+                else:
+                    jobs[external] = dict(block)
+                group = None
+    return jobs
+
+
+def sample_bytes(workdir):
+    """Sizes of the input files of each sample in a pipeline output directory.
+    @param workdir <str>:
+        Output directory of a run
+    @return sizes dict[<str>, <int>]:
+        Bytes of the FastQ files of each sample, or of its BAM file if the
+        run started from BAM files
+    """
+    sizes = {}
+    patterns = (
+        (os.path.join(workdir, "*.R[12].fastq.gz"), r"\.R[12]\.fastq\.gz$"),
+        (os.path.join(workdir, "input_files", "bam", "*.input.bam"), r"\.input\.bam$"),
+    )
+    for pattern, suffix in patterns:
+        found = {}
+        for filename in glob.glob(pattern):
+            try:
+                size = os.stat(filename).st_size
+            except OSError:
+                # Raw data was moved since
+                continue
+            sample = re.sub(suffix, "", os.path.basename(filename))
+            found[sample] = found.get(sample, 0) + size
+        # FastQ runs also write input_files/bam, see gatk_recal
+        for sample, size in found.items():
+            sizes.setdefault(sample, size)
+    return sizes
+
+
+def history(stats, log=None, workdir=None):
+    """Joins the cluster stats of a run with its snakemake log and inputs.
+    @param stats <str>:
+        Output of xavier stats, or resources/gather_cluster_stats
+    @param log <str>:
+        Snakemake log of the run, default logfiles/snakemake.log of workdir
+    @param workdir <str>:
+        Output directory of the run, default the WorkDir of its jobs
+    @return records list[dict]:
+        Rule, sample, input bytes, MaxRSS in gigabytes, elapsed minutes,
+        and state of each job
+    """
+    jobs = read_stats(stats)
+    if workdir is None:
+        workdir = jobs[0]["workdir"] if jobs else "."
+    if log is None:
+        log = os.path.join(workdir, "logfiles", "snakemake.log")
+    submitted = snakemake_jobs(log) if os.path.isfile(log) else {}
+    sizes = sample_bytes(workdir)
+    records = []
+    for job in jobs:
+        info = submitted.get(job["jobid"], {})
+        # Job names are {rule}.{wildcards}, or GROUP.{group}... of a group
+        # job whose group is only known from the snakemake log
+        rule = info.get("rule") or job.get("rule") or job["name"].split(".")[0]
+        wildcards = info.get("wildcards") or job.get("wildcards", {})
+        sample = next((wildcards[w] for w in SAMPLE_WILDCARDS if w in wildcards), None)
+        if sample is not None:
+            nbytes = sizes.get(sample)
+        else:
+            nbytes = sum(sizes.values()) or None
+        records.append(
+            {
+                "rule": rule,
+                "sample": sample,
+                "bytes": nbytes,
+                "mem": job["mem"],
+                "minutes": job["minutes"],
+                "state": job["state"],
+            }
+        )
+    return records
+
+
+def _fit(points):
+    """Fits y = intercept + slope * x over (x, y) points, x in gigabytes,
+    with a constant for less than two sizes or a negative slope.
+    """
+    sized = [(x, y) for x, y in points if x is not None]
+    intercept, slope = max(y for _, y in points), 0.0
+    if len(set(x for x, _ in sized)) >= 2 and len(sized) >= MIN_JOBS:
+        n = len(sized)
+        mx = sum(x for x, _ in sized) / n
+        my = sum(y for _, y in sized) / n
+        sxx = sum((x - mx) ** 2 for x, _ in sized)
+        sxy = sum((x - mx) * (y - my) for x, y in sized)
+        if sxy > 0:
+            slope = sxy / sxx
+            intercept = max(my - slope * mx, 0.0)
+    if slope > 0:
+        points = sized
+    # Largest ratio of a job to the fit
+    headroom = 1.0
+    for x, y in points:
+        base = intercept + slope * (x or 0.0)
+        if base > 0:
+            headroom = max(headroom, y / base)
+    return {
+        "intercept": intercept,
+        "slope": slope,
+        "headroom": headroom,
+        "max": max(y for _, y in points),
+        "max_gb": max([x for x, _ in sized] or [0.0]),
+    }
+
+
+def fit(records, min_jobs=MIN_JOBS):
+    """Fits the memory and time of each rule of past jobs.
+    @param records list[dict]:
+        Jobs of one or more runs, see history()
+    @param min_jobs <int>:
+        Minimum number of completed jobs to model a rule
+    @return model dict[<str>, dict]:
+        Memory in gigabytes and time in minutes of each rule, as a function
+        of the input gigabytes of its sample, or cohort
+    """
+    rules = {}
+    for record in records:
+        rules.setdefault(record["rule"], []).append(record)
+    model = {}
+    for rule, jobs in sorted(rules.items()):
+        completed = [j for j in jobs if j["state"] == "COMPLETED"]
+        if len(completed) < min_jobs:
+            continue
+        gb = lambda j: j["bytes"] / 1024.0**3 if j["bytes"] else None
+        entry = {
+            "jobs": len(completed),
+            "per": "sample" if any(j["sample"] for j in completed) else "cohort",
+            "time": _fit([(gb(j), j["minutes"]) for j in completed]),
+            "out_of_memory": any(j["state"] == "OUT_OF_MEMORY" for j in jobs),
+            "timeout": any(j["state"] == "TIMEOUT" for j in jobs),
+        }
+        mems = [(gb(j), j["mem"]) for j in completed if j["mem"] is not None]
+        if mems:
+            entry["mem"] = _fit(mems)
+        model[rule] = entry
+    return model
+
+
+def predict(fitted, gb=None, margin=MARGIN):
+    """Predicts a resource of a rule for an input size.
+    @param fitted dict:
+        Memory or time of a rule, see fit()
+    @param gb <float>:
+        Input gigabytes of the sample, or cohort, default the largest seen
+    @return value <float>:
+        Memory in gigabytes, or time in minutes
+    """
+    if gb is None:
+        gb = fitted["max_gb"]
+    base = fitted["intercept"] + fitted["slope"] * gb
+    return base * fitted["headroom"] * margin
+
+
+def tune(cluster, model, sizes=None, margin=MARGIN):
+    """Sets the memory and time of the modeled rules of a cluster config.
+    @param cluster dict[<str>, dict]:
+        Cluster config, i.e. config/cluster.biowulf.json
+    @param model dict[<str>, dict]:
+        Model of past runs, see fit()
+    @param sizes dict[<str>, <int>]:
+        Input bytes of each sample of the new run, see sample_bytes(),
+        default the largest sizes of the past runs
+    @return cluster OrderedDict[<str>, dict]:
+        Tuned cluster config
+    """
+    default = cluster.get("__default__", {})
+    names = set(e.get("group") for e in cluster.values() if e.get("group"))
+    sizes = sizes or {}
+    tuned = OrderedDict((rule, OrderedDict(entry)) for rule, entry in cluster.items())
+    members = {}
+    for rule, fitted in sorted(model.items()):
+        if rule in ("__default__", "GROUP"):
+            # GROUP is the job name of group jobs of older models
+            continue
+        entry = tuned.setdefault(rule, OrderedDict())
+        gb = None
+        if sizes:
+            nbytes = (
+                max(sizes.values())
+                if fitted["per"] == "sample"
+                else sum(sizes.values())
+            )
+            gb = nbytes / 1024.0**3
+        if "mem" in fitted:
+            mem = max(int(math.ceil(predict(fitted["mem"], gb, margin))), MIN_MEM_GB)
+            current = parse_mem(entry.get("mem", default.get("mem", "0")))
+            if fitted["out_of_memory"] and current:
+                mem = max(mem, int(math.ceil(current)))
+            if entry.get("group"):
+                # sbatch requests the memory of the group, see below
+                members[rule] = mem
+            else:
+                entry["mem"] = "{}G".format(mem)
+        minutes = predict(fitted["time"], gb, margin)
+        if entry.get("group"):
+            # Packs the jobs of the group, see cluster_groups.py
+            entry["runtime"] = format_time(max(minutes, 1))
+        elif rule not in names:
+            minutes = max(TIME_STEP * math.ceil(minutes / TIME_STEP), TIME_STEP)
+            current = parse_time(entry.get("time", default.get("time", "0")))
+            if fitted["timeout"]:
+                minutes = max(minutes, current)
+            entry["time"] = format_time(minutes)
+    for group, info in sorted(groups(tuned).items()):
+        # Snakemake runs the jobs of a submission in parallel, and the tuned
+        # runtimes change their number, see cluster_groups.check()
+        mems = [
+            members.get(r) or parse_mem(tuned[r].get("mem", default.get("mem", "0")))
+            for r in info["rules"]
+        ]
+        mem = max(m or 0.0 for m in mems) * info["components"]
+        entry = tuned[group]
+        current = parse_mem(entry.get("mem", default.get("mem", "0"))) or 0
+        if mem > current:
+            entry["mem"] = "{}G".format(int(math.ceil(mem)))
+        if info["threads"] > int(entry.get("threads", default.get("threads", 1))):
+            entry["threads"] = str(info["threads"])
+    return tuned
+
+
+def tune_file(model, cluster, workdir=None, output=None):
+    """Tunes a cluster config file in place, or to output.
+    @param model <str>:
+        Model of past runs, see fit()
+    @param cluster <str>:
+        Cluster config file
+    @param workdir <str>:
+        Output directory of the new run, for the sizes of its inputs
+    """
+    with io.open(model, "r") as fh:
+        fitted = json.load(fh)
+    with io.open(cluster, "r") as fh:
+        config = json.load(fh, object_pairs_hook=OrderedDict)
+    sizes = sample_bytes(workdir) if workdir else None
+    tuned = tune(config, fitted, sizes)
+    with open(output or cluster, "w") as fh:
+        json.dump(tuned, fh, indent=4)
+        fh.write("\n")
+    return tuned
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Learns the memory and time of each rule from past runs"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparser_fit = subparsers.add_parser(
+        "fit", help="Fits a model of the cluster stats of past runs"
+    )
+    subparser_fit.add_argument(
+        "-s", "--stats", nargs="+", required=True,
+        help="Output of xavier stats, or resources/gather_cluster_stats, of each run",
+    )  # fmt: skip
+    subparser_fit.add_argument(
+        "-l", "--logs", nargs="+", default=[],
+        help="Snakemake log of each run, default logfiles/snakemake.log of its WorkDir",
+    )  # fmt: skip
+    subparser_fit.add_argument("-m", "--min-jobs", type=int, default=MIN_JOBS)
+    subparser_fit.add_argument("-o", "--output", required=True)
+    subparser_tune = subparsers.add_parser(
+        "tune", help="Tunes a cluster config with a model"
+    )
+    subparser_tune.add_argument("-m", "--model", required=True)
+    subparser_tune.add_argument("-c", "--cluster", required=True)
+    subparser_tune.add_argument(
+        "-w", "--workdir", help="Output directory of the new run"
+    )
+    subparser_tune.add_argument("-o", "--output", required=True)
+    args = parser.parse_args()
+    if args.command not in ("fit", "tune"):
+        parser.error("unknown command")
+
+    if args.command == "tune":
+        tune_file(args.model, args.cluster, args.workdir, args.output)
+        return
+    if args.logs and len(args.logs) != len(args.stats):
+        parser.error("--logs needs one snakemake log per --stats file")
+    records = []
+    for i, stats in enumerate(args.stats):
+        records += history(stats, args.logs[i] if args.logs else None)
+    model = fit(records, args.min_jobs)
+    with open(args.output, "w") as fh:
+        json.dump(model, fh, indent=4, sort_keys=True)
+        fh.write("\n")
+    print(
+        "Modeled {} rules from {} jobs".format(len(model), len(records)),
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,479 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""Node-local copies of large read-only references, i.e. the VEP cache, the
+kraken2 database, and the bowtie2 indices of fastq_screen, shared by the jobs
+that run on the same node. A reference is copied once per node into a staging
+directory on local disk: the first job takes a lock and copies it, concurrent
+jobs wait on the lock and re-use the copy. Each file is hashed while it is
+read from shared storage and the copy is validated against the checksums
+before it is published with an atomic rename. The first job to re-use an
+entry after the node restarts validates it against its checksums again.
+Entries are keyed by the path, size, and mtime of each source file, so an
+updated reference is staged again, and evicted least recently used first once
+the staging directory grows over its size cap. Jobs register the entries they
+use in <root>/.users/<job> while holding a lock on it, and entries in use by a
+running job are never evicted.
+  <root>/<name>-<key>/<name>
+  <root>/<name>-<key>/SHA256SUMS
+USAGE:
+  $ exec 9> /tmp/xavier_refs/.users/job1
+  $ db=$(python stage_reference.py --root /tmp/xavier_refs --user-fd 9 \
+      path /data/kraken/20180907_standard_kraken2)
+"""
+
+from __future__ import print_function, division
+import argparse
+import errno
+import fnmatch
+import hashlib
+import io
+import os
+import shutil
+import sys
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# Default size cap of the staging directory
+DEFAULT_MAX_SIZE = "100G"
+
+# Checksums of the staged files
+CHECKSUMS = "SHA256SUMS"
+
+# Boot of the node the checksums of an entry were last validated on
+VALIDATED = ".validated"
+
+# Unlocked registrations older than this are removed
+STALE_USER_SECONDS = 24 * 60 * 60
+
+
+def parse_size(size):
+    """Converts a human readable size to bytes, i.e. 500M or 1G.
+    @param size <str>:
+        Number of bytes with an optional K, M, G, or T suffix
+    @return size <int>:
+        Number of bytes
+    """
+    size = str(size).strip().upper().rstrip("B")
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def makedirs(path):
+    """Creates a directory and its parents, if they do not exist."""
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def source_files(source, include=None):
+    """Returns the files of a reference to stage.
+    @param source <str>:
+        Path to a reference file or directory
+    @param include list[<str>]:
+        Glob patterns of the sub-directories or files of a directory to stage,
+        relative to it, i.e. homo_sapiens/*_GRCh38; defaults to all of it
+    @return files list[(<str>, <int>, <int>)]:
+        Sorted relative path, size, and mtime of each file
+    """
+    if os.path.isfile(source):
+        st = os.stat(source)
+        return [("", st.st_size, int(st.st_mtime))]
+    files = []
+    for parent, dirs, names in os.walk(source, followlinks=True):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(parent, name)
+            relpath = os.path.relpath(path, source)
+            if include and not any(
+                fnmatch.fnmatch(relpath, pattern)
+                or fnmatch.fnmatch(relpath, os.path.join(pattern, "*"))
+                for pattern in include
+            ):
+                continue
+            st = os.stat(path)
+            files.append((relpath, st.st_size, int(st.st_mtime)))
+    if not files:
+        raise ValueError("Nothing to stage in {}".format(source))
+    return files
+
+
+def entry_name(source, files, include=None):
+    """Returns the name of the staging directory entry of a reference, i.e.
+    <name>-<key>, keyed by its path, included patterns, and files."""
+    hasher = hashlib.sha256()
+    hasher.update(os.path.abspath(source).encode("utf-8"))
+    for pattern in include or []:
+        hasher.update(b"\0include\0" + pattern.encode("utf-8"))
+    for relpath, size, mtime in files:
+        hasher.update("\0{}\0{}\0{}".format(relpath, size, mtime).encode("utf-8"))
+    name = os.path.basename(os.path.normpath(source))
+    return "{}-{}".format(name, hasher.hexdigest()[:16])
+
+
+def copy_file(source, dest, blocksize=1 << 22):
+    """Copies a file, returns the sha256 hex digest of the data read."""
+    hasher = hashlib.sha256()
+    with open(source, "rb") as src, open(dest, "wb") as dst:
+        for block in iter(lambda: src.read(blocksize), b""):
+            hasher.update(block)
+            dst.write(block)
+    shutil.copystat(source, dest)
+    return hasher.hexdigest()
+
+
+def sha256sum(path, blocksize=1 << 22):
+    """Returns the sha256 hex digest of a file."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(blocksize), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def boot_id():
+    """Returns the ID of the current boot of the node, or an empty string if
+    it is not known, i.e. on other platforms than Linux."""
+    try:
+        with io.open("/proc/sys/kernel/random/boot_id", "r") as fh:
+            return fh.read().strip()
+    except (IOError, OSError):
+        return ""
+
+
+def tree_size(path):
+    """Returns the size in bytes of the files in a directory."""
+    total = 0
+    for parent, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.lstat(os.path.join(parent, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+class lock(object):
+    """Context manager that holds an exclusive lock on a file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.fh = open(self.path, "a")
+        if fcntl is not None:
+            fcntl.flock(self.fh, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.fh, fcntl.LOCK_UN)
+        self.fh.close()
+
+
+class Stage(object):
+    """Node-local staging directory of references, see module comment.
+    @param root <str>:
+        Path to the staging directory on local disk, created on first use
+    @param max_size <int>:
+        Size cap in bytes, least recently used entries are evicted above it
+    @param user_fd <int>:
+        File descriptor of the registration of the job, opened by its shell
+        so the lock is held until the job exits; entries staged or re-used
+        without one may be evicted while they are in use
+    """
+
+    def __init__(self, root, max_size=parse_size(DEFAULT_MAX_SIZE), user_fd=None):
+        self.root = os.path.abspath(root)
+        self.max_size = max_size
+        self.user_fd = user_fd
+        self.users = os.path.join(self.root, ".users")
+        makedirs(self.users)
+        if user_fd is not None and fcntl is not None:
+            fcntl.flock(user_fd, fcntl.LOCK_SH)
+
+    def register(self, name):
+        """Registers an entry as in use by the job."""
+        if self.user_fd is not None:
+            os.write(self.user_fd, (name + "\n").encode("utf-8"))
+
+    def in_use(self):
+        """Returns the names of the entries registered by running jobs, and
+        removes old registrations of jobs that exited."""
+        names = set()
+        for user in os.listdir(self.users):
+            path = os.path.join(self.users, user)
+            try:
+                fh = open(path, "r")
+            except IOError:
+                continue
+            with fh:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except (IOError, OSError):
+                        # Held by a running job
+                        names.update(line.strip() for line in fh)
+                        continue
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+                try:
+                    if time.time() - os.stat(path).st_mtime > STALE_USER_SECONDS:
+                        os.remove(path)
+                except OSError:
+                    pass
+        return names
+
+    def entries(self):
+        """Returns (mtime, size, name) of each entry in the staging directory."""
+        entries = []
+        for name in os.listdir(self.root):
+            entry = os.path.join(self.root, name)
+            if name.startswith(".") or not os.path.isdir(entry):
+                continue
+            try:
+                entries.append((os.stat(entry).st_mtime, tree_size(entry), name))
+            except OSError:
+                continue
+        return entries
+
+    def clean(self, keep=None):
+        """Removes the partial copies of jobs that were killed while they
+        staged a reference, i.e. whose entry lock is no longer held."""
+        for tmp in os.listdir(self.root):
+            if not (tmp.startswith(".") and tmp.endswith(".tmp")):
+                continue
+            name = tmp[1:].rsplit(".", 2)[0]
+            if name == keep or fcntl is None:
+                continue
+            with open(os.path.join(self.root, ".{}.lock".format(name)), "a") as fh:
+                try:
+                    fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except (IOError, OSError):
+                    # Being copied
+                    continue
+                shutil.rmtree(os.path.join(self.root, tmp), ignore_errors=True)
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def evict(self, need=0, keep=None):
+        """Removes least recently used entries that are not in use until the
+        staging directory has room for need more bytes, both under its size
+        cap and on disk. Eviction is serialized with a lock file.
+        @param need <int>:
+            Size in bytes of the reference about to be staged
+        @param keep <str>:
+            Name of an entry that is never evicted
+        @return evicted list[<str>]:
+            Names of the evicted entries
+        """
+        evicted = []
+        with lock(os.path.join(self.root, ".lock")):
+            self.clean(keep=keep)
+            in_use = self.in_use()
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            st = os.statvfs(self.root)
+            free = st.f_bavail * st.f_frsize
+            for _, size, name in entries:
+                if total + need <= self.max_size and need <= free:
+                    break
+                if name == keep or name in in_use:
+                    continue
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                total -= size
+                free += size
+                evicted.append(name)
+            if total + need > self.max_size or need > free:
+                raise IOError(
+                    errno.ENOSPC,
+                    "No room for {} bytes in {}, {} bytes staged and {} bytes "
+                    "free".format(need, self.root, total, free),
+                )
+        return evicted
+
+    def valid(self, entry, files):
+        """Checks an entry has every file of the reference with its size, and
+        the checksums of its files if they were not validated since the node
+        booted, i.e. the first time it is re-used after a restart."""
+        checksums = os.path.join(entry, CHECKSUMS)
+        if not os.path.isfile(checksums):
+            return False
+        name = os.path.basename(entry).rsplit("-", 1)[0]
+        for relpath, size, _ in files:
+            path = (
+                os.path.join(entry, name, relpath)
+                if relpath
+                else os.path.join(entry, name)
+            )
+            try:
+                if os.path.getsize(path) != size:
+                    return False
+            except OSError:
+                return False
+        try:
+            with io.open(os.path.join(entry, VALIDATED), "r") as fh:
+                if fh.read().strip() == boot_id():
+                    return True
+        except (IOError, OSError):
+            pass
+        expected = set(os.path.join(name, relpath) for relpath, _, _ in files)
+        with io.open(checksums, "r") as fh:
+            for line in fh:
+                checksum, _, path = line.rstrip("\n").partition("  ")
+                expected.discard(path)
+                try:
+                    if sha256sum(os.path.join(entry, path)) != checksum:
+                        return False
+                except (IOError, OSError):
+                    return False
+        if expected:
+            # Files without a checksum
+            return False
+        self.validated(entry)
+        return True
+
+    def validated(self, entry):
+        """Records that the checksums of an entry were validated since the
+        node booted."""
+        with io.open(os.path.join(entry, VALIDATED), "wb") as fh:
+            fh.write(boot_id().encode("utf-8"))
+
+    def copy(self, source, files, entry):
+        """Copies a reference into a temporary directory, validates the copy
+        against the checksums of the source, and publishes it as entry."""
+        name = os.path.basename(entry).rsplit("-", 1)[0]
+        tmp = os.path.join(
+            self.root, ".{}.{}.tmp".format(os.path.basename(entry), os.getpid())
+        )
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.mkdir(tmp)
+        try:
+            checksums = []
+            for relpath, _, _ in files:
+                src = os.path.join(source, relpath) if relpath else source
+                dest = (
+                    os.path.join(tmp, name, relpath)
+                    if relpath
+                    else os.path.join(tmp, name)
+                )
+                makedirs(os.path.dirname(dest))
+                checksums.append((copy_file(src, dest), relpath, dest))
+            for checksum, relpath, dest in checksums:
+                if sha256sum(dest) != checksum:
+                    raise IOError(
+                        errno.EIO,
+                        "Checksum of the copy of {} does not match".format(
+                            os.path.join(source, relpath)
+                        ),
+                    )
+            with io.open(os.path.join(tmp, CHECKSUMS), "wb") as fh:
+                for checksum, relpath, _ in checksums:
+                    line = "{}  {}\n".format(checksum, os.path.join(name, relpath))
+                    # Already bytes on Python 2
+                    fh.write(line if isinstance(line, bytes) else line.encode("utf-8"))
+            self.validated(tmp)
+            shutil.rmtree(entry, ignore_errors=True)
+            os.rename(tmp, entry)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def stage(self, source, include=None):
+        """Returns the node-local copy of a reference, copying it first if it
+        is not staged yet. Concurrent calls for the same reference wait for
+        the one that copies it.
+        @param source <str>:
+            Path to a reference file or directory on shared storage
+        @param include list[<str>]:
+            Glob patterns of the parts of a directory to stage, see source_files()
+        @return path <str>:
+            Path to the staged copy of the reference
+        """
+        source = os.path.abspath(source)
+        files = source_files(source, include)
+        name = entry_name(source, files, include)
+        entry = os.path.join(self.root, name)
+        path = os.path.join(entry, os.path.basename(os.path.normpath(source)))
+        # Registered before it is looked up so
+        # it is not evicted once it is found
+        self.register(name)
+        with lock(os.path.join(self.root, ".{}.lock".format(name))):
+            if self.valid(entry, files):
+                # Most recently used
+                os.utime(entry, None)
+                print(
+                    "Re-using staged copy of {} in {}".format(source, entry),
+                    file=sys.stderr,
+                )
+                return path
+            start = time.time()
+            self.evict(need=sum(size for _, size, _ in files), keep=name)
+            self.copy(source, files, entry)
+            print(
+                "Staged {} in {} in {:.1f}s".format(source, entry, time.time() - start),
+                file=sys.stderr,
+            )
+        return path
+
+
+def fastq_screen(stage, config, output):
+    """Writes a fastq_screen config whose databases are staged copies of the
+    directories of the bowtie2 indices of the given config.
+    @param stage <Stage>:
+        Node-local staging directory
+    @param config <str>:
+        Path to the fastq_screen config
+    @param output <str>:
+        Path to the fastq_screen config to write
+    """
+    lines = []
+    with io.open(config, "r") as fh:
+        for line in fh:
+            fields = line.split()
+            if len(fields) >= 3 and fields[0] == "DATABASE":
+                index = fields[2]
+                staged = stage.stage(os.path.dirname(index))
+                fields[2] = os.path.join(staged, os.path.basename(index))
+                line = "\t".join(fields) + "\n"
+            lines.append(line)
+    with io.open(output, "w") as fh:
+        fh.writelines(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Node-local copies of references shared by the jobs of a node"
+    )
+    parser.add_argument("--root", required=True)
+    parser.add_argument("--max-size", default=DEFAULT_MAX_SIZE)
+    parser.add_argument("--user-fd", type=int, default=None)
+    subparsers = parser.add_subparsers(dest="command")
+    subparser_path = subparsers.add_parser(
+        "path", help="Prints the path to the staged copy of a reference"
+    )
+    subparser_path.add_argument("--include", nargs="+", default=[])
+    subparser_path.add_argument("source")
+    subparser_fqs = subparsers.add_parser(
+        "fastq-screen", help="Writes a fastq_screen config of staged databases"
+    )
+    subparser_fqs.add_argument("-c", "--config", required=True)
+    subparser_fqs.add_argument("-o", "--output", required=True)
+    args = parser.parse_args()
+    if args.command not in ("path", "fastq-screen"):
+        parser.error("unknown command")
+
+    stage = Stage(args.root, parse_size(args.max_size), args.user_fd)
+    if args.command == "path":
+        print(stage.stage(args.source, args.include))
+    else:
+        fastq_screen(stage, args.config, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""Annotates the somatic variants of a cohort with VEP once. The sites
+sub-command writes the unique sites, i.e. CHROM, POS, REF, and ALT, of the
+coordinate-sorted VCF files of every sample and caller to one VCF file, which
+vcf2maf annotates in a single VEP run. The join sub-command copies the CSQ
+annotation of the annotated sites back into the VCF file of a sample, which
+vcf2maf converts to a MAF file without running VEP again.
+USAGE:
+  $ python vep_batch.py sites -r genome.fa -o sites.vcf sample1.vcf sample2.vcf.gz
+  $ python vep_batch.py join -r genome.fa -a sites.vep.vcf -i sample1.vcf \
+      -o sample1.vep.vcf
+"""
+
+from __future__ import print_function, unicode_literals
+import argparse
+import gzip
+import heapq
+import io
+import itertools
+import sys
+
+
+def open_text(path):
+    """Opens a plain or gzipped VCF file."""
+    with io.open(path, "rb") as fh:
+        gzipped = fh.read(2) == b"\x1f\x8b"
+    if gzipped:
+        return io.TextIOWrapper(gzip.open(path, "rb"))
+    return io.open(path, "r")
+
+
+def read_contigs(reference):
+    """Contigs of the reference genome, from its FASTA index."""
+    with io.open(reference + ".fai", "r") as fh:
+        return [line.split("\t", 1)[0] for line in fh if line.strip()]
+
+
+def records(path, order):
+    """Reads the records of a coordinate-sorted VCF file.
+    @param path <str>:
+        Path to the VCF file, plain or gzipped
+    @param order dict[<str>, <int>]:
+        Index of each contig in the reference
+    @yields ((contig index, pos), fields list[<str>]):
+        Sort key and the tab-separated fields of each record
+    """
+    previous = (-1, 0)
+    with open_text(path) as fh:
+        for line in fh:
+            if line.startswith("#") or not line.strip():
+                continue
+            fields = line.rstrip("\r\n").split("\t")
+            if fields[0] not in order:
+                raise ValueError(
+                    "Contig {} of {} is not in the reference".format(fields[0], path)
+                )
+            key = (order[fields[0]], int(fields[1]))
+            if key < previous:
+                raise ValueError(
+                    "{} is not sorted at {}:{}".format(path, fields[0], fields[1])
+                )
+            previous = key
+            yield key, fields
+
+
+def sites(vcfs, contigs, output):
+    """Writes the unique sites of VCF files, with a genotype column so
+    vcf2maf accepts it.
+    @param vcfs list[<str>]:
+        Paths to the coordinate-sorted VCF files
+    @param contigs list[<str>]:
+        Contigs of the reference, see read_contigs()
+    @param output <file>:
+        File handle the sites are written to
+    @return nsites <int>:
+        Number of unique sites
+    """
+    order = dict((contig, i) for i, contig in enumerate(contigs))
+    output.write(
+        "##fileformat=VCFv4.2\n"
+        '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n'
+    )
+    for contig in contigs:
+        output.write("##contig=<ID={}>\n".format(contig))
+    output.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tTUMOR\n")
+    nsites = 0
+    stream = heapq.merge(*[records(vcf, order) for vcf in vcfs])
+    for _, group in itertools.groupby(stream, key=lambda item: item[0]):
+        # Records of a position are not sorted by alleles
+        alleles = {}
+        for _, fields in group:
+            alleles.setdefault((fields[3], fields[4]), fields[:2])
+        for (ref, alt), (contig, pos) in sorted(alleles.items()):
+            output.write(
+                "{}\t{}\t.\t{}\t{}\t.\t.\t.\tGT\t0/1\n".format(contig, pos, ref, alt)
+            )
+            nsites += 1
+    return nsites
+
+
+def join(vcf, annotated, contigs, output):
+    """Copies the CSQ annotation of the sites annotated by VEP into the
+    records of a VCF file with the same CHROM, POS, REF, and ALT.
+    @param vcf <str>:
+        Path to the coordinate-sorted VCF file of a sample
+    @param annotated <str>:
+        Path to the sites annotated by VEP, see sites()
+    @param contigs list[<str>]:
+        Contigs of the reference, see read_contigs()
+    @param output <file>:
+        File handle the annotated VCF is written to
+    @return missing <int>:
+        Number of records without annotated sites
+    """
+    order = dict((contig, i) for i, contig in enumerate(contigs))
+    header = None
+    with open_text(annotated) as fh:
+        for line in fh:
+            if line.startswith("##INFO=<ID=CSQ,"):
+                header = line
+            elif not line.startswith("##"):
+                break
+    if header is None:
+        raise ValueError("{} is not annotated by VEP".format(annotated))
+
+    with open_text(vcf) as fh:
+        for line in fh:
+            if line.startswith("#CHROM"):
+                output.write(header)
+                output.write(line)
+                break
+            if not line.startswith("##INFO=<ID=CSQ,"):
+                output.write(line)
+
+    annotations = records(annotated, order)
+    site = next(annotations, None)
+    csq = {}
+    current = None
+    missing = 0
+    for key, fields in records(vcf, order):
+        if key != current:
+            # Annotated sites at the position of the record
+            current, csq = key, {}
+            while site is not None and site[0] <= key:
+                if site[0] == key:
+                    for field in site[1][7].split(";"):
+                        if field.startswith("CSQ="):
+                            csq[(site[1][3], site[1][4])] = field
+                site = next(annotations, None)
+        annotation = csq.get((fields[3], fields[4]))
+        if annotation is None:
+            missing += 1
+        else:
+            info = [
+                field
+                for field in fields[7].split(";")
+                if field != "." and not field.startswith("CSQ=")
+            ]
+            fields[7] = ";".join(info + [annotation])
+        output.write("\t".join(fields) + "\n")
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Annotates the somatic variants of a cohort with VEP once"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparser_sites = subparsers.add_parser(
+        "sites", help="Unique sites of coordinate-sorted VCF files"
+    )
+    subparser_sites.add_argument("-r", "--reference", required=True)
+    subparser_sites.add_argument("-o", "--output", required=True)
+    subparser_sites.add_argument("vcfs", nargs="+")
+    subparser_join = subparsers.add_parser(
+        "join", help="Copies the CSQ of the annotated sites into a VCF file"
+    )
+    subparser_join.add_argument("-r", "--reference", required=True)
+    subparser_join.add_argument("-a", "--annotated", required=True)
+    subparser_join.add_argument("-i", "--input", required=True)
+    subparser_join.add_argument("-o", "--output", required=True)
+    args = parser.parse_args()
+    if args.command not in ("sites", "join"):
+        parser.error("unknown command")
+
+    contigs = read_contigs(args.reference)
+    with io.open(args.output, "w") as output:
+        if args.command == "sites":
+            nsites = sites(args.vcfs, contigs, output)
+            print(
+                "{} unique sites in {} VCF files".format(nsites, len(args.vcfs)),
+                file=sys.stderr,
+            )
+        else:
+            missing = join(args.input, args.annotated, contigs, output)
+            if missing:
+                print(
+                    "WARNING: {} records of {} are not in {}".format(
+                        missing, args.input, args.annotated
+                    ),
+                    file=sys.stderr,
+                )
+
+
+if __name__ == "__main__":
+    main()